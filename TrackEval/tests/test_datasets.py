@@ -0,0 +1,95 @@
+import zipfile
+
+import numpy as np
+import pytest
+
+import trackeval
+
+_BaseDataset = trackeval.datasets._base_dataset._BaseDataset
+
+
+def _random_boxes(rng, num_boxes, box_format):
+    xy = rng.uniform(0, 100, size=(num_boxes, 2))
+    wh = rng.uniform(0, 50, size=(num_boxes, 2))
+    # Some zero area boxes and exact duplicates, which take the special cases of the IOU computation
+    wh[rng.random(num_boxes) < 0.1] = 0
+    boxes = np.concatenate([xy, wh if box_format == 'xywh' else xy + wh], axis=1)
+    if num_boxes > 1:
+        boxes[-1] = boxes[0]
+    return boxes
+
+
+@pytest.mark.parametrize('box_format', ['xywh', 'x0y0x1y1'])
+def test_box_ious_batched(box_format):
+    rng = np.random.default_rng(0)
+    # Timesteps with boxes on both sides, only gt boxes, only tracker boxes and no boxes at all
+    counts = [(3, 4), (5, 0), (0, 2), (0, 0), (1, 1), (6, 6), (0, 0), (2, 7)]
+    gt_dets = [_random_boxes(rng, num_gt, box_format) for num_gt, _ in counts]
+    tracker_dets = [_random_boxes(rng, num_tracker, box_format) for _, num_tracker in counts]
+    # The tracker boxes of a timestep overlapping the gt boxes of the same timestep
+    tracker_dets[5][:3] = gt_dets[5][:3]
+
+    ious = _BaseDataset._calculate_box_ious_batched(gt_dets, tracker_dets, box_format=box_format)
+    assert len(ious) == len(counts)
+    for t, (gt_dets_t, tracker_dets_t) in enumerate(zip(gt_dets, tracker_dets)):
+        expected = _BaseDataset._calculate_box_ious(gt_dets_t, tracker_dets_t, box_format=box_format)
+        assert ious[t].shape == expected.shape
+        assert np.array_equal(ious[t], expected)
+
+
+def test_box_ious_batched_empty_sequence():
+    assert _BaseDataset._calculate_box_ious_batched([], []) == []
+
+
+NUMERIC_FILES = {
+    'mot': '1,1,10.5,20,30,40,1,-1,-1,-1\n1,2,50,60,70,80,1,-1,-1,-1\n2,1,11,21,30,40,1,-1,-1,-1\n',
+    'unordered_timesteps': '3,1,1,1,1,1\n1,2,2,2,2,2\n3,3,3,3,3,3\n2.0,4,4,4,4,4\n1,5,-5e2,5,5,5\n',
+    'single_row': '7,1,0.25,0.5,1,2',
+    'spaces_after_commas': '1, 1, 10, 20, 30, 40\n2, 1, 11, 21, 30, 40\n',
+    'empty': '',
+}
+FALLBACK_FILES = {
+    'blank_line': '1,1,10,20,30,40\n\n2,1,11,21,30,40\n',
+    'trailing_blank_line': '1,1,10,20,30,40\n2,1,11,21,30,40\n\n',
+    'space_delimited': '1 1 10 20 30 40\n2 1 11 21 30 40\n',
+    'trailing_commas': '1,1,10,20,30,40,\n2,1,11,21,30,40,\n',
+    'ragged_rows': '1,1,10,20,30,40\n2,1,11,21,30\n',
+    'class_names': '1,1,10,20,30,40,car\n2,1,11,21,30,40,car\n',
+}
+
+
+def _assert_same_read_data(fast_data, simple_data):
+    assert list(fast_data.keys()) == list(simple_data.keys())
+    for timestep, rows in simple_data.items():
+        expected = np.asarray(rows, dtype=float)
+        assert fast_data[timestep].dtype == expected.dtype
+        assert np.array_equal(fast_data[timestep], expected)
+
+
+@pytest.mark.parametrize('name', sorted(NUMERIC_FILES))
+def test_load_numeric_text_file(tmp_path, name):
+    file = tmp_path / 'gt.txt'
+    file.write_text(NUMERIC_FILES[name])
+    fast_data = _BaseDataset._load_numeric_text_file(str(file))
+    simple_data, _ = _BaseDataset._load_simple_text_file(str(file))
+    _assert_same_read_data(fast_data, simple_data)
+
+
+def test_load_numeric_text_file_zipped(tmp_path):
+    zip_file = tmp_path / 'data.zip'
+    with zipfile.ZipFile(zip_file, 'w') as archive:
+        archive.writestr('seq.txt', NUMERIC_FILES['unordered_timesteps'])
+    fast_data = _BaseDataset._load_numeric_text_file('seq.txt', is_zipped=True, zip_file=str(zip_file))
+    simple_data, _ = _BaseDataset._load_simple_text_file('seq.txt', is_zipped=True, zip_file=str(zip_file))
+    _assert_same_read_data(fast_data, simple_data)
+    # Files the fast path can not open are left to _load_simple_text_file, which reports the error
+    assert _BaseDataset._load_numeric_text_file('seq.txt', is_zipped=True, zip_file=None) is None
+    assert _BaseDataset._load_numeric_text_file('other.txt', is_zipped=True, zip_file=str(zip_file)) is None
+    assert _BaseDataset._load_numeric_text_file(str(tmp_path / 'missing.txt')) is None
+
+
+@pytest.mark.parametrize('name', sorted(FALLBACK_FILES))
+def test_load_numeric_text_file_fallback(tmp_path, name):
+    file = tmp_path / 'gt.txt'
+    file.write_text(FALLBACK_FILES[name])
+    assert _BaseDataset._load_numeric_text_file(str(file)) is None
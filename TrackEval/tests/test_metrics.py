@@ -40,6 +40,15 @@ def no_confusion():
                     'STDA': 2 / 5 + 2 / 4,
                     'ATA': (2 / 5 + 2 / 4) / 2,
             },
+            'hota': {
+                    'HOTA_TP': 4,
+                    'HOTA_FN': 4,
+                    'HOTA_FP': 5,
+                    'DetA': 4 / 13,
+                    'AssA': (2 * 2 / 5 + 2 * 2 / 8) / 4,
+                    'HOTA': np.sqrt(4 / 13 * (2 * 2 / 5 + 2 * 2 / 8) / 4),
+                    'LocA': 1,
+            },
     }
 
     data = _from_dense(
@@ -176,6 +185,9 @@ def _from_dense(num_timesteps, num_gt_ids, num_tracker_ids, gt_present, tracker_
             'gt_ids': gt_subset,
             'tracker_ids': tracker_subset,
             'similarity_scores': similarity_subset,
+            'seq': 'seq',
+            'unique_gt_ids': np.arange(num_gt_ids),
+            'unique_tracker_ids': np.arange(num_tracker_ids),
     }
     return data
 
@@ -184,6 +196,7 @@ METRICS_BY_NAME = {
         'clear': trackeval.metrics.CLEAR(),
         'identity': trackeval.metrics.Identity(),
         'vace': trackeval.metrics.VACE(),
+        'hota': trackeval.metrics.HOTA(),
 }
 
 SEQUENCE_BY_NAME = {
@@ -197,6 +210,7 @@ SEQUENCE_BY_NAME = {
         ('no_confusion', 'clear'),
         ('no_confusion', 'identity'),
         ('no_confusion', 'vace'),
+        ('no_confusion', 'hota'),
         ('with_confusion', 'clear'),
         ('with_confusion', 'identity'),
         ('with_confusion', 'vace'),
@@ -210,3 +224,53 @@ def test_metric(sequence_name, metric_name):
     result = metric.eval_sequence(data)
     for key, value in expected[metric_name].items():
         assert result[key] == pytest.approx(value), key
+
+
+def test_hota_alpha_thresholds():
+    # One gt and one tracker id matched in 3 timesteps with different similarities.
+    similarity = np.zeros([3, 1, 1])
+    similarity[:, 0, 0] = [0.32, 0.76, 0.]
+    data = _from_dense(
+            num_timesteps=3,
+            num_gt_ids=1,
+            num_tracker_ids=1,
+            gt_present=np.ones([3, 1]),
+            tracker_present=np.ones([3, 1]),
+            similarity=similarity,
+    )
+    result = trackeval.metrics.HOTA().eval_sequence(data)
+    # Both matches count up to alpha 0.3, only the second one up to alpha 0.75.
+    num_matches = np.array([2] * 6 + [1] * 9 + [0] * 4)
+    assert result['HOTA_TP'] == pytest.approx(num_matches)
+    assert result['HOTA_FN'] == pytest.approx(3 - num_matches)
+    assert result['HOTA_FP'] == pytest.approx(3 - num_matches)
+    assert result['LocA'][:6] == pytest.approx((0.32 + 0.76) / 2)
+    assert result['LocA'][6:15] == pytest.approx(0.76)
+    assert result['AssA'] == pytest.approx(num_matches / np.maximum(1, 6 - num_matches))
+
+
+@pytest.mark.parametrize('boxformat', ['xywh', 'x0y0x1y1'])
+def test_track_map_track_ious(boxformat):
+    def box(x, y, w, h):
+        return np.array([x, y, w, h] if boxformat == 'xywh' else [x, y, x + w, y + h], dtype=float)
+
+    dt_tracks = [{1: box(0, 0, 2, 2), 2: box(0, 0, 2, 2)}, {3: box(0, 0, 1, 1)}]
+    gt_tracks = [{1: box(1, 1, 2, 2), 3: box(0, 0, 1, 1)}, {}]
+    ious = trackeval.metrics.TrackMAP._compute_track_ious(dt_tracks, gt_tracks, boxformat=boxformat)
+    # Frame 1 overlaps by 1 in a union of 7, frame 2 only has the detected box (4) and frame 3 the gt box (1).
+    assert ious == pytest.approx(np.array([[1 / 12, 0], [1 / 5, 0]]))
+
+
+def test_track_map_mask_track_ious():
+    mask_utils = pytest.importorskip('pycocotools.mask')
+
+    def mask(x, y, w, h):
+        segmentation = np.zeros((4, 4), dtype=np.uint8, order='F')
+        segmentation[y:y + h, x:x + w] = 1
+        return mask_utils.encode(segmentation)
+
+    # The same tracks as the boxes of test_track_map_track_ious, with a missing mask in frame 4
+    dt_tracks = [{1: mask(0, 0, 2, 2), 2: mask(0, 0, 2, 2), 4: None}, {3: mask(0, 0, 1, 1)}]
+    gt_tracks = [{1: mask(1, 1, 2, 2), 3: mask(0, 0, 1, 1)}, {}]
+    ious = trackeval.metrics.TrackMAP._compute_track_ious(dt_tracks, gt_tracks, iou_function='mask')
+    assert ious == pytest.approx(np.array([[1 / 12, 0], [1 / 5, 0]]))
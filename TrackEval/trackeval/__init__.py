@@ -3,3 +3,4 @@ from . import datasets
 from . import metrics
 from . import plotting
 from . import utils
+from . import profiling
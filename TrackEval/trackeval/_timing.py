@@ -1,3 +1,4 @@
+from contextlib import nullcontext
 from functools import wraps
 from time import perf_counter
 import inspect
@@ -6,60 +7,81 @@ DO_TIMING = False
 DISPLAY_LESS_PROGRESS = False
 timer_dict = {}
 counter = 0
+# Active profiling.Profiler, also collecting the timings of the decorated functions and of the sections (see
+# profiling.activate). Independent of DO_TIMING, which prints the timings of serial runs.
+profiler = None
+
+_NO_SECTION = nullcontext()
+
+
+def section(name):
+    """Context manager timing a stage of the evaluation in the active profiler, doing nothing without one"""
+    if profiler is None:
+        return _NO_SECTION
+    return profiler.measure(name)
 
 
 def time(f):
+    # The argument names are only looked up once, not on every call
+    arg_names = inspect.getfullargspec(f)[0]
+    is_method = len(arg_names) > 0 and arg_names[0] == 'self'
+
     @wraps(f)
     def wrap(*args, **kw):
+        if not DO_TIMING and profiler is None:
+            # If config["TIME_PROGRESS"] is false, or config["USE_PARALLEL"] is true, and no profiler is active, run
+            # functions normally without timing.
+            return f(*args, **kw)
+
+        # Run function with timing
+        ts = perf_counter()
+        result = f(*args, **kw)
+        te = perf_counter()
+        if profiler is not None:
+            profiler.record(type(args[0]).__name__ + '.' + f.__name__ if is_method else f.__name__, ts, te)
         if DO_TIMING:
-            # Run function with timing
-            ts = perf_counter()
-            result = f(*args, **kw)
-            te = perf_counter()
-            tt = te-ts
+            _print_timing(f, arg_names, args, te - ts)
+        return result
+    return wrap
 
-            # Get function name
-            arg_names = inspect.getfullargspec(f)[0]
-            if arg_names[0] == 'self' and DISPLAY_LESS_PROGRESS:
-                return result
-            elif arg_names[0] == 'self':
-                method_name = type(args[0]).__name__ + '.' + f.__name__
-            else:
-                method_name = f.__name__
 
-            # Record accumulative time in each function for analysis
-            if method_name in timer_dict.keys():
-                timer_dict[method_name] += tt
-            else:
-                timer_dict[method_name] = tt
+def _print_timing(f, arg_names, args, tt):
+    """Records the time of a call in timer_dict and prints it"""
+    # Get function name
+    if arg_names[0] == 'self' and DISPLAY_LESS_PROGRESS:
+        return
+    elif arg_names[0] == 'self':
+        method_name = type(args[0]).__name__ + '.' + f.__name__
+    else:
+        method_name = f.__name__
 
-            # If code is finished, display timing summary
-            if method_name == "Evaluator.evaluate":
-                print("")
-                print("Timing analysis:")
-                for key, value in timer_dict.items():
-                    print('%-70s %2.4f sec' % (key, value))
-            else:
-                # Get function argument values for printing special arguments of interest
-                arg_titles = ['tracker', 'seq', 'cls']
-                arg_vals = []
-                for i, a in enumerate(arg_names):
-                    if a in arg_titles:
-                        arg_vals.append(args[i])
-                arg_text = '(' + ', '.join(arg_vals) + ')'
+    # Record accumulative time in each function for analysis
+    if method_name in timer_dict.keys():
+        timer_dict[method_name] += tt
+    else:
+        timer_dict[method_name] = tt
 
-                # Display methods and functions with different indentation.
-                if arg_names[0] == 'self':
-                    print('%-74s %2.4f sec' % (' '*4 + method_name + arg_text, tt))
-                elif arg_names[0] == 'test':
-                    pass
-                else:
-                    global counter
-                    counter += 1
-                    print('%i %-70s %2.4f sec' % (counter, method_name + arg_text, tt))
+    # If code is finished, display timing summary
+    if method_name == "Evaluator.evaluate":
+        print("")
+        print("Timing analysis:")
+        for key, value in timer_dict.items():
+            print('%-70s %2.4f sec' % (key, value))
+    else:
+        # Get function argument values for printing special arguments of interest
+        arg_titles = ['tracker', 'seq', 'cls']
+        arg_vals = []
+        for i, a in enumerate(arg_names):
+            if a in arg_titles:
+                arg_vals.append(args[i])
+        arg_text = '(' + ', '.join(arg_vals) + ')'
 
-            return result
+        # Display methods and functions with different indentation.
+        if arg_names[0] == 'self':
+            print('%-74s %2.4f sec' % (' '*4 + method_name + arg_text, tt))
+        elif arg_names[0] == 'test':
+            pass
         else:
-            # If config["TIME_PROGRESS"] is false, or config["USE_PARALLEL"] is true, run functions normally without timing.
-            return f(*args, **kw)
-    return wrap
+            global counter
+            counter += 1
+            print('%i %-70s %2.4f sec' % (counter, method_name + arg_text, tt))
@@ -15,3 +15,4 @@ from .youtube_vis import YouTubeVIS
 from .head_tracking_challenge import HeadTrackingChallenge
 from .rob_mots import RobMOTS
 from .person_path_22 import PersonPath22
+from .svag_submission import SVAGSubmissionDataset
@@ -3,6 +3,7 @@ import io
 import zipfile
 import os
 import traceback
+import warnings
 import numpy as np
 from copy import deepcopy
 from abc import ABC, abstractmethod
@@ -20,6 +21,7 @@ class _BaseDataset(ABC):
         self.output_sub_fol = None
         self.should_classes_combine = True
         self.use_super_categories = False
+        self.batch_similarities = False  # If True, similarities are computed for all timesteps of a seq at once
 
     # Functions to implement:
 
@@ -41,6 +43,13 @@ class _BaseDataset(ABC):
     def _calculate_similarities(self, gt_dets_t, tracker_dets_t):
         ...
 
+    def _calculate_similarities_batched(self, gt_dets, tracker_dets):
+        """ Calculates the similarities of all timesteps of a sequence (lists over timesteps of dets).
+        Can be overwritten by datasets (with batch_similarities True) to compute them in one vectorised pass.
+        """
+        return [self._calculate_similarities(gt_dets_t, tracker_dets_t)
+                for gt_dets_t, tracker_dets_t in zip(gt_dets, tracker_dets)]
+
     # Helper functions for all datasets:
 
     @classmethod
@@ -63,8 +72,23 @@ class _BaseDataset(ABC):
         """Return info about the dataset needed for the Evaluator"""
         return self.tracker_list, self.seq_list, self.class_list
 
+    def get_seq_cost(self, tracker, seq):
+        """ Estimated relative cost of evaluating a tracker on a sequence, used to start the longest sequences first
+        when evaluating in parallel. Defaults to the number of timesteps, datasets knowing the number of gt and tracker
+        detections without loading them can do better (see SVAGSubmissionDataset.get_seq_cost).
+        """
+        return getattr(self, 'seq_lengths', {}).get(seq, 1)
+
+    def get_raw_gt_seq_data(self, tracker, seq):
+        """ Loads the raw ground-truth data of a single sequence, as included by get_raw_seq_data.
+        It does not depend on the tracker (only given to the loader for its error messages), so it can be loaded once
+        and passed to get_raw_seq_data for all the trackers evaluated on the sequence.
+        """
+        with _timing.section('load'):
+            return self._load_raw_file(tracker, seq, is_gt=True)
+
     @_timing.time
-    def get_raw_seq_data(self, tracker, seq):
+    def get_raw_seq_data(self, tracker, seq, raw_gt_data=None):
         """ Loads raw data (tracker and ground-truth) for a single tracker on a single sequence.
         Raw data includes all of the information needed for both preprocessing and evaluation, for all classes.
         A later function (get_processed_seq_data) will perform such preprocessing and extract relevant information for
@@ -87,17 +111,26 @@ class _BaseDataset(ABC):
         we don't wish to calculate this twice.
         We calculate similarity between all gt and tracker classes (not just each class individually) to allow for
         calculation of metrics such as class confusion matrices. Typically the impact of this on performance is low.
+
+        If raw_gt_data (from get_raw_gt_seq_data) is given, the ground-truth is not loaded again. It is not modified, as
+        the raw data is already shared by the preprocessing of all classes.
         """
         # Load raw data.
-        raw_gt_data = self._load_raw_file(tracker, seq, is_gt=True)
-        raw_tracker_data = self._load_raw_file(tracker, seq, is_gt=False)
+        if raw_gt_data is None:
+            raw_gt_data = self.get_raw_gt_seq_data(tracker, seq)
+        with _timing.section('load'):
+            raw_tracker_data = self._load_raw_file(tracker, seq, is_gt=False)
         raw_data = {**raw_tracker_data, **raw_gt_data}  # Merges dictionaries
 
         # Calculate similarities for each timestep.
-        similarity_scores = []
-        for t, (gt_dets_t, tracker_dets_t) in enumerate(zip(raw_data['gt_dets'], raw_data['tracker_dets'])):
-            ious = self._calculate_similarities(gt_dets_t, tracker_dets_t)
-            similarity_scores.append(ious)
+        with _timing.section('similarity'):
+            if self.batch_similarities:
+                similarity_scores = self._calculate_similarities_batched(raw_data['gt_dets'], raw_data['tracker_dets'])
+            else:
+                similarity_scores = []
+                for t, (gt_dets_t, tracker_dets_t) in enumerate(zip(raw_data['gt_dets'], raw_data['tracker_dets'])):
+                    ious = self._calculate_similarities(gt_dets_t, tracker_dets_t)
+                    similarity_scores.append(ious)
         raw_data['similarity_scores'] = similarity_scores
         return raw_data
 
@@ -211,6 +244,60 @@ class _BaseDataset(ABC):
                     file))
         return read_data, crowd_ignore_data
 
+    @staticmethod
+    def _load_numeric_text_file(file, time_col=0, is_zipped=False, zip_file=None):
+        """ Fast path of _load_simple_text_file for purely numeric, comma separated files with the same number of
+        columns in every row (such as MOT format gt.txt and predict.txt files).
+
+        The whole file is parsed into one float array with a single np.loadtxt call, and the rows are then grouped by
+        timestep with argsort and searchsorted instead of row by row.
+
+        Returns read_data as a dict (with keys as timesteps as strings, in order of first appearance) of 2D float
+        arrays (over dets, over columns), which np.asarray(..., dtype=float) leaves unchanged.
+        Returns None if the file does not match this layout (or cannot be read), in which case
+        _load_simple_text_file should be used instead, it handles other dialects and reports invalid files.
+        """
+        try:
+            if is_zipped:
+                if zip_file is None:
+                    return None
+                with zipfile.ZipFile(zip_file, 'r') as archive:
+                    text = archive.read(file).decode()
+            else:
+                with open(file) as fp:
+                    text = fp.read()
+        except (OSError, KeyError, UnicodeDecodeError, zipfile.BadZipFile):
+            return None
+        if not text:
+            return {}
+        lines = text.splitlines()
+        # Empty lines are errors for the csv reader, but np.loadtxt would silently skip them
+        if not all(line.strip() for line in lines):
+            return None
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                data = np.loadtxt(lines, dtype=float, delimiter=',', comments=None, ndmin=2)
+        except (ValueError, Warning):
+            return None
+        if data.shape[1] <= time_col:
+            return None
+        times = data[:, time_col]
+        if not np.all(np.abs(times) < 2 ** 53):
+            return None
+
+        # Group the rows by timestep, keeping the file order within and between timesteps
+        timesteps = np.trunc(times).astype(np.int64)
+        order = np.argsort(timesteps, kind='stable')
+        sorted_timesteps = timesteps[order]
+        unique_timesteps, first_rows = np.unique(timesteps, return_index=True)
+        starts = np.searchsorted(sorted_timesteps, unique_timesteps, side='left')
+        ends = np.searchsorted(sorted_timesteps, unique_timesteps, side='right')
+        read_data = {}
+        for i in np.argsort(first_rows):
+            read_data[str(unique_timesteps[i])] = data[order[starts[i]:ends[i]]]
+        return read_data
+
     @staticmethod
     def _calculate_mask_ious(masks1, masks2, is_encoded=False, do_ioa=False):
         """ Calculates the IOU (intersection over union) between two arrays of segmentation masks.
@@ -285,6 +372,58 @@ class _BaseDataset(ABC):
             ious = intersection / union
             return ious
 
+    @staticmethod
+    def _calculate_box_ious_batched(bboxes1_list, bboxes2_list, box_format='xywh'):
+        """ Calculates the IOUs between the boxes of each timestep of a sequence in one vectorised pass.
+        The boxes of all timesteps are concatenated, and the (box1, box2) pairs of all timesteps are laid out one after
+        the other (timestep t owning pair_offsets[t]:pair_offsets[t + 1]). Each pair is computed with the same
+        operations as in _calculate_box_ious, and the returned list (for each timestep) holds reshaped views of the
+        flat result, so the IOUs are identical to calling _calculate_box_ious for each timestep.
+        """
+        num_timesteps = len(bboxes1_list)
+        if num_timesteps == 0:
+            return []
+        counts1 = np.array([len(b) for b in bboxes1_list], dtype=np.int64)
+        counts2 = np.array([len(b) for b in bboxes2_list], dtype=np.int64)
+        offsets1 = np.concatenate(([0], np.cumsum(counts1)))
+        offsets2 = np.concatenate(([0], np.cumsum(counts2)))
+        num_pairs = counts1 * counts2
+        pair_offsets = np.concatenate(([0], np.cumsum(num_pairs)))
+
+        bboxes1 = np.concatenate([np.reshape(b, (-1, 4)) for b in bboxes1_list]).astype(float)
+        bboxes2 = np.concatenate([np.reshape(b, (-1, 4)) for b in bboxes2_list]).astype(float)
+        if box_format in 'xywh':
+            # layout: (x0, y0, w, h)
+            bboxes1[:, 2] = bboxes1[:, 0] + bboxes1[:, 2]
+            bboxes1[:, 3] = bboxes1[:, 1] + bboxes1[:, 3]
+            bboxes2[:, 2] = bboxes2[:, 0] + bboxes2[:, 2]
+            bboxes2[:, 3] = bboxes2[:, 1] + bboxes2[:, 3]
+        elif box_format not in 'x0y0x1y1':
+            raise (TrackEvalException('box_format %s is not implemented' % box_format))
+
+        # Index of box1 and box2 of each pair: the pairs of a timestep are in row major (box1, box2) order
+        pair_counts2 = np.repeat(counts2, num_pairs)
+        local_idx = np.arange(pair_offsets[-1]) - np.repeat(pair_offsets[:-1], num_pairs)
+        idx1 = np.repeat(offsets1[:-1], num_pairs) + local_idx // np.maximum(pair_counts2, 1)
+        idx2 = np.repeat(offsets2[:-1], num_pairs) + local_idx % np.maximum(pair_counts2, 1)
+        b1 = bboxes1[idx1]
+        b2 = bboxes2[idx2]
+
+        # layout: (x0, y0, x1, y1)
+        min_ = np.minimum(b1, b2)
+        max_ = np.maximum(b1, b2)
+        intersection = np.maximum(min_[:, 2] - max_[:, 0], 0) * np.maximum(min_[:, 3] - max_[:, 1], 0)
+        area1 = (bboxes1[:, 2] - bboxes1[:, 0]) * (bboxes1[:, 3] - bboxes1[:, 1])
+        area2 = (bboxes2[:, 2] - bboxes2[:, 0]) * (bboxes2[:, 3] - bboxes2[:, 1])
+        union = area1[idx1] + area2[idx2] - intersection
+        intersection[area1[idx1] <= 0 + np.finfo('float').eps] = 0
+        intersection[area2[idx2] <= 0 + np.finfo('float').eps] = 0
+        intersection[union <= 0 + np.finfo('float').eps] = 0
+        union[union <= 0 + np.finfo('float').eps] = 1
+        ious = intersection / union
+        return [ious[pair_offsets[t]:pair_offsets[t + 1]].reshape(counts1[t], counts2[t])
+                for t in range(num_timesteps)]
+
     @staticmethod
     def _calculate_euclidean_similarity(dets1, dets2, zero_distance=2.0):
         """ Calculates the euclidean distance between two sets of detections, and then converts this into a similarity
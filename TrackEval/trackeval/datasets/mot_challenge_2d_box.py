@@ -27,6 +27,7 @@ class MotChallenge2DBox(_BaseDataset):
             'INPUT_AS_ZIP': False,  # Whether tracker input files are zipped
             'PRINT_CONFIG': True,  # Whether to print current config
             'DO_PREPROC': True,  # Whether to perform preprocessing (never done for MOT15)
+            'BATCH_SIMILARITIES': False,  # Whether to compute the box IOUs of all timesteps of a seq at once
             'TRACKER_SUB_FOLDER': 'data',  # Tracker files are in TRACKER_FOLDER/tracker_name/TRACKER_SUB_FOLDER
             'OUTPUT_SUB_FOLDER': '',  # Output files are saved in OUTPUT_FOLDER/tracker_name/OUTPUT_SUB_FOLDER
             'TRACKER_DISPLAY_NAMES': None,  # Names of trackers to display, if None: TRACKERS_TO_EVAL
@@ -59,6 +60,7 @@ class MotChallenge2DBox(_BaseDataset):
         self.use_super_categories = False
         self.data_is_zipped = self.config['INPUT_AS_ZIP']
         self.do_preproc = self.config['DO_PREPROC']
+        self.batch_similarities = self.config['BATCH_SIMILARITIES']
 
         self.output_fol = self.config['OUTPUT_FOLDER']
         if self.output_fol is None:
@@ -212,7 +214,9 @@ class MotChallenge2DBox(_BaseDataset):
                 file = os.path.join(self.tracker_list[0], seq.split('+')[0], seq.split('+')[1], 'predict.txt')
 
         # Load raw data from text file
-        read_data, ignore_data = self._load_simple_text_file(file, is_zipped=self.data_is_zipped, zip_file=zip_file)
+        read_data = self._load_numeric_text_file(file, is_zipped=self.data_is_zipped, zip_file=zip_file)
+        if read_data is None:
+            read_data, _ = self._load_simple_text_file(file, is_zipped=self.data_is_zipped, zip_file=zip_file)
 
         # Convert data to required format
         num_timesteps = self.seq_lengths[seq]
@@ -452,3 +456,7 @@ class MotChallenge2DBox(_BaseDataset):
     def _calculate_similarities(self, gt_dets_t, tracker_dets_t):
         similarity_scores = self._calculate_box_ious(gt_dets_t, tracker_dets_t, box_format='xywh')
         return similarity_scores
+
+    def _calculate_similarities_batched(self, gt_dets, tracker_dets):
+        similarity_scores = self._calculate_box_ious_batched(gt_dets, tracker_dets, box_format='xywh')
+        return similarity_scores
@@ -0,0 +1,346 @@
+import os
+import csv
+import configparser
+import numpy as np
+from ._base_dataset import _BaseDataset
+from .. import utils
+from .. import _timing
+from ..utils import TrackEvalException
+
+# Typical size of a line of a gt.txt file ("frame, id, x, y, w, h, 1, 1, 1"), to estimate its detections from its size
+GT_LINE_BYTES = 50
+
+
+class SVAGSubmissionDataset(_BaseDataset):
+    """Dataset class for SVAG spatial evaluation, reading the tracker data directly from a parsed submission.json.
+
+    Ground truth is read from the per-query gt.txt files (MOT Challenge 2D box format) written by
+    convert_valid_gt_all.py, while the predictions of one sub-dataset (OVIS, MOT17 or MOT20) are given as the list of
+    queries of the parsed submission, so no per-query predict.txt files have to be written and re-read.
+    """
+
+    @staticmethod
+    def get_default_dataset_config():
+        """Default class config values"""
+        code_path = utils.get_code_path()
+        default_config = {
+            'GT_FOLDER': os.path.join(code_path, 'data/gt/svag/'),  # Location of GT data
+            'OUTPUT_FOLDER': os.path.join(code_path, 'data/trackers/svag/'),  # Where to save eval results
+            'SUBMISSION': None,  # List of queries of one dataset in submission.json (dataset['queries'])
+            'TRACKER_NAME': 'submission',  # Name under which the submission is evaluated
+            'CLASSES_TO_EVAL': ['pedestrian'],  # Valid: ['pedestrian']
+            'PRINT_CONFIG': True,  # Whether to print current config
+            'BATCH_SIMILARITIES': True,  # Whether to compute the box IOUs of all timesteps of a seq at once
+            'OUTPUT_SUB_FOLDER': '',  # Output files are saved in OUTPUT_FOLDER/tracker_name/OUTPUT_SUB_FOLDER
+            'SEQMAP_FILE': None,  # Seqmap file with one '{video_name}+{expression}' sequence per row
+            'SEQ_INFO': None,  # If not None, directly specify sequences to eval and their number of timesteps
+            'GT_LOC_FORMAT': '{gt_folder}{video_id}/{expression_id}/gt.txt',
+            'GT_DATA': None,  # Preloaded gt (e.g. from a gt cache), dict with 'seq_lengths' and 'time_data' per seq
+        }
+        return default_config
+
+    def __init__(self, config=None):
+        """Initialise dataset, checking that all required files and predictions are present"""
+        super().__init__()
+        # Fill non-given config values with defaults
+        self.config = utils.init_config(config, self.get_default_dataset_config(), self.get_name())
+
+        self.gt_fol = os.path.join(self.config['GT_FOLDER'], '')
+        self.output_fol = self.config['OUTPUT_FOLDER']
+        self.output_sub_fol = self.config['OUTPUT_SUB_FOLDER']
+        self.should_classes_combine = False
+        self.use_super_categories = False
+        self.batch_similarities = self.config['BATCH_SIMILARITIES']
+        self.gt_data = self.config['GT_DATA']
+
+        # Only a single class is evaluated. It keeps the MOT Challenge name so summaries stay pedestrian_summary.txt
+        self.valid_classes = ['pedestrian']
+        self.class_list = [cls.lower() if cls.lower() in self.valid_classes else None
+                           for cls in self.config['CLASSES_TO_EVAL']]
+        if not all(self.class_list):
+            raise TrackEvalException('Attempted to evaluate an invalid class. Only pedestrian class is valid.')
+        self.class_name_to_class_id = {'pedestrian': 1}
+
+        # Get sequences to eval and check gt files exist
+        self.seq_list, self.seq_lengths = self._get_seq_info()
+        if len(self.seq_list) < 1:
+            raise TrackEvalException('No sequences are selected to be evaluated.')
+        for seq in self.seq_list:
+            if self.gt_data is not None and seq in self.gt_data['time_data']:
+                continue
+            curr_file = self._get_gt_file(seq)
+            if not os.path.isfile(curr_file):
+                print('GT file not found ' + curr_file)
+                raise TrackEvalException('GT file not found for sequence: ' + seq)
+
+        # Index the submitted queries by sequence name, as it is done when converting them to predict.txt files
+        if self.config['SUBMISSION'] is None:
+            raise TrackEvalException('No submission given to evaluate.')
+        self.seq_to_query = {}
+        for query in self.config['SUBMISSION']:
+            self.seq_to_query[self.get_seq_name(query['video_name'], query['query'])] = query
+        for seq in self.seq_list:
+            if seq not in self.seq_to_query:
+                raise TrackEvalException('Tracker predictions not found for sequence: ' + seq)
+
+        self.tracker_list = [self.config['TRACKER_NAME']]
+
+    @staticmethod
+    def get_seq_name(video_name, query):
+        """Sequence name of a query, '{video_name}+{expression}' as in the seqmap files"""
+        return video_name + '+' + query.lower().replace(' ', '-')
+
+    def _get_gt_file(self, seq):
+        video_id, expression_id = seq.split('+', 1)
+        return self.config['GT_LOC_FORMAT'].format(gt_folder=self.gt_fol, video_id=video_id,
+                                                   expression_id=expression_id)
+
+    def _get_seq_info(self):
+        if self.config['SEQ_INFO']:
+            seq_lengths = dict(self.config['SEQ_INFO'])
+            seq_list = list(seq_lengths.keys())
+            for seq, seq_length in seq_lengths.items():
+                if seq_length is None:
+                    seq_lengths[seq] = self._read_seq_length(seq)
+            return seq_list, seq_lengths
+
+        seqmap_file = self.config['SEQMAP_FILE']
+        if seqmap_file is None or not os.path.isfile(seqmap_file):
+            print('no seqmap found: ' + str(seqmap_file))
+            raise TrackEvalException('no seqmap found: ' + os.path.basename(str(seqmap_file)))
+        seq_list = self.read_seqmap(seqmap_file)
+        seq_lengths = {seq: self._read_seq_length(seq) for seq in seq_list}
+        return seq_list, seq_lengths
+
+    @staticmethod
+    def read_seqmap(seqmap_file):
+        """List of the sequences in a seqmap file"""
+        seq_list = []
+        with open(seqmap_file) as fp:
+            reader = csv.reader(fp, delimiter='~')
+            for row in reader:
+                if len(row) == 0 or row[0] == '':
+                    continue
+                seq_list.append(row[0])
+        return seq_list
+
+    def _read_seq_length(self, seq):
+        if self.gt_data is not None and seq in self.gt_data['seq_lengths']:
+            return self.gt_data['seq_lengths'][seq]
+        return self.read_seq_length(self.gt_fol, seq.split('+')[0])
+
+    @staticmethod
+    def read_seq_length(gt_fol, video_id):
+        """Number of timesteps of a video, read from its seqinfo.ini"""
+        ini_file = os.path.join(gt_fol, video_id, 'seqinfo.ini')
+        if not os.path.isfile(ini_file):
+            raise TrackEvalException('ini file does not exist: ' + video_id + '/' + os.path.basename(ini_file))
+        ini_data = configparser.ConfigParser()
+        ini_data.read(ini_file)
+        return int(ini_data['Sequence']['seqLength'])
+
+    def _load_raw_file(self, tracker, seq, is_gt):
+        """Load the gt file or the submitted predictions of a single sequence.
+
+        If is_gt, this returns a dict which contains the fields:
+        [gt_ids, gt_classes] : list (for each timestep) of 1D NDArrays (for each det).
+        [gt_dets, gt_crowd_ignore_regions]: list (for each timestep) of lists of detections.
+        [gt_extras] : list (for each timestep) of dicts (for each extra) of 1D NDArrays (for each det).
+
+        if not is_gt, this returns a dict which contains the fields:
+        [tracker_ids, tracker_classes, tracker_confidences] : list (for each timestep) of 1D NDArrays (for each det).
+        [tracker_dets]: list (for each timestep) of lists of detections.
+        """
+        num_timesteps = self.seq_lengths[seq]
+        if is_gt:
+            time_data = self._load_gt_time_data(seq)
+        else:
+            time_data = self._load_submission_time_data(seq)
+
+        extra_time_keys = [t for t in time_data.keys() if not 1 <= t <= num_timesteps]
+        if len(extra_time_keys) > 0:
+            text = 'Ground-truth' if is_gt else 'Tracking'
+            raise TrackEvalException(
+                text + ' data contains the following invalid timesteps in seq %s: ' % seq + ', '.join(
+                    [str(x) + ', ' for x in extra_time_keys]))
+
+        data_keys = ['ids', 'classes', 'dets']
+        if is_gt:
+            data_keys += ['gt_crowd_ignore_regions', 'gt_extras']
+        else:
+            data_keys += ['tracker_confidences']
+        raw_data = {key: [None] * num_timesteps for key in data_keys}
+        for t in range(num_timesteps):
+            if t + 1 in time_data:
+                rows = time_data[t + 1]
+                raw_data['dets'][t] = np.atleast_2d(rows[:, 2:6])
+                raw_data['ids'][t] = np.atleast_1d(rows[:, 1]).astype(int)
+                if is_gt:
+                    raw_data['classes'][t] = np.atleast_1d(rows[:, 7]).astype(int)
+                    raw_data['gt_extras'][t] = {'zero_marked': np.atleast_1d(rows[:, 6].astype(int))}
+                else:
+                    raw_data['classes'][t] = np.ones_like(raw_data['ids'][t])
+                    raw_data['tracker_confidences'][t] = np.ones(len(rows))
+            else:
+                raw_data['dets'][t] = np.empty((0, 4))
+                raw_data['ids'][t] = np.empty(0).astype(int)
+                raw_data['classes'][t] = np.empty(0).astype(int)
+                if is_gt:
+                    raw_data['gt_extras'][t] = {'zero_marked': np.empty(0)}
+                else:
+                    raw_data['tracker_confidences'][t] = np.empty(0)
+            if is_gt:
+                raw_data['gt_crowd_ignore_regions'][t] = np.empty((0, 4))
+
+        prefix = 'gt_' if is_gt else 'tracker_'
+        for k in ['ids', 'classes', 'dets']:
+            raw_data[prefix + k] = raw_data.pop(k)
+        raw_data['num_timesteps'] = num_timesteps
+        raw_data['seq'] = seq
+        return raw_data
+
+    def _load_gt_time_data(self, seq):
+        if self.gt_data is not None and seq in self.gt_data['time_data']:
+            return self.gt_data['time_data'][seq]
+        return self.read_gt_time_data(self._get_gt_file(seq), seq)
+
+    @staticmethod
+    def read_gt_time_data(gt_file, seq):
+        """Read a gt.txt file into a dict (with timesteps as keys) of 2D NDArrays (for each det) of MOT columns"""
+        read_data = SVAGSubmissionDataset._load_numeric_text_file(gt_file)
+        if read_data is None:
+            read_data, _ = SVAGSubmissionDataset._load_simple_text_file(gt_file)
+        time_data = {}
+        for time_key, rows in read_data.items():
+            try:
+                time_data[int(time_key)] = np.asarray(rows, dtype=float)
+            except ValueError:
+                raise TrackEvalException('Cannot convert gt data for sequence %s to float. Is data corrupted?' % seq)
+            if time_data[int(time_key)].shape[1] < 8:
+                raise TrackEvalException(
+                    'GT data is not in a valid format, there is not enough rows in seq %s, timestep %s.' % (
+                        seq, time_key))
+        return time_data
+
+    def _load_submission_time_data(self, seq):
+        """Convert the submitted tracks of a sequence into a dict (with timesteps as keys) of 2D NDArrays with the
+        columns [frame, track_id, x, y, w, h]. Within a timestep dets keep the order of the tracks in the submission.
+        """
+        rows = []
+        for track in self.seq_to_query[seq]['tracks']:
+            track_id = int(track['track_id'])
+            for idx, box in enumerate(track['spatial']):
+                if box is not None:
+                    rows.append([idx + 1, track_id] + list(box))
+        if len(rows) == 0:
+            return {}
+        try:
+            rows = np.asarray(rows, dtype=float)
+        except ValueError:
+            raise TrackEvalException('Cannot convert tracking data of sequence %s to float. Is data corrupted?' % seq)
+        if rows.ndim != 2 or rows.shape[1] != 6:
+            raise TrackEvalException('Boxes of sequence %s are not in [x, y, width, height] format.' % seq)
+
+        timesteps = rows[:, 0].astype(int)
+        order = np.argsort(timesteps, kind='stable')
+        rows = rows[order]
+        unique_timesteps, starts = np.unique(timesteps[order], return_index=True)
+        return dict(zip(unique_timesteps.tolist(), np.split(rows, starts[1:])))
+
+    def get_seq_cost(self, tracker, seq):
+        """ Estimated cost of a sequence: its timesteps plus the gt x tracker detection pairs compared in them, i.e.
+        num_gt_dets * num_tracker_dets / num_timesteps for detections spread evenly over the timesteps. The tracker
+        detections are counted in the submission, the gt ones are estimated from the size of the gt.txt file.
+        """
+        num_timesteps = max(1, self.seq_lengths[seq])
+        num_tracker_dets = sum(len(track['spatial']) - track['spatial'].count(None)
+                               for track in self.seq_to_query[seq]['tracks'])
+        try:
+            num_gt_dets = os.path.getsize(self._get_gt_file(seq)) / GT_LINE_BYTES
+        except OSError:  # Only given as gt data
+            num_gt_dets = num_timesteps
+        return num_timesteps + num_gt_dets * num_tracker_dets / num_timesteps
+
+    @_timing.time
+    def get_preprocessed_seq_data(self, raw_data, cls):
+        """ Preprocess data for a single sequence for a single class ready for evaluation.
+        Inputs:
+             - raw_data is a dict containing the data for the sequence already read in by get_raw_seq_data().
+             - cls is the class to be evaluated.
+        Outputs:
+             - data is a dict containing all of the information that metrics need to perform evaluation.
+                It contains the following fields:
+                    [num_timesteps, num_gt_ids, num_tracker_ids, num_gt_dets, num_tracker_dets] : integers.
+                    [gt_ids, tracker_ids, tracker_confidences]: list (for each timestep) of 1D NDArrays (for each det).
+                    [gt_dets, tracker_dets]: list (for each timestep) of lists of detections.
+                    [similarity_scores]: list (for each timestep) of 2D NDArrays.
+                    [unique_gt_ids, unique_tracker_ids]: original ids of the relabeled gt and tracker ids.
+
+        SVAG:
+            There are no distractor classes or crowd ignore regions, so the MOT Challenge preprocessing reduces to
+            removing gt dets marked with zero_marked or of another class. It also relabels gt and tracker ids to be
+            contiguous and checks that ids are unique within each timestep.
+        """
+        # Check that input data has unique ids
+        self._check_unique_ids(raw_data)
+
+        cls_id = self.class_name_to_class_id[cls]
+        data_keys = ['gt_ids', 'tracker_ids', 'gt_dets', 'tracker_dets', 'tracker_confidences', 'similarity_scores']
+        data = {key: [None] * raw_data['num_timesteps'] for key in data_keys}
+        unique_gt_ids = []
+        unique_tracker_ids = []
+        num_gt_dets = 0
+        num_tracker_dets = 0
+        for t in range(raw_data['num_timesteps']):
+            gt_to_keep_mask = (np.not_equal(raw_data['gt_extras'][t]['zero_marked'], 0)) & \
+                              (np.equal(raw_data['gt_classes'][t], cls_id))
+            data['gt_ids'][t] = raw_data['gt_ids'][t][gt_to_keep_mask]
+            data['gt_dets'][t] = raw_data['gt_dets'][t][gt_to_keep_mask, :]
+            data['similarity_scores'][t] = raw_data['similarity_scores'][t][gt_to_keep_mask]
+            data['tracker_ids'][t] = raw_data['tracker_ids'][t]
+            data['tracker_dets'][t] = raw_data['tracker_dets'][t]
+            data['tracker_confidences'][t] = raw_data['tracker_confidences'][t]
+
+            unique_gt_ids += list(np.unique(data['gt_ids'][t]))
+            unique_tracker_ids += list(np.unique(data['tracker_ids'][t]))
+            num_tracker_dets += len(data['tracker_ids'][t])
+            num_gt_dets += len(data['gt_ids'][t])
+
+        # Re-label IDs such that there are no empty IDs
+        if len(unique_gt_ids) > 0:
+            unique_gt_ids = np.unique(unique_gt_ids)
+            gt_id_map = np.nan * np.ones((np.max(unique_gt_ids) + 1))
+            gt_id_map[unique_gt_ids] = np.arange(len(unique_gt_ids))
+            for t in range(raw_data['num_timesteps']):
+                if len(data['gt_ids'][t]) > 0:
+                    data['gt_ids'][t] = gt_id_map[data['gt_ids'][t]].astype(int)
+        if len(unique_tracker_ids) > 0:
+            unique_tracker_ids = np.unique(unique_tracker_ids)
+            tracker_id_map = np.nan * np.ones((np.max(unique_tracker_ids) + 1))
+            tracker_id_map[unique_tracker_ids] = np.arange(len(unique_tracker_ids))
+            for t in range(raw_data['num_timesteps']):
+                if len(data['tracker_ids'][t]) > 0:
+                    data['tracker_ids'][t] = tracker_id_map[data['tracker_ids'][t]].astype(int)
+
+        # Record overview statistics.
+        data['num_tracker_dets'] = num_tracker_dets
+        data['num_gt_dets'] = num_gt_dets
+        data['num_tracker_ids'] = len(unique_tracker_ids)
+        data['num_gt_ids'] = len(unique_gt_ids)
+        data['num_timesteps'] = raw_data['num_timesteps']
+        data['seq'] = raw_data['seq']
+        data['unique_gt_ids'] = unique_gt_ids
+        data['unique_tracker_ids'] = unique_tracker_ids
+
+        # Ensure again that ids are unique per timestep after preproc.
+        self._check_unique_ids(data, after_preproc=True)
+
+        return data
+
+    def _calculate_similarities(self, gt_dets_t, tracker_dets_t):
+        similarity_scores = self._calculate_box_ious(gt_dets_t, tracker_dets_t, box_format='xywh')
+        return similarity_scores
+
+    def _calculate_similarities_batched(self, gt_dets, tracker_dets):
+        similarity_scores = self._calculate_box_ious_batched(gt_dets, tracker_dets, box_format='xywh')
+        return similarity_scores
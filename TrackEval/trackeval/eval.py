@@ -1,11 +1,11 @@
 import time
 import traceback
 from multiprocessing.pool import Pool
-from functools import partial
 import os
 from . import utils
 from .utils import TrackEvalException
 from . import _timing
+from . import profiling
 from .metrics import Count
 
 try:
@@ -40,14 +40,28 @@ class Evaluator:
             'OUTPUT_DETAILED': True,
             'PLOT_CURVES': True,
 
-            'SAVE_PATH': '../results/id_mapping.jsonl',
+            'SAVE_PATH': '../results/id_mapping.jsonl',  # Where the HOTA id mappings are appended (None to not save)
+            'SAVE_PATH_UNIQUE': False,  # If True, a suffix unique to this run is added to the SAVE_PATH file name
+            'KEEP_ID_MAPPINGS': False,  # If True, the id mappings are also kept in memory, see get_id_mappings
+
+            'PROFILE': False,  # Collects the timings of the stages and functions, also in parallel (see profiling.py)
+            'PROFILE_TRACE': False,  # If PROFILE, also keeps every call for a Chrome trace
+            'PROFILE_FOLDER': None,  # If PROFILE, where profile.json, profile.csv and trace.json are written
         }
         return default_config
 
     def __init__(self, config=None):
         """Initialise the evaluator with a config file"""
         self.config = utils.init_config(config, self.get_default_eval_config(), 'Eval')
-        # Only run timing analysis if not run in parallel.
+        # Id mappings are written by the parent process only, to a file .pkl (pickle) or json lines otherwise
+        self.id_mapping_path = self.config['SAVE_PATH']
+        if self.id_mapping_path is not None and self.config['SAVE_PATH_UNIQUE']:
+            self.id_mapping_path = utils.get_unique_save_path(self.id_mapping_path)
+        self.id_mappings = {}
+        self.id_mapping_writer = None  # Of the running evaluation, see utils.IdMappingWriter
+        self.worker_utilisation = {}
+        self.profiler = None
+        # Only print the timing analysis if not run in parallel. The PROFILE timings are also collected in parallel.
         if self.config['TIME_PROGRESS'] and not self.config['USE_PARALLEL']:
             _timing.DO_TIMING = True
             if self.config['DISPLAY_LESS_PROGRESS']:
@@ -57,6 +71,27 @@ class Evaluator:
     def evaluate(self, dataset_list, metrics_list, show_progressbar=False):
         """Evaluate a set of metrics on a set of datasets"""
         config = self.config
+        # Fail before evaluating anything if the id mappings of the metrics can not be saved to SAVE_PATH
+        for metric in metrics_list:
+            if hasattr(metric, 'id_mapping_format'):
+                utils.check_id_mapping_path(self.id_mapping_path, metric.id_mapping_format)
+        self.id_mapping_writer = None if self.id_mapping_path is None else utils.IdMappingWriter(self.id_mapping_path)
+        self.profiler = profiling.Profiler(trace=config['PROFILE_TRACE']) if config['PROFILE'] else None
+        try:
+            if self.profiler is None:
+                return self._evaluate(dataset_list, metrics_list, show_progressbar)
+            with profiling.activate(self.profiler), self.profiler.measure('evaluate'):
+                return self._evaluate(dataset_list, metrics_list, show_progressbar)
+        finally:
+            if self.id_mapping_writer is not None:
+                self.id_mapping_writer.close()
+            if self.profiler is not None and config['PROFILE_FOLDER'] is not None:
+                self.profiler.save(config['PROFILE_FOLDER'])
+
+    def _evaluate(self, dataset_list, metrics_list, show_progressbar):
+        config = self.config
+        self.id_mappings = {}
+        self.worker_utilisation = {}
         metrics_list = metrics_list + [Count()]  # Count metrics are always run
         metric_names = utils.validate_metrics_list(metrics_list)
         dataset_names = [dataset.get_name() for dataset in dataset_list]
@@ -72,48 +107,31 @@ class Evaluator:
                   'metrics: %s\n' % (len(tracker_list), len(seq_list), len(class_list), dataset_name,
                                      ', '.join(metric_names)))
 
-            # Evaluate each tracker
+            # Evaluate all (tracker, sequence) pairs together, loading the gt of each sequence once for all trackers
+            time_start = time.time()
+            seq_results, seq_errors = self._eval_sequences(dataset, tracker_list, seq_list, class_list, metrics_list,
+                                                           metric_names, show_progressbar)
+            if seq_errors and (config['BREAK_ON_ERROR'] or config['RETURN_ON_ERROR']):
+                # The evaluation stopped at the first tracker with an error, the trackers after it were not evaluated
+                # on all sequences
+                tracker_list = tracker_list[:tracker_list.index(next(iter(seq_errors))) + 1]
+
+            # Combine and output the results of each tracker
             for tracker in tracker_list:
                 # if not config['BREAK_ON_ERROR'] then go to next tracker without breaking
                 try:
-                    # Evaluate each sequence in parallel or in series.
-                    # returns a nested dict (res), indexed like: res[seq][class][metric_name][sub_metric field]
+                    # res is a nested dict, indexed like: res[seq][class][metric_name][sub_metric field]
                     # e.g. res[seq_0001][pedestrian][hota][DetA]
                     print('\nEvaluating %s\n' % tracker)
-                    time_start = time.time()
-                    if config['USE_PARALLEL']:
-                        if show_progressbar and TQDM_IMPORTED:
-                            seq_list_sorted = sorted(seq_list)
-
-                            with Pool(config['NUM_PARALLEL_CORES']) as pool, tqdm.tqdm(total=len(seq_list)) as pbar:
-                                _eval_sequence = partial(eval_sequence, dataset=dataset, tracker=tracker,
-                                                         class_list=class_list, metrics_list=metrics_list,
-                                                         metric_names=metric_names, save_path=config['SAVE_PATH'])
-                                results = []
-                                for r in pool.imap(_eval_sequence, seq_list_sorted,
-                                                   chunksize=20):
-                                    results.append(r)
-                                    pbar.update()
-                                res = dict(zip(seq_list_sorted, results))
-
-                        else:
-                            with Pool(config['NUM_PARALLEL_CORES']) as pool:
-                                _eval_sequence = partial(eval_sequence, dataset=dataset, tracker=tracker,
-                                                         class_list=class_list, metrics_list=metrics_list,
-                                                         metric_names=metric_names, save_path=config['SAVE_PATH'])
-                                results = pool.map(_eval_sequence, seq_list)
-                                res = dict(zip(seq_list, results))
-                    else:
-                        res = {}
-                        if show_progressbar and TQDM_IMPORTED:
-                            seq_list_sorted = sorted(seq_list)
-                            for curr_seq in tqdm.tqdm(seq_list_sorted):
-                                res[curr_seq] = eval_sequence(curr_seq, dataset, tracker, class_list, metrics_list,
-                                                              metric_names, config['SAVE_PATH'])
-                        else:
-                            for curr_seq in sorted(seq_list):
-                                res[curr_seq] = eval_sequence(curr_seq, dataset, tracker, class_list, metrics_list,
-                                                              metric_names, config['SAVE_PATH'])
+                    if tracker in seq_errors:
+                        err, remote_traceback = seq_errors[tracker]
+                        if err.__traceback__ is None:  # Raised in a pool worker
+                            err.__cause__ = _RemoteTraceback(remote_traceback)
+                        raise err
+                    res = seq_results[tracker]
+
+                    # Collect the id mappings returned with the HOTA results of each sequence
+                    self._collect_id_mappings(dataset_name, tracker, class_list, res)
 
                     # Combine results over all sequences and then over all classes
 
@@ -212,19 +230,194 @@ class Evaluator:
 
         return output_res, output_msg
 
+    def _eval_sequences(self, dataset, tracker_list, seq_list, class_list, metrics_list, metric_names,
+                        show_progressbar):
+        """Evaluates all trackers on all sequences of a dataset, in parallel or in series. The tasks are sequences with
+        (groups of) trackers, so that the gt of a sequence is loaded once for all the trackers evaluated with it.
+        Returns the results res[tracker][seq] and the errors {tracker: (exception, traceback text)} of the trackers
+        whose evaluation failed on a sequence, the error of each tracker being its first one in the sequence order and
+        the trackers being in the order of tracker_list.
+        With BREAK_ON_ERROR or RETURN_ON_ERROR, as when the trackers were evaluated one after the other, the trackers
+        after the first one with an error are not needed: they are no longer evaluated once an error is known, and the
+        evaluation stops as soon as the trackers before it have the results of all sequences.
+        """
+        config = self.config
+        stop_on_error = config['BREAK_ON_ERROR'] or config['RETURN_ON_ERROR']
+        use_progressbar = show_progressbar and TQDM_IMPORTED
+        # Sequence order of the results, as the sequences were evaluated before
+        seq_order = seq_list if config['USE_PARALLEL'] and not use_progressbar else sorted(seq_list)
+        seq_index = {seq: i for i, seq in enumerate(seq_order)}
+        tracker_index = {tracker: i for i, tracker in enumerate(tracker_list)}
+        results = {tracker: {} for tracker in tracker_list}
+        errors = {}
+
+        def collect(seq, task_results, task_errors):
+            for tracker, seq_res in task_results.items():
+                results[tracker][seq] = seq_res
+            for tracker, error in task_errors.items():
+                if tracker not in errors or seq_index[seq] < errors[tracker][0]:
+                    errors[tracker] = (seq_index[seq],) + error
+
+        def num_needed_trackers():
+            # The trackers up to the first one with an error are needed with stop_on_error, all of them otherwise
+            if not stop_on_error or not errors:
+                return len(tracker_list)
+            return min(tracker_index[tracker] for tracker in errors) + 1
+
+        if config['USE_PARALLEL']:
+            num_cores = config['NUM_PARALLEL_CORES']
+            # The trackers of each sequence are only split into groups (each loading the gt) when there are too few
+            # sequences to keep all the workers busy
+            num_groups = max(1, min(len(tracker_list), -(-4 * num_cores // max(1, len(seq_list)))))
+            tracker_groups = [tracker_list[i::num_groups] for i in range(num_groups)]
+            tasks = [(seq, trackers) for seq in seq_order for trackers in tracker_groups]
+            # Longest sequences first, one chunk of tasks at a time to the next idle worker
+            costs = [sum(dataset.get_seq_cost(tracker, seq) for tracker in trackers) for seq, trackers in tasks]
+            chunks = [[tasks[i] for i in chunk] for chunk in utils.get_cost_ordered_chunks(costs, num_cores)]
+            worker_times = {}
+            # The workers get the dataset once, inherited through fork (or pickled once per worker with spawn), and
+            # then only receive sequence and tracker names
+            initargs = (dataset, class_list, metrics_list, metric_names, stop_on_error, profiling.get_worker_settings())
+            with Pool(num_cores, initializer=_init_worker, initargs=initargs) as pool:
+                pool_start = time.perf_counter()
+                chunk_iter = pool.imap_unordered(_eval_worker_chunk, chunks)
+                pbar = tqdm.tqdm(total=len(tasks)) if use_progressbar else None
+                for worker, busy_time, chunk_results, profile_state in chunk_iter:
+                    for seq, task_results, task_errors in chunk_results:
+                        collect(seq, task_results, task_errors)
+                    if profile_state is not None:
+                        _timing.profiler.merge(profile_state)
+                    worker_time = worker_times.setdefault(worker, [0.0, 0])
+                    worker_time[0] += busy_time
+                    worker_time[1] += len(chunk_results)
+                    if pbar is not None:
+                        pbar.update(len(chunk_results))
+                    if stop_on_error and errors and all(len(results[tracker]) == len(seq_order)
+                                                        for tracker in tracker_list[:num_needed_trackers() - 1]):
+                        pool.terminate()
+                        break
+                if pbar is not None:
+                    pbar.close()
+                utilisation = utils.get_worker_utilisation(worker_times, time.perf_counter() - pool_start, num_cores)
+            self.worker_utilisation[dataset.get_name()] = utilisation
+            if config['TIME_PROGRESS']:
+                utils.print_worker_utilisation(utilisation, dataset.get_name())
+        else:
+            for seq in tqdm.tqdm(seq_order) if use_progressbar else seq_order:
+                # A tracker is not evaluated on the next sequences once it failed, as it then gets no results
+                trackers = [tracker for tracker in tracker_list[:num_needed_trackers()] if tracker not in errors]
+                if not trackers:
+                    break
+                collect(seq, *eval_sequence_trackers(seq, dataset, trackers, class_list, metrics_list, metric_names,
+                                                     stop_on_error))
+
+        # Results in the sequence order, as the metrics combine them in that order
+        results = {tracker: {seq: results[tracker][seq] for seq in seq_order if seq in results[tracker]}
+                   for tracker in tracker_list}
+        errors = {tracker: errors[tracker][1:] for tracker in tracker_list if tracker in errors}
+        return results, errors
+
+    def _collect_id_mappings(self, dataset_name, tracker, class_list, res):
+        """Removes the id mappings from the HOTA sequence results, appends them to the SAVE_PATH file and keeps them
+        with KEEP_ID_MAPPINGS"""
+        id_mappings = {cls: {} for cls in class_list}
+        save_list = []
+        for seq in sorted(res.keys()):
+            for cls in class_list:
+                if 'HOTA' in res[seq][cls] and 'id_mapping' in res[seq][cls]['HOTA']:
+                    id_mappings[cls][seq] = res[seq][cls]['HOTA'].pop('id_mapping')
+                    save_list.append(id_mappings[cls][seq])
+        if self.config['KEEP_ID_MAPPINGS']:
+            self.id_mappings.setdefault(dataset_name, {})[tracker] = id_mappings
+        if self.id_mapping_writer is not None:
+            self.id_mapping_writer.append(save_list)
+
+    def get_id_mappings(self):
+        """Returns the HOTA id mappings of the last evaluation with KEEP_ID_MAPPINGS, as
+        id_mappings[dataset][tracker][class][seq]"""
+        return self.id_mappings
+
+    def get_worker_utilisation(self):
+        """Returns the utilisation of the pool workers in the last parallel evaluation of each dataset (see
+        utils.get_worker_utilisation)"""
+        return self.worker_utilisation
+
+    def get_profile(self):
+        """Returns the timings of the last evaluation run with PROFILE (see profiling.Profiler.summary), None without
+        PROFILE"""
+        return None if self.profiler is None else self.profiler.summary()
+
+
+class _RemoteTraceback(Exception):
+    """Traceback of an exception raised while evaluating a sequence, set as the cause of the exception when it is raised
+    again for its tracker"""
+
+    def __init__(self, tb):
+        super().__init__()
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+_worker_context = {}
+
+
+def _init_worker(dataset, class_list, metrics_list, metric_names, stop_on_error, profile_settings):
+    """Pool initializer, keeps what eval_sequence needs in the worker so that the tasks are only sequence and tracker
+    names. The worker gets a profiler of its own if the parent has one."""
+    _worker_context.update(dataset=dataset, class_list=class_list, metrics_list=metrics_list,
+                           metric_names=metric_names, stop_on_error=stop_on_error)
+    profiling.init_worker(profile_settings)
+
+
+def _eval_worker_chunk(tasks):
+    """Evaluates a chunk of (sequence, trackers) tasks in a pool worker initialised by _init_worker. Returns the worker
+    process id, the time spent, the (seq, results, errors) of each task (see eval_sequence_trackers) and the timings of
+    the worker profiler (None without profiling)."""
+    start = time.perf_counter()
+    context = _worker_context
+    chunk_results = []
+    for seq, tracker_list in tasks:
+        task_results, task_errors = eval_sequence_trackers(seq, context['dataset'], tracker_list,
+                                                           context['class_list'], context['metrics_list'],
+                                                           context['metric_names'], context['stop_on_error'])
+        chunk_results.append((seq, task_results, task_errors))
+    return os.getpid(), time.perf_counter() - start, chunk_results, profiling.pop_worker_state()
+
+
+def eval_sequence_trackers(seq, dataset, tracker_list, class_list, metrics_list, metric_names, stop_on_error=False):
+    """Evaluates several trackers on a single sequence, loading its gt only once. Returns the results {tracker: seq_res}
+    and the errors {tracker: (exception, traceback text)} of the trackers that could not be evaluated. With
+    stop_on_error the trackers after the first one with an error (in the order of tracker_list) are not evaluated."""
+    results = {}
+    errors = {}
+    try:
+        raw_gt_data = dataset.get_raw_gt_seq_data(tracker_list[0], seq)
+    except Exception as err:
+        return results, dict.fromkeys(tracker_list, (err, traceback.format_exc()))
+    for tracker in tracker_list:
+        try:
+            results[tracker] = eval_sequence(seq, dataset, tracker, class_list, metrics_list, metric_names,
+                                             raw_gt_data)
+        except Exception as err:
+            errors[tracker] = (err, traceback.format_exc())
+            if stop_on_error:
+                break
+    return results, errors
+
 
 @_timing.time
-def eval_sequence(seq, dataset, tracker, class_list, metrics_list, metric_names, save_path):
-    """Function for evaluating a single sequence"""
+def eval_sequence(seq, dataset, tracker, class_list, metrics_list, metric_names, raw_gt_data=None):
+    """Function for evaluating a single sequence. raw_gt_data is the gt of the sequence if it is already loaded."""
 
-    raw_data = dataset.get_raw_seq_data(tracker, seq)
+    raw_data = dataset.get_raw_seq_data(tracker, seq, raw_gt_data)
     seq_res = {}
     for cls in class_list:
         seq_res[cls] = {}
-        data = dataset.get_preprocessed_seq_data(raw_data, cls)
+        with _timing.section('preprocess'):
+            data = dataset.get_preprocessed_seq_data(raw_data, cls)
         for metric, met_name in zip(metrics_list, metric_names):
-            if met_name == 'HOTA':
-                seq_res[cls][met_name] = metric.eval_sequence(data, save_path)
-            else:
+            with _timing.section(met_name):
                 seq_res[cls][met_name] = metric.eval_sequence(data)
     return seq_res
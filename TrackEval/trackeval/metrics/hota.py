@@ -4,7 +4,8 @@ import numpy as np
 from scipy.optimize import linear_sum_assignment
 from ._base_metric import _BaseMetric
 from .. import _timing
-from ..utils import save_id_mapping
+from .. import utils
+from ..utils import TrackEvalException
 
 
 class HOTA(_BaseMetric):
@@ -12,6 +13,16 @@ class HOTA(_BaseMetric):
     See: https://link.springer.com/article/10.1007/s11263-020-01375-2
     """
 
+    @staticmethod
+    def get_default_config():
+        """Default class config values"""
+        default_config = {
+            # 'lists': per frame lists of ids and matches, 'columnar': int32 arrays of the alpha=0.5 matches only
+            'ID_MAPPING_FORMAT': 'lists',
+            'PRINT_CONFIG': True,  # Whether to print the config information on init. Default: False.
+        }
+        return default_config
+
     def __init__(self, config=None):
         super().__init__()
         self.plottable = True
@@ -23,9 +34,19 @@ class HOTA(_BaseMetric):
         self.summary_fields = self.float_array_fields + self.float_fields
         self.id_mapping = {}
 
+        # Configuration options:
+        self.config = utils.init_config(config, self.get_default_config(), self.get_name())
+        self.id_mapping_format = self.config['ID_MAPPING_FORMAT']
+        if self.id_mapping_format not in ['lists', 'columnar']:
+            raise TrackEvalException('ID_MAPPING_FORMAT must be lists or columnar, not %s' % self.id_mapping_format)
+
     @_timing.time
-    def eval_sequence(self, data, save_path):
-        """Calculates the HOTA metrics for one sequence"""
+    def eval_sequence(self, data):
+        """Calculates the HOTA metrics for one sequence.
+        The gt-tracker id mapping of the sequence is returned under 'id_mapping' (if there are gt and tracker dets),
+        so that it is collected by the process combining the results.
+        """
+        self.id_mapping = {}
 
         # Initialise results
         res = {}
@@ -68,8 +89,15 @@ class HOTA(_BaseMetric):
 
         # Calculate overall jaccard alignment score (before unique matching) between IDs
         global_alignment_score = potential_matches_count / (gt_id_count + tracker_id_count - potential_matches_count)
-        matches_counts = [np.zeros_like(potential_matches_count) for _ in self.array_labels]
+        # A match passes the thresholds of the first num_alphas_passed alphas (similarity >= alpha - eps)
+        alpha_thresholds = self.array_labels - np.finfo('float').eps
+        # The id mapping results under target_alpha will be used for the temporal grounding
+        target_alpha = 0.5
+        target_a = int(np.flatnonzero(self.array_labels == target_alpha)[0])
 
+        matched_gt_ids = []
+        matched_tracker_ids = []
+        matched_num_alphas = []
         gt_ids_t_list = []
         tracker_ids_t_list = []
         match_rows_list = []
@@ -80,16 +108,14 @@ class HOTA(_BaseMetric):
         alpha_tracker_ids_t_list = []
         alpha_matches = []
         seen_pairs = set()
+        columnar = self.id_mapping_format == 'columnar'
+        gt_rows_arrays = []
+        matches_arrays = []
         # Calculate scores for each timestep
         for t, (gt_ids_t, tracker_ids_t) in enumerate(zip(data['gt_ids'], data['tracker_ids'])):
             # Deal with the case that there are no gt_det/tracker_det in a timestep.
-            if len(gt_ids_t) == 0:
-                for a, alpha in enumerate(self.array_labels):
-                    res['HOTA_FP'][a] += len(tracker_ids_t)
-                continue
-            if len(tracker_ids_t) == 0:
-                for a, alpha in enumerate(self.array_labels):
-                    res['HOTA_FN'][a] += len(gt_ids_t)
+            # Their FN and FP are counted for all timesteps at once below.
+            if len(gt_ids_t) == 0 or len(tracker_ids_t) == 0:
                 continue
 
             # Get matching scores between pairs of dets for optimizing HOTA
@@ -97,38 +123,56 @@ class HOTA(_BaseMetric):
             # score_mat[i][j] means the score between i-th detection of gt and j-th detection of tracker
             score_mat = global_alignment_score[gt_ids_t[:, np.newaxis], tracker_ids_t[np.newaxis, :]] * similarity
 
-            gt_ids_t_list.append((t, gt_ids_t.tolist()))
-            tracker_ids_t_list.append((t, tracker_ids_t.tolist()))
-
             # Hungarian algorithm to find best matches
             match_rows, match_cols = linear_sum_assignment(-score_mat)
-            match_rows_list.append((t, match_rows.tolist()))
-            match_cols_list.append((t, match_cols.tolist()))
-
-            # The id mapping results under target_alpha will be used for the temporal grounding
-            target_alpha = 0.5
-            # Calculate and accumulate basic statistics
-            for a, alpha in enumerate(self.array_labels):
-                actually_matched_mask = similarity[match_rows, match_cols] >= alpha - np.finfo('float').eps
-                alpha_match_rows = match_rows[actually_matched_mask]
-                alpha_match_cols = match_cols[actually_matched_mask]
-                num_matches = len(alpha_match_rows)
-                res['HOTA_TP'][a] += num_matches
-                res['HOTA_FN'][a] += len(gt_ids_t) - num_matches
-                res['HOTA_FP'][a] += len(tracker_ids_t) - num_matches
-                if num_matches > 0:
-                    res['LocA'][a] += sum(similarity[alpha_match_rows, alpha_match_cols])
-                    matches_counts[a][gt_ids_t[alpha_match_rows], tracker_ids_t[alpha_match_cols]] += 1
-                if alpha == target_alpha and len(alpha_match_rows) > 0 and len(alpha_match_cols) > 0:
-                    alpha_match_rows_list.append((t, alpha_match_rows.tolist()))
-                    alpha_match_cols_list.append((t, alpha_match_cols.tolist()))
-                    alpha_gt_ids_t_list.append((t, gt_ids_t.tolist()))
-                    alpha_tracker_ids_t_list.append((t, tracker_ids_t.tolist()))
-                    for row_id, col_id in zip(alpha_match_rows, alpha_match_cols):
-                        pair = (row_id, col_id)
-                        if pair not in seen_pairs:
-                            seen_pairs.add(pair)
-                            alpha_matches.append((t, int(row_id), int(col_id)))
+            if columnar:
+                gt_rows_arrays.append(np.stack([np.full(len(gt_ids_t), t), np.arange(len(gt_ids_t)), gt_ids_t], 1))
+            else:
+                gt_ids_t_list.append((t, gt_ids_t.tolist()))
+                tracker_ids_t_list.append((t, tracker_ids_t.tolist()))
+                match_rows_list.append((t, match_rows.tolist()))
+                match_cols_list.append((t, match_cols.tolist()))
+
+            # Accumulate the matches of all alphas at once: match i counts for alpha a if a < num_alphas_passed[i]
+            match_similarity = similarity[match_rows, match_cols]
+            num_alphas_passed = np.searchsorted(alpha_thresholds, match_similarity, side='right')
+            alpha_mask = np.arange(len(self.array_labels))[:, np.newaxis] < num_alphas_passed[np.newaxis, :]
+            # Summed sequentially in match order for each alpha (as sum() would), so LocA is not changed by rounding
+            res['LocA'] += np.cumsum(np.where(alpha_mask, match_similarity, 0), axis=1)[:, -1]
+            matched_gt_ids.append(gt_ids_t[match_rows])
+            matched_tracker_ids.append(tracker_ids_t[match_cols])
+            matched_num_alphas.append(num_alphas_passed)
+
+            target_mask = alpha_mask[target_a]
+            if not target_mask.any():
+                continue
+            alpha_match_rows = match_rows[target_mask]
+            alpha_match_cols = match_cols[target_mask]
+            if columnar:
+                matches_arrays.append(np.stack([np.full(len(alpha_match_rows), t), alpha_match_rows, alpha_match_cols,
+                                                gt_ids_t[alpha_match_rows], tracker_ids_t[alpha_match_cols]], 1))
+            else:
+                alpha_match_rows_list.append((t, alpha_match_rows.tolist()))
+                alpha_match_cols_list.append((t, alpha_match_cols.tolist()))
+                alpha_gt_ids_t_list.append((t, gt_ids_t.tolist()))
+                alpha_tracker_ids_t_list.append((t, tracker_ids_t.tolist()))
+                for row_id, col_id in zip(alpha_match_rows, alpha_match_cols):
+                    pair = (row_id, col_id)
+                    if pair not in seen_pairs:
+                        seen_pairs.add(pair)
+                        alpha_matches.append((t, int(row_id), int(col_id)))
+
+        # Count the matches between each gt_id and tracker_id for each alpha: histogram the matches by the number of
+        # alphas they pass, then sum from the highest number down
+        num_alphas = len(self.array_labels)
+        alpha_hist = np.zeros((num_alphas + 1, data['num_gt_ids'], data['num_tracker_ids']))
+        if len(matched_num_alphas) > 0:
+            np.add.at(alpha_hist, (np.concatenate(matched_num_alphas), np.concatenate(matched_gt_ids),
+                                   np.concatenate(matched_tracker_ids)), 1)
+        matches_counts = np.cumsum(alpha_hist[::-1], axis=0)[::-1][1:]
+        res['HOTA_TP'] = matches_counts.sum(axis=(1, 2))
+        res['HOTA_FN'] = data['num_gt_dets'] - res['HOTA_TP']
+        res['HOTA_FP'] = data['num_tracker_dets'] - res['HOTA_TP']
 
         # Calculate association scores (AssA, AssRe, AssPr) for the alpha value.
         # First calculate scores per gt_id/tracker_id combo and then average over the number of detections.
@@ -145,6 +189,20 @@ class HOTA(_BaseMetric):
         res['LocA'] = np.maximum(1e-10, res['LocA']) / np.maximum(1e-10, res['HOTA_TP'])
         res = self._compute_final_fields(res)
 
+        if columnar:
+            self.id_mapping = {
+                'seq': data['seq'],
+                'format': 'columnar',
+                'unique_gt_ids': np.asarray(data['unique_gt_ids'], dtype=np.int32),
+                'unique_tracker_ids': np.asarray(data['unique_tracker_ids'], dtype=np.int32),
+                # [t, row, gt_idx] of every gt det in the frames with gt and tracker dets
+                'gt_rows': self._stack_int32(gt_rows_arrays, 3),
+                # [t, row, col, gt_idx, tracker_idx] of the matches at alpha = 0.5
+                'matches': self._stack_int32(matches_arrays, 5),
+            }
+            res['id_mapping'] = self.id_mapping
+            return res
+
         self.id_mapping = {
             'seq': data['seq'],
             'unique_gt_ids': data['unique_gt_ids'].tolist(),
@@ -159,9 +217,15 @@ class HOTA(_BaseMetric):
             'alpha_tracker_ids_t_list': alpha_tracker_ids_t_list,
             'alpha_row_col_matches': alpha_matches
         }
-        save_id_mapping(self.id_mapping, save_path)
+        res['id_mapping'] = self.id_mapping
         return res
 
+    @staticmethod
+    def _stack_int32(arrays, num_columns):
+        if len(arrays) == 0:
+            return np.empty((0, num_columns), dtype=np.int32)
+        return np.concatenate(arrays).astype(np.int32)
+
     def combine_sequences(self, all_res):
         """Combines metrics across all sequences"""
         res = {}
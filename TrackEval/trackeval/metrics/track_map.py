@@ -1,7 +1,6 @@
 import numpy as np
 from ._base_metric import _BaseMetric
 from .. import _timing
-from functools import partial
 from .. import utils
 from ..utils import TrackEvalException
 
@@ -347,88 +346,110 @@ class TrackMAP(_BaseMetric):
         return track_ig_masks
 
     @staticmethod
-    def _compute_bb_track_iou(dt_track, gt_track, boxformat='xywh'):
+    def _get_frame_tracks(tracks):
         """
-        Calculates the track IoU for one detected track and one ground truth track for bounding boxes
-        :param dt_track: the detected track (format: dictionary with frame index as keys and
-                            numpy arrays as values)
-        :param gt_track: the ground truth track (format: dictionary with frame index as keys and
-                        numpy array as values)
+        Groups the boxes (or masks) of a set of tracks by frame
+        :param tracks: list of tracks (format: dictionary with frame index as keys and boxes or masks as values)
+        :return: dictionary with frame index as keys and (indices of the tracks present in the frame, their boxes or
+                    masks) as values. A track is present at most once per frame.
+        """
+        frame_tracks = {}
+        for track_idx, track in enumerate(tracks):
+            for frame, value in track.items():
+                if value is None:
+                    continue
+                track_ids, values = frame_tracks.setdefault(frame, ([], []))
+                track_ids.append(track_idx)
+                values.append(value)
+        return frame_tracks
+
+    @staticmethod
+    def _compute_bb_track_ious(dt, gt, boxformat='xywh'):
+        """
+        Calculates the track IoUs of all pairs of detected and ground truth tracks for bounding boxes. The union of two
+        tracks is the sum of their box areas minus their intersection, so only the frames in which tracks of both sets
+        are present are aligned, with the intersections of all their boxes computed at once.
+        :param dt: the detected tracks (format: dictionary with frame index as keys and numpy arrays as values)
+        :param gt: the ground truth tracks (format: dictionary with frame index as keys and numpy arrays as values)
         :param boxformat: the format of the boxes
-        :return: the track IoU
+        :return: the track IoUs, as an array of shape (len(dt), len(gt))
         """
-        intersect = 0
-        union = 0
-        image_ids = set(gt_track.keys()) | set(dt_track.keys())
-        for image in image_ids:
-            g = gt_track.get(image, None)
-            d = dt_track.get(image, None)
+        if boxformat not in ('xywh', 'x0y0x1y1'):
+            raise TrackEvalException('BoxFormat not implemented')
+
+        def get_corners_and_areas(boxes):
+            boxes = np.array(boxes, dtype=float).reshape(-1, 4)
             if boxformat == 'xywh':
-                if d is not None and g is not None:
-                    dx, dy, dw, dh = d
-                    gx, gy, gw, gh = g
-                    w = max(min(dx + dw, gx + gw) - max(dx, gx), 0)
-                    h = max(min(dy + dh, gy + gh) - max(dy, gy), 0)
-                    i = w * h
-                    u = dw * dh + gw * gh - i
-                    intersect += i
-                    union += u
-                elif d is None and g is not None:
-                    union += g[2] * g[3]
-                elif d is not None and g is None:
-                    union += d[2] * d[3]
-            elif boxformat == 'x0y0x1y1':
-                if d is not None and g is not None:
-                    dx0, dy0, dx1, dy1 = d
-                    gx0, gy0, gx1, gy1 = g
-                    w = max(min(dx1, gx1) - max(dx0, gx0), 0)
-                    h = max(min(dy1, gy1) - max(dy0, gy0), 0)
-                    i = w * h
-                    u = (dx1 - dx0) * (dy1 - dy0) + (gx1 - gx0) * (gy1 - gy0) - i
-                    intersect += i
-                    union += u
-                elif d is None and g is not None:
-                    union += (g[2] - g[0]) * (g[3] - g[1])
-                elif d is not None and g is None:
-                    union += (d[2] - d[0]) * (d[3] - d[1])
+                areas = boxes[:, 2] * boxes[:, 3]
+                boxes[:, 2:] += boxes[:, :2]
             else:
-                raise TrackEvalException('BoxFormat not implemented')
-        if intersect > union:
+                areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+            return boxes, areas
+
+        intersect = np.zeros([len(dt), len(gt)])
+        dt_areas = np.zeros(len(dt))
+        gt_areas = np.zeros(len(gt))
+        gt_frames = {}
+        for frame, (gt_idx, gt_boxes) in TrackMAP._get_frame_tracks(gt).items():
+            gt_boxes, areas = get_corners_and_areas(gt_boxes)
+            gt_areas[gt_idx] += areas
+            gt_frames[frame] = gt_idx, gt_boxes
+        for frame, (dt_idx, dt_boxes) in TrackMAP._get_frame_tracks(dt).items():
+            dt_boxes, areas = get_corners_and_areas(dt_boxes)
+            dt_areas[dt_idx] += areas
+            if frame not in gt_frames:
+                continue
+            gt_idx, gt_boxes = gt_frames[frame]
+            w = np.maximum(np.minimum(dt_boxes[:, np.newaxis, 2], gt_boxes[np.newaxis, :, 2]) -
+                           np.maximum(dt_boxes[:, np.newaxis, 0], gt_boxes[np.newaxis, :, 0]), 0)
+            h = np.maximum(np.minimum(dt_boxes[:, np.newaxis, 3], gt_boxes[np.newaxis, :, 3]) -
+                           np.maximum(dt_boxes[:, np.newaxis, 1], gt_boxes[np.newaxis, :, 1]), 0)
+            intersect[np.ix_(dt_idx, gt_idx)] += w * h
+
+        union = dt_areas[:, np.newaxis] + gt_areas[np.newaxis, :] - intersect
+        if np.any(intersect > union):
             raise TrackEvalException("Intersection value > union value. Are the box values corrupted?")
-        return intersect / union if union > 0 else 0
+        return np.divide(intersect, union, out=np.zeros_like(intersect), where=union > 0)
 
     @staticmethod
-    def _compute_mask_track_iou(dt_track, gt_track):
+    def _compute_mask_track_ious(dt, gt):
         """
-        Calculates the track IoU for one detected track and one ground truth track for segmentation masks
-        :param dt_track: the detected track (format: dictionary with frame index as keys and
-                            pycocotools rle encoded masks as values)
-        :param gt_track: the ground truth track (format: dictionary with frame index as keys and
-                            pycocotools rle encoded masks as values)
-        :return: the track IoU
+        Calculates the track IoUs of all pairs of detected and ground truth tracks for segmentation masks. As for boxes,
+        the union of two tracks is the sum of their mask areas minus their intersection, and the intersections of all
+        masks of a frame are computed in one pycocotools call.
+        :param dt: the detected tracks (format: dictionary with frame index as keys and pycocotools rle encoded masks
+                    as values)
+        :param gt: the ground truth tracks (format: dictionary with frame index as keys and pycocotools rle encoded
+                    masks as values)
+        :return: the track IoUs, as an array of shape (len(dt), len(gt))
         """
         # only loaded when needed to reduce minimum requirements
         from pycocotools import mask as mask_utils
 
-        intersect = .0
-        union = .0
-        image_ids = set(gt_track.keys()) | set(dt_track.keys())
-        for image in image_ids:
-            g = gt_track.get(image, None)
-            d = dt_track.get(image, None)
-            if d and g:
-                intersect += mask_utils.area(mask_utils.merge([d, g], True))
-                union += mask_utils.area(mask_utils.merge([d, g], False))
-            elif not d and g:
-                union += mask_utils.area(g)
-            elif d and not g:
-                union += mask_utils.area(d)
-        if union < 0.0 - np.finfo('float').eps:
+        intersect = np.zeros([len(dt), len(gt)])
+        dt_areas = np.zeros(len(dt))
+        gt_areas = np.zeros(len(gt))
+        # Empty values are missing masks
+        dt_frames = TrackMAP._get_frame_tracks([{frame: m for frame, m in track.items() if m} for track in dt])
+        gt_frames = TrackMAP._get_frame_tracks([{frame: m for frame, m in track.items() if m} for track in gt])
+        for frame, (gt_idx, gt_masks) in gt_frames.items():
+            gt_areas[gt_idx] += mask_utils.area(gt_masks)
+        for frame, (dt_idx, dt_masks) in dt_frames.items():
+            areas = mask_utils.area(dt_masks).astype(float)
+            dt_areas[dt_idx] += areas
+            if frame not in gt_frames:
+                continue
+            gt_idx, gt_masks = gt_frames[frame]
+            # With iscrowd the IoU is the intersection over the area of the detected mask
+            ious = np.asarray(mask_utils.iou(dt_masks, gt_masks, [1] * len(gt_masks)))
+            intersect[np.ix_(dt_idx, gt_idx)] += np.rint(ious * areas[:, np.newaxis])
+
+        union = dt_areas[:, np.newaxis] + gt_areas[np.newaxis, :] - intersect
+        if np.any(union < 0.0 - np.finfo('float').eps):
             raise TrackEvalException("Union value < 0. Are the segmentaions corrupted?")
-        if intersect > union:
+        if np.any(intersect > union):
             raise TrackEvalException("Intersection value > union value. Are the segmentations corrupted?")
-        iou = intersect / union if union > 0.0 + np.finfo('float').eps else 0.0
-        return iou
+        return np.divide(intersect, union, out=np.zeros_like(intersect), where=union > 0.0 + np.finfo('float').eps)
 
     @staticmethod
     def _compute_track_ious(dt, gt, iou_function='bbox', boxformat='xywh'):
@@ -440,17 +461,12 @@ class TrackMAP(_BaseMetric):
             return []
 
         if iou_function == 'bbox':
-            track_iou_function = partial(TrackMAP._compute_bb_track_iou, boxformat=boxformat)
+            return TrackMAP._compute_bb_track_ious(dt, gt, boxformat=boxformat)
         elif iou_function == 'mask':
-            track_iou_function = partial(TrackMAP._compute_mask_track_iou)
+            return TrackMAP._compute_mask_track_ious(dt, gt)
         else:
             raise Exception('IoU function not implemented')
 
-        ious = np.zeros([len(dt), len(gt)])
-        for i, j in np.ndindex(ious.shape):
-            ious[i, j] = track_iou_function(dt[i], gt[j])
-        return ious
-
     @staticmethod
     def _row_print(*argv):
         """Prints results in an evenly spaced rows, with more space in first row"""
@@ -0,0 +1,178 @@
+"""Structured profiling of evaluations.
+
+A Profiler collects, for every function decorated with _timing.time (e.g. 'HOTA.eval_sequence') and every stage
+section (_timing.section: 'load', 'similarity', 'preprocess' and the name of each metric), the number of calls, the
+total / min / max time and a histogram of the call durations. With trace, every call is also kept for a Chrome trace
+(chrome://tracing or https://ui.perfetto.dev).
+
+Timings are only collected while a profiler is active (see activate), otherwise the decorated functions and sections
+cost a global lookup. Pool workers get a profiler of their own (init_worker, with the settings of the parent from
+get_worker_settings) whose state is sent back with their results (pop_worker_state) and merged into the parent
+profiler (Profiler.merge).
+
+Example:
+    profiler = Profiler(trace=True)
+    with activate(profiler):
+        evaluator.evaluate(dataset_list, metrics_list)
+    profiler.save('profile')  # profile.json, profile.csv and trace.json
+"""
+import bisect
+import contextlib
+import csv
+import json
+import os
+from time import perf_counter
+
+from . import _timing
+
+# Upper bounds (in seconds) of the buckets of the duration histograms, 4 per decade from 1 microsecond to 100 seconds.
+# The last bucket holds the longer durations.
+HISTOGRAM_BOUNDS = [10 ** (exponent / 4) for exponent in range(-24, 9)]
+
+_KIND, _COUNT, _TOTAL, _MIN, _MAX, _HISTOGRAM = range(6)
+
+
+class Profiler:
+    """Counters and duration histograms of the profiled functions and stages"""
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.pid = os.getpid()
+        self.stats = {}  # name: [kind, count, total, min, max, histogram counts]
+        self.events = []  # (kind, name, pid, start, duration) of each call, if trace
+
+    def record(self, name, start, end, kind='function'):
+        """Records a call of a function (or a stage) that ran from start to end (perf_counter values)"""
+        duration = end - start
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = [kind, 0, 0.0, duration, duration, [0] * (len(HISTOGRAM_BOUNDS) + 1)]
+        stat[_COUNT] += 1
+        stat[_TOTAL] += duration
+        if duration < stat[_MIN]:
+            stat[_MIN] = duration
+        if duration > stat[_MAX]:
+            stat[_MAX] = duration
+        stat[_HISTOGRAM][bisect.bisect_left(HISTOGRAM_BOUNDS, duration)] += 1
+        if self.trace:
+            self.events.append((kind, name, self.pid, start, duration))
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        """Context manager recording the time spent in a stage"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, perf_counter(), kind='stage')
+
+    def pop_state(self):
+        """Returns the collected timings (to be merged into another profiler) and resets them"""
+        state = {'stats': self.stats, 'events': self.events}
+        self.stats = {}
+        self.events = []
+        return state
+
+    def merge(self, state):
+        """Adds the timings returned by pop_state of another profiler, e.g. the one of a pool worker"""
+        for name, other in state['stats'].items():
+            stat = self.stats.get(name)
+            if stat is None:
+                self.stats[name] = [other[_KIND], other[_COUNT], other[_TOTAL], other[_MIN], other[_MAX],
+                                    list(other[_HISTOGRAM])]
+                continue
+            stat[_COUNT] += other[_COUNT]
+            stat[_TOTAL] += other[_TOTAL]
+            stat[_MIN] = min(stat[_MIN], other[_MIN])
+            stat[_MAX] = max(stat[_MAX], other[_MAX])
+            stat[_HISTOGRAM] = [a + b for a, b in zip(stat[_HISTOGRAM], other[_HISTOGRAM])]
+        if self.trace:
+            self.events.extend(state['events'])
+
+    @staticmethod
+    def _get_quantile(histogram, count, quantile):
+        """Upper bound of the histogram bucket holding the given quantile of the durations"""
+        rank = quantile * count
+        seen = 0
+        for bucket, bucket_count in enumerate(histogram):
+            seen += bucket_count
+            if seen >= rank:
+                return HISTOGRAM_BOUNDS[bucket] if bucket < len(HISTOGRAM_BOUNDS) else float('inf')
+        return float('inf')
+
+    def summary(self):
+        """Timings of the stages and functions, as {'stages': {name: fields}, 'functions': {name: fields}}.
+        The p50 / p90 / p99 fields are the upper bounds of the histogram buckets holding these quantiles."""
+        summary = {'stages': {}, 'functions': {}, 'histogram_bounds': HISTOGRAM_BOUNDS}
+        for name, stat in sorted(self.stats.items(), key=lambda item: -item[1][_TOTAL]):
+            count = stat[_COUNT]
+            summary['stages' if stat[_KIND] == 'stage' else 'functions'][name] = {
+                'count': count,
+                'total_seconds': stat[_TOTAL],
+                'mean_seconds': stat[_TOTAL] / count,
+                'min_seconds': stat[_MIN],
+                'max_seconds': stat[_MAX],
+                'p50_seconds': self._get_quantile(stat[_HISTOGRAM], count, 0.5),
+                'p90_seconds': self._get_quantile(stat[_HISTOGRAM], count, 0.9),
+                'p99_seconds': self._get_quantile(stat[_HISTOGRAM], count, 0.99),
+                'histogram': stat[_HISTOGRAM],
+            }
+        return summary
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=4)
+
+    def write_csv(self, path):
+        fields = ['count', 'total_seconds', 'mean_seconds', 'min_seconds', 'max_seconds', 'p50_seconds', 'p90_seconds',
+                  'p99_seconds']
+        summary = self.summary()
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['kind', 'name'] + fields)
+            for kind, section in (('stage', summary['stages']), ('function', summary['functions'])):
+                for name, timings in section.items():
+                    writer.writerow([kind, name] + [timings[field] for field in fields])
+
+    def write_chrome_trace(self, path):
+        """Writes the calls kept with trace in the Chrome trace event format, one row per process"""
+        trace_events = [{'name': name, 'cat': kind, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': pid,
+                         'tid': pid} for kind, name, pid, start, duration in self.events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+    def save(self, folder):
+        """Writes profile.json, profile.csv and (with trace) trace.json to a folder"""
+        os.makedirs(folder, exist_ok=True)
+        self.write_json(os.path.join(folder, 'profile.json'))
+        self.write_csv(os.path.join(folder, 'profile.csv'))
+        if self.trace:
+            self.write_chrome_trace(os.path.join(folder, 'trace.json'))
+
+
+@contextlib.contextmanager
+def activate(profiler):
+    """Context manager collecting the timings of the decorated functions and sections in profiler (None to collect
+    nothing)"""
+    previous = _timing.profiler
+    _timing.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _timing.profiler = previous
+
+
+def get_worker_settings():
+    """Profiler settings of pool workers, to be given to init_worker: None if no profiler is active, otherwise whether
+    calls are traced"""
+    return None if _timing.profiler is None else _timing.profiler.trace
+
+
+def init_worker(settings):
+    """Gives a pool worker a profiler of its own if the parent has one (settings from get_worker_settings)"""
+    _timing.profiler = None if settings is None else Profiler(settings)
+
+
+def pop_worker_state():
+    """Timings collected by the profiler of a pool worker since the last call, None if it has none"""
+    return None if _timing.profiler is None else _timing.profiler.pop_state()
@@ -1,7 +1,11 @@
 import json
 import os
 import csv
+import time
+import uuid
+import pickle
 import argparse
+import numpy as np
 from collections import OrderedDict
 
 
@@ -141,11 +145,144 @@ def load_detail(file):
     return data
 
 def save_id_mapping(content, save_path):
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    file_exists = os.path.isfile(save_path)
-    id_mapping_str = json.dumps(content, ensure_ascii=False)
-    with open(save_path, 'a' if file_exists else 'w', encoding='utf-8') as f:
-        f.write(id_mapping_str + '\n')
+    """Appends the id mapping of one sequence to save_path"""
+    save_id_mappings([content], save_path)
+
+
+def save_id_mappings(id_mappings, save_path):
+    """Appends id mappings to save_path, as one pickle frame each for .pkl files, as concatenated int32 columns for .npz
+    files (columnar id mappings only) and one json line each otherwise"""
+    if len(id_mappings) == 0:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok=True)
+    if save_path.endswith('.npz'):
+        save_columnar_id_mappings(id_mappings, save_path)
+    elif save_path.endswith('.pkl'):
+        with open(save_path, 'ab') as f:
+            for id_mapping in id_mappings:
+                pickle.dump(id_mapping, f, protocol=pickle.HIGHEST_PROTOCOL)
+    else:
+        if any(id_mapping.get('format') == 'columnar' for id_mapping in id_mappings):
+            raise TrackEvalException('Columnar id mappings can only be saved to .npz or .pkl files.')
+        with open(save_path, 'a', encoding='utf-8') as f:
+            for id_mapping in id_mappings:
+                f.write(json.dumps(id_mapping, ensure_ascii=False) + '\n')
+
+
+COLUMNAR_ID_MAPPING_KEYS = ['unique_gt_ids', 'unique_tracker_ids', 'gt_rows', 'matches']
+
+
+def save_columnar_id_mappings(id_mappings, save_path):
+    """Appends columnar id mappings to a .npz file.
+    The arrays of all sequences are concatenated per key, the rows of the i-th sequence (seqs[i]) of a key are
+    key[key_offsets[i]:key_offsets[i + 1]].
+    """
+    if any(id_mapping.get('format') != 'columnar' for id_mapping in id_mappings):
+        raise TrackEvalException('Only columnar id mappings can be saved to .npz files.')
+    seqs = [id_mapping['seq'] for id_mapping in id_mappings]
+    columns = {key: [id_mapping[key] for id_mapping in id_mappings] for key in COLUMNAR_ID_MAPPING_KEYS}
+    if os.path.isfile(save_path):
+        # npz files can not be appended to, so previously saved sequences are rewritten
+        with np.load(save_path) as previous:
+            seqs = previous['seqs'].tolist() + seqs
+            for key in COLUMNAR_ID_MAPPING_KEYS:
+                offsets = previous[key + '_offsets']
+                columns[key] = np.split(previous[key], offsets[1:-1]) + columns[key]
+
+    arrays = {'seqs': np.array(seqs, dtype=str)}
+    for key in COLUMNAR_ID_MAPPING_KEYS:
+        arrays[key] = np.concatenate(columns[key]).astype(np.int32)
+        arrays[key + '_offsets'] = np.cumsum([0] + [len(column) for column in columns[key]], dtype=np.int64)
+    np.savez(save_path, **arrays)
+
+
+def check_id_mapping_path(save_path, id_mapping_format):
+    """Raises a TrackEvalException if id mappings of a HOTA ID_MAPPING_FORMAT can not be saved to save_path (see
+    save_id_mappings), so that the evaluation fails before computing anything"""
+    if save_path is None:
+        return
+    if id_mapping_format == 'columnar' and not save_path.endswith(('.npz', '.pkl')):
+        raise TrackEvalException('Columnar id mappings can only be saved to .npz or .pkl files, not %s.' % save_path)
+    if id_mapping_format != 'columnar' and save_path.endswith('.npz'):
+        raise TrackEvalException('Only columnar id mappings can be saved to .npz files, not %s ones.'
+                                 % id_mapping_format)
+
+
+class IdMappingWriter:
+    """Appends the id mappings of an evaluation to save_path with save_id_mappings. A .npz file is rewritten on every
+    append, so the id mappings of .npz files are kept until close() and written at once."""
+
+    def __init__(self, save_path):
+        self.save_path = save_path
+        self.pending = []
+
+    def append(self, id_mappings):
+        if self.save_path.endswith('.npz'):
+            self.pending += id_mappings
+        else:
+            save_id_mappings(id_mappings, self.save_path)
+
+    def close(self):
+        if self.pending:
+            save_id_mappings(self.pending, self.save_path)
+            self.pending = []
+
+
+def get_unique_save_path(save_path):
+    """Inserts a suffix unique to this run (time, process id and a random part) before the extension of save_path"""
+    root, ext = os.path.splitext(save_path)
+    return '%s_%s_%i_%s%s' % (root, time.strftime('%Y%m%d-%H%M%S'), os.getpid(), uuid.uuid4().hex[:8], ext)
+
+
+def get_cost_ordered_chunks(costs, num_workers, chunks_per_worker=4):
+    """Groups tasks into chunks for a process pool, from their estimated costs.
+    Tasks are taken longest-first: a task costing more than total_cost / (num_workers * chunks_per_worker) gets a chunk
+    of its own, and the lighter tasks are packed in order into chunks of up to that cost. Dispatched one chunk at a
+    time (imap_unordered with chunksize 1) in the returned order, the heavy sequences start first and idle workers take
+    the next chunk, so that no worker is left with a long sequence at the end.
+    Returns the chunks as lists of task indices.
+    """
+    order = sorted(range(len(costs)), key=lambda i: -costs[i])
+    max_chunk_cost = sum(costs) / max(1, num_workers * chunks_per_worker)
+    chunks = []
+    chunk = []
+    chunk_cost = 0
+    for i in order:
+        if chunk and chunk_cost + costs[i] > max_chunk_cost:
+            chunks.append(chunk)
+            chunk = []
+            chunk_cost = 0
+        chunk.append(i)
+        chunk_cost += costs[i]
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def get_worker_utilisation(worker_times, wall_time, num_workers):
+    """Utilisation of the num_workers workers of a pool, from worker_times[worker] = [busy seconds, number of tasks] and
+    the wall time of the pool. The workers that returned no task (missing from worker_times) are reported as 'idle-i'
+    with no busy time, and count in the mean utilisation."""
+    worker_times = sorted(worker_times.items())
+    worker_times += [('idle-%i' % (i + 1), (0.0, 0)) for i in range(num_workers - len(worker_times))]
+    workers = {}
+    for worker, (busy_time, num_tasks) in worker_times:
+        workers[worker] = {'busy_seconds': busy_time, 'tasks': num_tasks,
+                           'utilisation': busy_time / wall_time if wall_time > 0 else 0.0}
+    return {
+        'wall_seconds': wall_time,
+        'workers': workers,
+        'mean_utilisation': float(np.mean([w['utilisation'] for w in workers.values()])) if workers else 0.0,
+    }
+
+
+def print_worker_utilisation(utilisation, title=''):
+    print('\nWorker utilisation%s (%.2f seconds):' % (title and ' of ' + title, utilisation['wall_seconds']))
+    for worker, times in utilisation['workers'].items():
+        print('    worker %-10s %4i tasks %8.2f seconds busy %6.1f%%' % (
+            worker, times['tasks'], times['busy_seconds'], 100 * times['utilisation']))
+    print('    mean %45.1f%%' % (100 * utilisation['mean_utilisation']))
+
 
 class TrackEvalException(Exception):
     """Custom exception for catching expected errors."""
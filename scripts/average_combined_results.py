@@ -20,6 +20,23 @@ def average_dicts(dicts):
     return avg
 
 
+def compute_mean_result(results):
+    """Average the per-dataset combined results and prepend the m-HIoU ranking metric"""
+    mean_result = average_dicts(results)
+
+    hota = mean_result.get("HOTA", None)
+    miou = mean_result.get("mIoU", None)
+    if hota is None or miou is None:
+        raise ValueError("Missing 'HOTA' or 'mIoU' key in averaged result.")
+    m_hiou = round((hota + miou) / 2, 3)
+
+    ordered_result = OrderedDict()
+    ordered_result["m-HIoU"] = m_hiou
+    for k, v in mean_result.items():
+        ordered_result[k] = v
+    return ordered_result
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Average combined results")
     parser.add_argument('--ovis_result', type=str, default='', help='OVIS combined result json file')
@@ -37,24 +54,13 @@ if __name__ == '__main__':
         sys.exit(1)
 
     results = [load_result(f) for f in single_files]
-    mean_result = average_dicts(results)
 
     try:
-        hota = mean_result.get("HOTA", None)
-        miou = mean_result.get("mIoU", None)
-        if hota is not None and miou is not None:
-            m_hiou = round((hota + miou) / 2, 3)
-        else:
-            raise ValueError("Missing 'HOTA' or 'mIoU' key in averaged result.")
+        ordered_result = compute_mean_result(results)
     except Exception as e:
         print(f"❌ Failed to calculate m-HIoU: {e}")
         sys.exit(1)
 
-    ordered_result = OrderedDict()
-    ordered_result["m-HIoU"] = m_hiou
-    for k, v in mean_result.items():
-        ordered_result[k] = v
-
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(ordered_result, f, indent=4)
 
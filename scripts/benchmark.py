@@ -0,0 +1,341 @@
+"""
+End-to-end benchmark of the SVAG evaluation.
+
+Evaluates a submission on synthetic data (see synthetic_svag.py, generated with the given parameters) or on an existing
+data root, timing each stage of the serial evaluation separately:
+    loading      reading the ground truth (through the GT cache unless --no_gt_cache) and the gt / predicted boxes of
+                 each sequence
+    conversion   parsing submission.json and indexing the predictions by sequence
+    similarity   box IoUs between the gt and predicted boxes of each frame
+    hota         HOTA matching of each sequence, combined per sub-dataset
+    id_mapping   writing the HOTA id mapping file (the mapping itself is computed by the HOTA matching)
+    temporal     temporal grounding metrics of each sub-dataset
+    averaging    average of the sub-dataset results and m-HIoU
+followed by a full SVAGEvaluator.evaluate run (end_to_end, on --num_parallel_cores cores) whose result must match the
+staged one. Each stage reports its best time over --repeat runs, its throughput (in the unit of the stage) and the peak
+RSS of the process during the stage (the peak of the whole run where it cannot be reset, i.e. outside Linux).
+
+The report is written as JSON. Given the report of an earlier run (--baseline), the stages that got slower by more than
+--tolerance are listed and the script exits with code 1.
+
+Example:
+    python benchmark.py --num_videos 10 --queries_per_video 20 --num_frames 600 --report ../results/benchmark.json
+    python benchmark.py --num_videos 10 --queries_per_video 20 --num_frames 600 --baseline ../results/benchmark.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import freeze_support
+
+import numpy as np
+
+from svag_evaluator import SVAGEvaluator, combine_spatial_results
+from synthetic_svag import add_generator_arguments, generate
+from average_combined_results import compute_mean_result
+from run_svag import remove_id_mapping
+import trackeval  # noqa: E402  (on the path set by svag_evaluator)
+from trackeval import utils  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ['loading', 'conversion', 'similarity', 'hota', 'id_mapping', 'temporal', 'averaging']
+STAGE_UNITS = {
+    'loading': 'detections',
+    'conversion': 'queries',
+    'similarity': 'frames',
+    'hota': 'frames',
+    'id_mapping': 'sequences',
+    'temporal': 'queries',
+    'averaging': 'datasets',
+}
+
+
+def reset_peak_rss():
+    """Resets the peak RSS of the process to its current RSS, where the OS allows it (Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def get_peak_rss():
+    """Peak RSS of the process in bytes, since the last reset_peak_rss where supported. None if it is unknown."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def to_mb(num_bytes):
+    return None if num_bytes is None else round(num_bytes / 2 ** 20, 1)
+
+
+class StageTimer:
+    """Accumulates the time and the peak RSS of each stage over one benchmark run"""
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.peak_rss = dict.fromkeys(STAGES)
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - start
+            peak_rss = get_peak_rss()
+            if peak_rss is not None:
+                self.peak_rss[stage] = max(self.peak_rss[stage] or 0, peak_rss)
+
+
+def calculate_similarities(dataset, raw_data):
+    """Similarity scores of a sequence, as computed by _BaseDataset.get_raw_seq_data"""
+    if dataset.batch_similarities:
+        return dataset._calculate_similarities_batched(raw_data['gt_dets'], raw_data['tracker_dets'])
+    return [dataset._calculate_similarities(gt_dets_t, tracker_dets_t)
+            for gt_dets_t, tracker_dets_t in zip(raw_data['gt_dets'], raw_data['tracker_dets'])]
+
+
+def run_staged(evaluator, submission_file, timer):
+    """Evaluates a submission serially stage by stage, as SVAGEvaluator.evaluate does without the results store.
+    Returns the averaged result and the size of the evaluated data."""
+    counts = dict.fromkeys(['datasets', 'sequences', 'queries', 'frames', 'detections'], 0)
+    dataset_names = evaluator.config['DATASETS']
+    if evaluator.id_mapping_path is not None:
+        remove_id_mapping(evaluator.id_mapping_path)
+
+    paths = {}
+    gt = {}
+    with timer.measure('loading'):
+        for dataset_name in dataset_names:
+            paths[dataset_name] = evaluator.get_dataset_paths(dataset_name)
+            gt[dataset_name] = evaluator.load_gt(dataset_name, paths[dataset_name])
+
+    with timer.measure('conversion'):
+        with open(submission_file, 'r', encoding='utf-8') as f:
+            submission = json.load(f)
+        queries_by_dataset = {dataset['name']: dataset['queries'] for dataset in submission['datasets']}
+        datasets = {dataset_name: evaluator.get_spatial_dataset(paths[dataset_name], queries_by_dataset[dataset_name],
+                                                                gt[dataset_name][0])
+                    for dataset_name in dataset_names}
+
+    dataset_results = {}
+    for dataset_name in dataset_names:
+        dataset = datasets[dataset_name]
+        tracker = dataset.tracker_list[0]
+        hota = trackeval.metrics.HOTA(dict(evaluator.hota_config))
+        seq_results = {}
+        id_mappings = {}
+        for seq in sorted(dataset.seq_list):
+            with timer.measure('loading'):
+                raw_gt_data = dataset._load_raw_file(tracker, seq, is_gt=True)
+                raw_tracker_data = dataset._load_raw_file(tracker, seq, is_gt=False)
+                raw_data = {**raw_tracker_data, **raw_gt_data}
+            with timer.measure('similarity'):
+                raw_data['similarity_scores'] = calculate_similarities(dataset, raw_data)
+            with timer.measure('hota'):
+                data = dataset.get_preprocessed_seq_data(raw_data, 'pedestrian')
+                seq_results[seq] = hota.eval_sequence(data)
+            id_mapping = seq_results[seq].pop('id_mapping', None)
+            if id_mapping:
+                id_mappings[seq] = id_mapping
+            counts['frames'] += raw_data['num_timesteps']
+            counts['detections'] += sum(len(ids) for ids in raw_data['gt_ids'] + raw_data['tracker_ids'])
+        with timer.measure('hota'):
+            spatial_result = combine_spatial_results(seq_results)
+        if evaluator.id_mapping_path is not None:
+            with timer.measure('id_mapping'):
+                utils.save_id_mappings([id_mappings[seq] for seq in sorted(id_mappings)], evaluator.id_mapping_path)
+        with timer.measure('temporal'):
+            temporal_result = evaluator.eval_temporal(queries_by_dataset[dataset_name], gt[dataset_name][1],
+                                                      id_mappings)
+        dataset_results[dataset_name] = dict(spatial_result, **temporal_result)
+        counts['datasets'] += 1
+        counts['sequences'] += len(dataset.seq_list)
+        counts['queries'] += len(queries_by_dataset[dataset_name])
+
+    with timer.measure('averaging'):
+        mean_result = compute_mean_result([dataset_results[name] for name in dataset_names])
+    return mean_result, counts
+
+
+def compare_reports(report, baseline, tolerance):
+    """Stages (and end_to_end) more than tolerance slower than in the baseline report, as a list of messages"""
+    regressions = []
+    if report['data'] != baseline['data']:
+        print('Warning: the baseline was measured on different data, the comparison is not meaningful')
+    timings = dict(report['stages'], end_to_end=report['end_to_end'])
+    baseline_timings = dict(baseline['stages'], end_to_end=baseline['end_to_end'])
+    for stage, timing in timings.items():
+        if stage not in baseline_timings or not baseline_timings[stage]['seconds']:
+            continue
+        ratio = timing['seconds'] / baseline_timings[stage]['seconds']
+        if ratio > 1 + tolerance:
+            regressions.append(f"{stage}: {timing['seconds']:.4f}s vs {baseline_timings[stage]['seconds']:.4f}s in the "
+                               f"baseline ({ratio:.2f}x)")
+    return regressions
+
+
+def run_benchmark(data_root, repeat=3, num_parallel_cores=1, use_gt_cache=True, generator_config=None):
+    """Benchmarks the evaluation of data_root/submission.json, returns the report"""
+    submission_file = os.path.join(data_root, 'submission.json')
+    output_folder = tempfile.mkdtemp(prefix='svag_benchmark_')
+    eval_config = {
+        'DATA_ROOT': data_root,
+        'USE_GT_CACHE': use_gt_cache,
+        'ID_MAPPING_PATH': os.path.join(output_folder, 'id_mapping.jsonl'),
+        'PRINT_CONFIG': False,
+        'VERBOSE': False,
+    }
+    runs = []
+    try:
+        # The evaluation prints its progress, which is not part of the measured output
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for _ in range(repeat):
+                timer = StageTimer()
+                mean_result, counts = run_staged(SVAGEvaluator(eval_config), submission_file, timer)
+                runs.append(timer)
+
+            evaluator = SVAGEvaluator(dict(eval_config, USE_PARALLEL=num_parallel_cores > 1,
+                                           NUM_PARALLEL_CORES=num_parallel_cores))
+            end_to_end_seconds = []
+            reset_peak_rss()
+            for _ in range(repeat):
+                start = time.perf_counter()
+                end_to_end_result, _ = evaluator.evaluate(submission_file)
+                end_to_end_seconds.append(time.perf_counter() - start)
+            end_to_end_peak_rss = get_peak_rss()
+    finally:
+        shutil.rmtree(output_folder, ignore_errors=True)
+
+    units = {stage: counts[unit] for stage, unit in STAGE_UNITS.items()}
+    stages = {}
+    for stage in STAGES:
+        seconds = [timer.seconds[stage] for timer in runs]
+        peak_rss = [timer.peak_rss[stage] for timer in runs if timer.peak_rss[stage] is not None]
+        stages[stage] = {
+            'seconds': round(min(seconds), 6),
+            'mean_seconds': round(float(np.mean(seconds)), 6),
+            'throughput': round(units[stage] / min(seconds), 3) if min(seconds) > 0 else None,
+            'unit': STAGE_UNITS[stage] + '/s',
+            'peak_rss_mb': to_mb(max(peak_rss)) if peak_rss else None,
+        }
+    return {
+        'generator': generator_config,
+        'data_root': data_root,
+        'data': counts,
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'repeat': repeat,
+        'use_gt_cache': use_gt_cache,
+        'stages': stages,
+        'staged_total_seconds': round(sum(stage['seconds'] for stage in stages.values()), 6),
+        'end_to_end': {
+            'seconds': round(min(end_to_end_seconds), 6),
+            'mean_seconds': round(float(np.mean(end_to_end_seconds)), 6),
+            'throughput': round(counts['queries'] / min(end_to_end_seconds), 3),
+            'unit': 'queries/s',
+            'num_parallel_cores': num_parallel_cores,
+            'peak_rss_mb': to_mb(end_to_end_peak_rss),
+        },
+        'results_match': json.dumps(mean_result, sort_keys=True) == json.dumps(end_to_end_result, sort_keys=True),
+    }
+
+
+def print_report(report):
+    data = report['data']
+    print(f"{data['datasets']} datasets, {data['sequences']} sequences, {data['queries']} queries, "
+          f"{data['frames']} frames, {data['detections']} detections (best of {report['repeat']} runs)")
+    print(f"{'stage':<12} {'seconds':>10} {'throughput':>14} {'unit':<14} {'peak RSS MB':>12}")
+    timings = dict(report['stages'], end_to_end=report['end_to_end'])
+    for stage, timing in timings.items():
+        throughput = '' if timing['throughput'] is None else f"{timing['throughput']:.1f}"
+        peak_rss = '' if timing['peak_rss_mb'] is None else f"{timing['peak_rss_mb']:.1f}"
+        print(f"{stage:<12} {timing['seconds']:>10.4f} {throughput:>14} {timing['unit']:<14} {peak_rss:>12}")
+    print(f"Staged total {report['staged_total_seconds']:.4f} seconds, results match: {report['results_match']}")
+
+
+def main(args):
+    generator_config = None
+    data_root = args.data_root
+    generated_root = None
+    if not data_root:
+        generator_config = {
+            'NUM_VIDEOS': args.num_videos,
+            'QUERIES_PER_VIDEO': args.queries_per_video,
+            'TRACKS_PER_QUERY': args.tracks_per_query,
+            'NUM_FRAMES': args.num_frames,
+            'WINDOWS_PER_TRACK': args.windows_per_track,
+            'SEED': args.seed,
+        }
+        data_root = generated_root = tempfile.mkdtemp(prefix='svag_synthetic_')
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            generate(data_root, generator_config)
+    try:
+        report = run_benchmark(data_root, args.repeat, args.num_parallel_cores, not args.no_gt_cache,
+                               generator_config)
+    finally:
+        if generated_root is not None:
+            shutil.rmtree(generated_root, ignore_errors=True)
+    if generated_root is not None:
+        report['data_root'] = None
+
+    print_report(report)
+    if args.report:
+        os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        print(f"Report is saved to {args.report}")
+    if not report['results_match']:
+        print('The staged evaluation does not match SVAGEvaluator.evaluate')
+        return 1
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_reports(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    freeze_support()
+
+    parser = argparse.ArgumentParser(description="SVAG Evaluation Benchmark")
+    parser.add_argument('--data_root', type=str, default='',
+                        help='Existing data folder to benchmark, empty to generate synthetic data')
+    add_generator_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each measurement, the best one is reported')
+    parser.add_argument('--num_parallel_cores', type=int, default=1, help='Cores of the end_to_end evaluation')
+    parser.add_argument('--no_gt_cache', action='store_true', help='Parse the ground truth files in every run')
+    parser.add_argument('--report', type=str, default='', help='Path to save the JSON report to')
+    parser.add_argument('--baseline', type=str, default='', help='Report of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown of a stage over the baseline reported as a regression')
+
+    args = parser.parse_args()
+    sys.exit(main(args))
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 import argparse
@@ -150,10 +151,7 @@ def process_spatial_predictions(queries, output_base):
 '''
 
 
-def process_temporal_predictions(queries, output_dir, dataset_name):
-    ensure_dir(output_dir)
-    output_path = os.path.join(output_dir, f"{dataset_name.lower()}_valid_preds.jsonl")
-
+def build_temporal_predictions(queries):
     results = []
 
     for query in queries:
@@ -176,6 +174,39 @@ def process_temporal_predictions(queries, output_dir, dataset_name):
             })
 
     results.sort(key=lambda x: x["qid"])
+    return results
+
+
+def fingerprint(payload):
+    """sha256 hash of a JSON serialisable prediction payload, equal payloads have the same fingerprint"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def get_prediction_fingerprints(queries):
+    """Fingerprints of the predictions of the queries of one dataset:
+        "spatial": {seq: fingerprint of the track ids and boxes of the query of the sequence '{video_name}+{query}'}
+        "temporal": fingerprint of the queries as used by build_temporal_predictions
+    A query resubmitted with the same predictions keeps the same fingerprints.
+    """
+    seq_fingerprints = {}
+    for query in queries:  # The last query of a sequence is evaluated, as in SVAGSubmissionDataset
+        seq = f"{query['video_name']}+{convert_query_string(query['query'])}"
+        seq_fingerprints[seq] = fingerprint([[track["track_id"], track["spatial"]] for track in query["tracks"]])
+    temporal_fingerprint = fingerprint([
+        [query["query_id"], query["query"], query["video_length"], query["video_name"],
+         [[track["track_id"], track["temporal"]] for track in query["tracks"]]]
+        for query in queries])
+    return {
+        "spatial": seq_fingerprints,
+        "temporal": temporal_fingerprint,
+    }
+
+
+def process_temporal_predictions(queries, output_dir, dataset_name):
+    ensure_dir(output_dir)
+    output_path = os.path.join(output_dir, f"{dataset_name.lower()}_valid_preds.jsonl")
+
+    results = build_temporal_predictions(queries)
     with open(output_path, "w", encoding="utf-8") as file:
         for item in results:
             file.write(json.dumps(item) + "\n")
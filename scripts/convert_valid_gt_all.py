@@ -170,20 +170,6 @@ imExt=.jpg
     print(f"Created {count} sequences")
 
 
-start_time = time.time()
-
-valid_all_gt = '../data/mot25-stag_valid_ground_truth.json'
-output_base = '../data/gt'
-process_all_ground_truth(valid_all_gt, output_base)
-
-create_seqinfo("../data/length_ovis_valid.json", "../data/gt/OVIS/spatial", "ovis")
-create_seqinfo("../data/length_mot.json", "../data/gt/MOT17/spatial", "mot17")
-create_seqinfo("../data/length_mot.json", "../data/gt/MOT20/spatial", "mot20")
-
-end_time = time.time()
-print(f"Convert all gt in {end_time - start_time:.2f} seconds.")
-
-
 def check_completeness(file_path, range_set):
     with open(file_path, "r") as f:
         qids_in_file = set(json.loads(line)["qid"] for line in f)
@@ -195,9 +181,23 @@ def check_completeness(file_path, range_set):
         print(f"All QIDs from {range_set} are present.")
 
 
-file_path_ovis = os.path.join(output_base, 'OVIS/temporal/ovis_valid.jsonl')
-file_path_mot17 = os.path.join(output_base, 'MOT17/temporal/mot17_valid.jsonl')
-file_path_mot20 = os.path.join(output_base, 'MOT20/temporal/mot20_valid.jsonl')
-check_completeness(file_path_ovis, range(5095, 5997))
-check_completeness(file_path_mot17, range(782, 1281))
-check_completeness(file_path_mot20, range(810, 1242))
+if __name__ == '__main__':
+    start_time = time.time()
+
+    valid_all_gt = '../data/mot25-stag_valid_ground_truth.json'
+    output_base = '../data/gt'
+    process_all_ground_truth(valid_all_gt, output_base)
+
+    create_seqinfo("../data/length_ovis_valid.json", "../data/gt/OVIS/spatial", "ovis")
+    create_seqinfo("../data/length_mot.json", "../data/gt/MOT17/spatial", "mot17")
+    create_seqinfo("../data/length_mot.json", "../data/gt/MOT20/spatial", "mot20")
+
+    end_time = time.time()
+    print(f"Convert all gt in {end_time - start_time:.2f} seconds.")
+
+    file_path_ovis = os.path.join(output_base, 'OVIS/temporal/ovis_valid.jsonl')
+    file_path_mot17 = os.path.join(output_base, 'MOT17/temporal/mot17_valid.jsonl')
+    file_path_mot20 = os.path.join(output_base, 'MOT20/temporal/mot20_valid.jsonl')
+    check_completeness(file_path_ovis, range(5095, 5997))
+    check_completeness(file_path_mot17, range(782, 1281))
+    check_completeness(file_path_mot20, range(810, 1242))
@@ -0,0 +1,167 @@
+"""
+Persistent cache of the parsed SVAG ground truth.
+
+The ground truth of a sub-dataset (the per-query gt.txt files written by convert_valid_gt_all.py, the sequence lengths
+in seqinfo.ini and the temporal *_valid.jsonl) does not change between submissions, so it is parsed once and stored in
+CACHE_FOLDER/{dataset}-{key}/ in a form that later evaluations load in milliseconds:
+    rows.npy      the gt rows of all sequences in one float array, memory mapped when loaded
+    index.pkl     sequence list and lengths, and the timestep and row range of each (sequence, timestep) block
+    temporal.pkl  the parsed temporal ground truth
+
+The key is a hash of the seqmap and of the path, size and modification time of every source file, so a cache entry is
+never used once its ground truth is regenerated or edited.
+
+Example:
+    gt_cache = GTCache('../data/gt_cache')
+    gt_data, temporal_gt = gt_cache.load('OVIS', paths)
+    dataset = trackeval.datasets.SVAGSubmissionDataset({..., 'GT_DATA': gt_data})
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+from collections.abc import Mapping
+
+import numpy as np
+
+from trackeval.datasets import SVAGSubmissionDataset
+from trackeval.utils import TrackEvalException
+from temporal_eval.utils import load_jsonl
+
+CACHE_VERSION = 1
+
+
+class CachedTimeData(Mapping):
+    """gt time data of the cached sequences, {seq: {timestep: 2D NDArray}} as returned by
+    SVAGSubmissionDataset.read_gt_time_data. The dict of a sequence is only built when it is accessed, as views of the
+    memory mapped rows. Pickling it (e.g. to send it to pool workers) only pickles the cache location.
+    """
+
+    def __init__(self, cache_dir, index=None):
+        self.cache_dir = cache_dir
+        if index is None:
+            with open(os.path.join(cache_dir, 'index.pkl'), 'rb') as f:
+                index = pickle.load(f)
+        self.rows = np.asarray(np.load(os.path.join(cache_dir, 'rows.npy'), mmap_mode='r'))
+        self.seq_offsets = index['seq_offsets']
+        self.timesteps = index['timesteps']
+        self.row_offsets = index['row_offsets']
+        self.seq_index = {seq: i for i, seq in enumerate(index['seqs'])}
+
+    def __getitem__(self, seq):
+        i = self.seq_index[seq]
+        start, end = self.seq_offsets[i], self.seq_offsets[i + 1]
+        row_offsets = self.row_offsets[start:end + 1].tolist()
+        timesteps = self.timesteps[start:end].tolist()
+        return {t: self.rows[row_offsets[b]:row_offsets[b + 1]] for b, t in enumerate(timesteps)}
+
+    def __iter__(self):
+        return iter(self.seq_index)
+
+    def __len__(self):
+        return len(self.seq_index)
+
+    def __reduce__(self):
+        return self.__class__, (self.cache_dir,)
+
+
+class GTCache:
+    """Loads the ground truth of SVAG sub-datasets, parsing it and storing it in the cache folder on first use"""
+
+    def __init__(self, cache_folder):
+        self.cache_folder = cache_folder
+
+    def load(self, dataset_name, paths):
+        """Returns the spatial gt (GT_DATA of SVAGSubmissionDataset) and the temporal gt of a sub-dataset.
+        paths holds the seqmap_file, gt_folder and gt_temporal locations, as in SVAGEvaluator.get_dataset_paths.
+        """
+        gt_fol = os.path.join(paths['gt_folder'], '')
+        seq_list = list(dict.fromkeys(SVAGSubmissionDataset.read_seqmap(paths['seqmap_file'])))
+        cache_dir = os.path.join(self.cache_folder, f'{dataset_name.lower()}-{self.get_key(paths, seq_list)}')
+        if not os.path.isdir(cache_dir):
+            self.build(cache_dir, gt_fol, seq_list, paths['gt_temporal'])
+
+        with open(os.path.join(cache_dir, 'index.pkl'), 'rb') as f:
+            index = pickle.load(f)
+        with open(os.path.join(cache_dir, 'temporal.pkl'), 'rb') as f:
+            temporal_gt = pickle.load(f)
+        gt_data = {'seq_lengths': index['seq_lengths'], 'time_data': CachedTimeData(cache_dir, index)}
+        return gt_data, temporal_gt
+
+    @staticmethod
+    def get_key(paths, seq_list):
+        """Hash of the seqmap and of the path, size and modification time of all gt files of its sequences"""
+        gt_fol = os.path.join(paths['gt_folder'], '')
+        gt_loc_format = SVAGSubmissionDataset.get_default_dataset_config()['GT_LOC_FORMAT']
+        source_files = [paths['seqmap_file'], paths['gt_temporal']]
+        for video_id in dict.fromkeys(seq.split('+')[0] for seq in seq_list):
+            source_files.append(os.path.join(gt_fol, video_id, 'seqinfo.ini'))
+        for seq in seq_list:
+            video_id, expression_id = seq.split('+', 1)
+            source_files.append(gt_loc_format.format(gt_folder=gt_fol, video_id=video_id, expression_id=expression_id))
+
+        digest = hashlib.sha256(f'{CACHE_VERSION}\n'.encode())
+        with open(paths['seqmap_file'], 'rb') as f:
+            digest.update(f.read())
+        for file in source_files:
+            try:
+                stat = os.stat(file)
+                file_key = f'{os.path.abspath(file)}\0{stat.st_size}\0{stat.st_mtime_ns}\n'
+            except OSError:
+                file_key = f'{os.path.abspath(file)}\0missing\n'
+            digest.update(file_key.encode())
+        return digest.hexdigest()[:24]
+
+    @staticmethod
+    def build(cache_dir, gt_fol, seq_list, gt_temporal):
+        """Parses the gt of all sequences of a seqmap and writes it to cache_dir"""
+        gt_loc_format = SVAGSubmissionDataset.get_default_dataset_config()['GT_LOC_FORMAT']
+        video_lengths = {}
+        seq_lengths = {}
+        seq_offsets = [0]
+        timesteps = []
+        row_offsets = [0]
+        blocks = []
+        for seq in seq_list:
+            video_id, expression_id = seq.split('+', 1)
+            if video_id not in video_lengths:
+                video_lengths[video_id] = SVAGSubmissionDataset.read_seq_length(gt_fol, video_id)
+            seq_lengths[seq] = video_lengths[video_id]
+            gt_file = gt_loc_format.format(gt_folder=gt_fol, video_id=video_id, expression_id=expression_id)
+            if not os.path.isfile(gt_file):
+                raise TrackEvalException('GT file not found for sequence: ' + seq)
+            for t, rows in SVAGSubmissionDataset.read_gt_time_data(gt_file, seq).items():
+                timesteps.append(t)
+                row_offsets.append(row_offsets[-1] + len(rows))
+                blocks.append(rows)
+            seq_offsets.append(len(timesteps))
+
+        num_cols = {rows.shape[1] for rows in blocks}
+        if len(num_cols) > 1:
+            raise TrackEvalException('Cannot cache gt files with different numbers of columns: %s' % sorted(num_cols))
+        rows = np.concatenate(blocks) if blocks else np.empty((0, 9))
+        index = {
+            'seqs': seq_list,
+            'seq_lengths': seq_lengths,
+            'seq_offsets': np.asarray(seq_offsets, dtype=np.int64),
+            'timesteps': np.asarray(timesteps, dtype=np.int64),
+            'row_offsets': np.asarray(row_offsets, dtype=np.int64),
+        }
+        temporal_gt = load_jsonl(gt_temporal)
+
+        # Written to a temporary folder first, so concurrent evaluations never see a partially written cache
+        os.makedirs(os.path.dirname(os.path.abspath(cache_dir)), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=os.path.dirname(os.path.abspath(cache_dir)))
+        try:
+            np.save(os.path.join(tmp_dir, 'rows.npy'), np.asarray(rows, dtype=float))
+            with open(os.path.join(tmp_dir, 'index.pkl'), 'wb') as f:
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(os.path.join(tmp_dir, 'temporal.pkl'), 'wb') as f:
+                pickle.dump(temporal_gt, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_dir, cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,252 @@
+"""
+Scheduler evaluating several SVAG submissions at once.
+
+Each submission is a job evaluated in its own process, so that a crashing or misbehaving evaluation does not affect the
+others, with:
+    - a CPU budget: the job process is pinned to CPUS_PER_JOB CPUs (its share of the CPUs available to the scheduler
+      by default) and evaluates its sequences on that many processes.
+    - a scratch folder: a folder of its own in SCRATCH_FOLDER receiving everything the job writes (its HOTA id mapping
+      and its eval.log output), instead of the fixed paths of run.sh / run.py shared by all evaluations.
+At most MAX_CONCURRENT_JOBS jobs run at once. The other ones wait in two lanes: submissions with at most
+SMALL_JOB_MAX_QUERIES queries (sanity checks) are started before all the others. Once MAX_PENDING_JOBS jobs are
+waiting, submit raises JobQueueFull so that the caller can push back (svag_server.py answers HTTP 503).
+
+The ground truth is loaded once by the scheduler (see SVAGEvaluator.preload_gt) and inherited by the job processes.
+
+Example:
+    scheduler = JobScheduler({'MAX_CONCURRENT_JOBS': 4, 'EVAL_CONFIG': {'DATA_ROOT': '../data'}})
+    job = scheduler.submit(submission)
+    mean_result, dataset_results = job.wait()
+"""
+import collections
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+from svag_evaluator import SVAGEvaluator
+from trackeval import utils  # noqa: E402  (on the path set by svag_evaluator)
+
+
+class JobQueueFull(utils.TrackEvalException):
+    """Raised when a job is submitted while MAX_PENDING_JOBS jobs are already waiting"""
+
+
+class Job:
+    """A submission evaluated by the JobScheduler. The progress messages of its evaluation (in the format streamed by
+    svag_server.py) are put in messages, followed by None once it is finished."""
+
+    def __init__(self, job_id, submission, lane):
+        self.job_id = job_id
+        self.submission = submission
+        self.lane = lane
+        self.status = 'queued'  # 'queued', 'running', 'done' or 'error'
+        self.result = None  # (mean_result, dataset_results) once done
+        self.error = None
+        self.cpus = None
+        self.scratch_dir = None
+        self.start_time = None
+        self.messages = queue.Queue()
+        self.finished = threading.Event()
+
+    def wait(self, timeout=None):
+        """Waits for the job to finish and returns (mean_result, dataset_results), None if the timeout expires first"""
+        if not self.finished.wait(timeout):
+            return None
+        if self.status == 'error':
+            raise utils.TrackEvalException(f'Job {self.job_id} failed: {self.error}')
+        return self.result
+
+
+class JobScheduler:
+    """Runs the submitted evaluations in their own processes, MAX_CONCURRENT_JOBS at a time"""
+
+    @staticmethod
+    def get_default_config():
+        """Returns the default config values of the scheduler"""
+        default_config = {
+            'MAX_CONCURRENT_JOBS': 2,
+            'CPUS_PER_JOB': None,  # Defaults to the available CPUs divided between the concurrent jobs
+            'MAX_PENDING_JOBS': 32,  # Jobs waiting to be started, more are rejected with JobQueueFull
+            'SMALL_JOB_MAX_QUERIES': 20,  # Submissions with at most this many queries are started first
+            'SCRATCH_FOLDER': None,  # Parent folder of the job scratch folders, defaults to a temporary folder
+            'KEEP_SCRATCH': False,  # Keep the scratch folder of finished jobs
+            'EVAL_CONFIG': {},  # SVAGEvaluator config of all jobs
+            'PRINT_CONFIG': True,
+        }
+        return default_config
+
+    def __init__(self, config=None):
+        self.config = utils.init_config(config, self.get_default_config(), 'SVAG Job Scheduler')
+        self.eval_config = dict(self.config['EVAL_CONFIG'], PRINT_CONFIG=False)
+        evaluator = SVAGEvaluator(self.eval_config)
+        evaluator.preload_gt()
+        self.resident_gt = evaluator.resident_gt
+        # Name of the HOTA id mapping file each job writes in its scratch folder, None to not save it
+        self.id_mapping_name = evaluator.id_mapping_path and os.path.basename(evaluator.id_mapping_path)
+
+        self.scratch_folder = self.config['SCRATCH_FOLDER']
+        if self.scratch_folder is None:
+            self.scratch_folder = os.path.join(tempfile.gettempdir(), 'svag_jobs')
+        os.makedirs(self.scratch_folder, exist_ok=True)
+
+        # CPUs of each job slot, disjoint unless there are less CPUs than the slots need
+        try:
+            cpus = sorted(os.sched_getaffinity(0))
+        except AttributeError:  # Not available on macOS and Windows, job processes are not pinned
+            cpus = list(range(os.cpu_count() or 1))
+        num_slots = max(1, self.config['MAX_CONCURRENT_JOBS'])
+        cpus_per_job = self.config['CPUS_PER_JOB'] or max(1, len(cpus) // num_slots)
+        self.free_slots = [[cpus[(slot * cpus_per_job + i) % len(cpus)] for i in range(cpus_per_job)]
+                           for slot in range(num_slots)]
+
+        self.lanes = {'small': collections.deque(), 'normal': collections.deque()}
+        self.jobs = {}
+        self.job_ids = itertools.count(1)
+        self.condition = threading.Condition()
+        self.closed = False
+        self.job_messages = mp.Queue()
+        threading.Thread(target=self._dispatch, name='svag-dispatch', daemon=True).start()
+        self.relay_thread = threading.Thread(target=self._relay, name='svag-relay', daemon=True)
+        self.relay_thread.start()
+
+    @property
+    def num_pending(self):
+        with self.condition:
+            return sum(len(lane) for lane in self.lanes.values())
+
+    @property
+    def num_running(self):
+        with self.condition:
+            return sum(job.status == 'running' for job in self.jobs.values())
+
+    def submit(self, submission):
+        """Queues a parsed submission and returns its Job. Raises JobQueueFull if MAX_PENDING_JOBS jobs are waiting."""
+        num_queries = sum(len(dataset.get('queries', ())) for dataset in submission.get('datasets', ()))
+        lane = 'small' if num_queries <= self.config['SMALL_JOB_MAX_QUERIES'] else 'normal'
+        with self.condition:
+            if self.closed:
+                raise utils.TrackEvalException('The job scheduler is shut down')
+            if self.num_pending >= self.config['MAX_PENDING_JOBS']:
+                raise JobQueueFull(f'{self.num_pending} submissions are already waiting, retry later')
+            job = Job(next(self.job_ids), submission, lane)
+            # Jobs to start before this one: the small ones first, in submission order
+            position = len(self.lanes['small']) + (len(self.lanes['normal']) if lane == 'normal' else 0)
+            job.messages.put({'status': 'queued', 'job_id': job.job_id, 'lane': lane, 'position': position})
+            self.jobs[job.job_id] = job
+            self.lanes[lane].append(job)
+            self.condition.notify_all()
+        return job
+
+    def shutdown(self, wait=True):
+        """Rejects new jobs, and waits for the queued and running ones to finish if wait. The message relay stops once
+        all jobs are finished."""
+        with self.condition:
+            if not self.closed and not self.jobs:
+                self.job_messages.put(None)
+            self.closed = True
+            jobs = list(self.jobs.values())
+        if wait:
+            for job in jobs:
+                job.finished.wait()
+            self.relay_thread.join()
+
+    def _dispatch(self):
+        """Starts the queued jobs whenever a job slot is free"""
+        while True:
+            with self.condition:
+                while not (self.free_slots and self.num_pending):
+                    self.condition.wait()
+                lane = self.lanes['small'] if self.lanes['small'] else self.lanes['normal']
+                job = lane.popleft()
+                job.cpus = self.free_slots.pop(0)
+                job.status = 'running'
+            job.start_time = time.time()
+            job.messages.put({'status': 'running', 'job_id': job.job_id, 'cpus': len(job.cpus)})
+            try:
+                job.scratch_dir = tempfile.mkdtemp(prefix=f'job-{job.job_id}-', dir=self.scratch_folder)
+                process = mp.Process(target=_run_job, name=f'svag-job-{job.job_id}', daemon=False, args=(
+                    job.job_id, job.submission, self.eval_config, self.resident_gt, self.id_mapping_name, job.cpus,
+                    job.scratch_dir, self.job_messages))
+                process.start()
+            except Exception as err:
+                # Only this job fails, the next ones are still dispatched
+                job.error = f'Could not start the evaluation: {type(err).__name__}: {err}'
+                job.messages.put({'status': 'error', 'job_id': job.job_id, 'error': job.error})
+                self._finish(job, None)
+                continue
+            threading.Thread(target=self._watch, args=(job, process), daemon=True).start()
+
+    def _watch(self, job, process):
+        """Waits for the process of a job to exit. The exit is sent after all messages of the process."""
+        process.join()
+        self.job_messages.put((job.job_id, {'status': 'exit', 'exitcode': process.exitcode}))
+
+    def _relay(self):
+        """Forwards the messages of the job processes to their Job, until the None put once the scheduler is shut down
+        and all jobs are finished"""
+        while True:
+            item = self.job_messages.get()
+            if item is None:
+                break
+            job_id, message = item
+            job = self.jobs[job_id]
+            if message['status'] == 'done':
+                job.result = (message['mean_result'], message.pop('dataset_results'))
+            elif message['status'] == 'error':
+                job.error = message['error']
+            elif message['status'] == 'exit':
+                self._finish(job, message['exitcode'])
+                continue
+            message['job_id'] = job_id
+            job.messages.put(message)
+        self.job_messages.close()
+
+    def _finish(self, job, exitcode):
+        if job.result is None and job.error is None:
+            job.error = f'Evaluation process exited with code {exitcode}'
+            job.messages.put({'status': 'error', 'job_id': job.job_id, 'error': job.error})
+        job.status = 'done' if job.error is None else 'error'
+        if job.scratch_dir is not None and not self.config['KEEP_SCRATCH']:
+            shutil.rmtree(job.scratch_dir, ignore_errors=True)
+        job.submission = None
+        job.messages.put(None)
+        job.finished.set()
+        with self.condition:
+            self.free_slots.append(job.cpus)
+            del self.jobs[job.job_id]
+            if self.closed and not self.jobs:
+                self.job_messages.put(None)
+            self.condition.notify_all()
+
+
+def _run_job(job_id, submission, eval_config, resident_gt, id_mapping_name, cpus, scratch_dir, job_messages):
+    """Evaluates one submission in a job process, pinned to its CPUs and writing only to its scratch folder"""
+    log_file = open(os.path.join(scratch_dir, 'eval.log'), 'w')
+    os.dup2(log_file.fileno(), sys.stdout.fileno())
+    os.dup2(log_file.fileno(), sys.stderr.fileno())
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+    start = time.time()
+    eval_config = dict(eval_config, USE_PARALLEL=len(cpus) > 1, NUM_PARALLEL_CORES=len(cpus), ID_MAPPING_UNIQUE=False,
+                       ID_MAPPING_PATH=id_mapping_name and os.path.join(scratch_dir, id_mapping_name))
+    try:
+        evaluator = SVAGEvaluator(eval_config)
+        evaluator.resident_gt = resident_gt
+        mean_result, dataset_results = evaluator.evaluate(submission, callback=lambda dataset_name, result: (
+            job_messages.put((job_id, {'status': 'dataset', 'dataset': dataset_name, 'result': result}))))
+        job_messages.put((job_id, {'status': 'done', 'mean_result': mean_result, 'dataset_results': dataset_results,
+                                   'seconds': round(time.time() - start, 3)}))
+    except Exception as err:
+        traceback.print_exc()
+        job_messages.put((job_id, {'status': 'error', 'error': f'{type(err).__name__}: {err}'}))
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
@@ -0,0 +1,97 @@
+"""
+Persistent store of SVAG evaluation results, for incremental re-scoring of resubmissions.
+
+Teams often resubmit with changed predictions for only one sub-dataset or a few queries. Every result that is expensive
+to compute is stored under a key hashing everything it depends on: the ground truth (see GTCache.get_key), the
+evaluation settings, the fingerprint of the predictions it was computed from (see
+convert_submission.get_prediction_fingerprints) and the source code of the evaluation (see get_code_fingerprint), so
+that results computed by an older version of the metrics are never reused. A later evaluation of the same inputs loads
+the stored result instead of computing it again:
+    spatial   the HOTA result and id mapping of one sequence, keyed by the tracks of the query of the sequence
+    temporal  the temporal result of one sub-dataset, keyed by the temporal predictions of all its queries and by the
+              tracks of all its sequences (which determine the HOTA id mapping the temporal evaluation depends on)
+
+Results are stored in STORE_FOLDER/{key[:2]}/{key}.pkl. Entries are never modified, stale ones can be deleted at any
+time (e.g. by removing the whole folder).
+
+Example:
+    store = ResultsStore('../data/results_store')
+    # As in SVAGEvaluator.get_result_keys, hota_config being the HOTA metric config the result is computed with
+    key = ResultsStore.get_key('spatial', dataset_name, gt_key, hota_config, seq, seq_fingerprint)
+    seq_result = store.get(key)
+    if seq_result is None:
+        seq_result = ...
+        store.put(key, seq_result)
+"""
+import functools
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+STORE_VERSION = 1
+
+CODE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Sources the stored results are computed by, relative to CODE_PATH
+CODE_SOURCES = ['TrackEval/trackeval', 'temporal_eval', 'scripts/svag_evaluator.py', 'scripts/gt_cache.py',
+                'scripts/convert_submission.py', 'scripts/run_svag.py', 'scripts/average_combined_results.py']
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_fingerprint():
+    """Hash of the Python files of CODE_SOURCES, computed once per process"""
+    files = []
+    for source in CODE_SOURCES:
+        path = os.path.join(CODE_PATH, source)
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs[:] = [name for name in dirs if name != '__pycache__']
+            files += [os.path.join(root, name) for name in names if name.endswith('.py')]
+    fingerprint = hashlib.sha256()
+    for file in sorted(files):
+        fingerprint.update(os.path.relpath(file, CODE_PATH).replace(os.sep, '/').encode() + b'\0')
+        with open(file, 'rb') as f:
+            fingerprint.update(hashlib.sha256(f.read()).digest())
+    return fingerprint.hexdigest()
+
+
+class ResultsStore:
+    """Stores evaluation results in a folder, keyed by a hash of their inputs"""
+
+    def __init__(self, store_folder):
+        self.store_folder = store_folder
+
+    @staticmethod
+    def get_key(*parts):
+        """Hash of the JSON serialisable parts an entry depends on and of the evaluation code"""
+        payload = json.dumps([STORE_VERSION, get_code_fingerprint()] + list(parts), sort_keys=True,
+                             separators=(',', ':'))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.store_folder, key[:2], key + '.pkl')
+
+    def get(self, key):
+        """The stored result of a key, None if there is none"""
+        try:
+            with open(self.get_path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, key, result):
+        """Stores the result of a key. It is written to a temporary file first, so concurrent evaluations never read a
+        partially written entry."""
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
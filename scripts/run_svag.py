@@ -17,15 +17,19 @@ def parse_summary_txt(summary_path):
     headers = lines[0].strip().split()
     values = list(map(float, lines[1].strip().split()))
     summary_data = dict(zip(headers, values))
+    return extract_spatial_results(summary_data)
 
+def extract_spatial_results(summary_data):
     keys_needed = ["HOTA", "DetA", "AssA", "DetRe", "DetPr", "AssRe", "AssPr", "LocA"]
-    extracted = {k: summary_data[k] for k in keys_needed if k in summary_data}
+    extracted = {k: float(summary_data[k]) for k in keys_needed if k in summary_data}
     return extracted
 
 def parse_metrics_json(metrics_path):
     with open(metrics_path, 'r') as f:
         metrics = json.load(f)
+    return extract_temporal_results(metrics)
 
+def extract_temporal_results(metrics):
     brief = metrics["brief"]
     rename_map = {
         "MR-full-mIoU": "mIoU",
@@ -0,0 +1,78 @@
+"""
+Client of the SVAG evaluation server (svag_server.py).
+
+Sends a submission to the server and prints the streamed progress messages, saving the results in the same files as
+run.py if asked to.
+
+Example:
+    python svag_client.py --submission_file ../data/submission.json --final_result ../data/predict/combined_result_mean.json
+"""
+import argparse
+import json
+import os
+import sys
+import urllib.request
+
+
+def save_result(result, output_path):
+    """Saves a result as run.py does"""
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=4)
+    print(f"Result is saved to {output_path}")
+
+
+def evaluate(submission, server_url='http://127.0.0.1:8765'):
+    """Sends a submission (path to submission.json or its parsed content) to the server, yields the progress messages
+    of its evaluation"""
+    if isinstance(submission, str):
+        with open(submission, 'rb') as f:
+            body = f.read()
+    else:
+        body = json.dumps(submission).encode()
+    request = urllib.request.Request(server_url.rstrip('/') + '/evaluate', data=body, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main(args):
+    dataset_results = {}
+    mean_result = None
+    for message in evaluate(args.submission_file, args.server_url):
+        if message['status'] == 'queued':
+            print(f"Job {message['job_id']} queued, {message['position']} submission(s) before it")
+        elif message['status'] == 'running':
+            print(f"Job {message['job_id']} running")
+        elif message['status'] == 'dataset':
+            dataset_results[message['dataset']] = message['result']
+            print(f"{message['dataset']}: {json.dumps(message['result'])}")
+        elif message['status'] == 'done':
+            mean_result = message['mean_result']
+            print(f"Mean result ({message['seconds']:.2f} seconds): {json.dumps(mean_result)}")
+        elif message['status'] == 'error':
+            print(f"Evaluation failed: {message['error']}")
+            return 1
+
+    for dataset_name, output_path in (('OVIS', args.ovis_result), ('MOT17', args.mot17_result),
+                                      ('MOT20', args.mot20_result)):
+        if output_path and dataset_name in dataset_results:
+            save_result(dataset_results[dataset_name], output_path)
+    if args.final_result and mean_result is not None:
+        save_result(mean_result, args.final_result)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="SVAG Evaluation Client")
+    parser.add_argument('--server_url', type=str, default='http://127.0.0.1:8765', help='URL of svag_server.py')
+    parser.add_argument('--submission_file', type=str, default='../data/submission.json', help='Path to submission file')
+    parser.add_argument('--ovis_result', type=str, default='', help='Path to save the ovis result to')
+    parser.add_argument('--mot17_result', type=str, default='', help='Path to save the mot17 result to')
+    parser.add_argument('--mot20_result', type=str, default='', help='Path to save the mot20 result to')
+    parser.add_argument('--final_result', type=str, default='', help='Path to save the final average result to')
+
+    args = parser.parse_args()
+    sys.exit(main(args))
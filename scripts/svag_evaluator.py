@@ -0,0 +1,441 @@
+"""
+In-process SVAG evaluation.
+
+Runs the whole SVAG protocol (submission conversion, spatial HOTA, temporal grounding and the m-HIoU average) inside
+one Python process and passes the intermediate results around as data structures instead of re-parsing the
+pedestrian_summary.txt / metrics json files written by the shell pipeline in run.sh.
+
+The parsed ground truth of each sub-dataset is kept in a GTCache (see gt_cache.py), so only the first evaluation after
+the ground truth changed parses the gt.txt, seqinfo.ini and *_valid.jsonl files.
+
+With USE_PARALLEL the sequences of all sub-datasets are evaluated on one process pool, and the temporal evaluation of
+a sub-dataset is started on the same pool as soon as its spatial evaluation (which produces the id mapping) is done.
+
+With USE_RESULTS_STORE the HOTA result of each sequence and the temporal result of each sub-dataset are kept in a
+ResultsStore (see results_store.py), keyed by the fingerprints of the predictions they were computed from. Re-scoring a
+submission in which only some datasets or queries changed only evaluates the changed sequences (and the temporal
+grounding of the sub-datasets with changes) before combining the sequences and computing m-HIoU.
+
+With PROFILE the time spent in each stage (gt loading, submission conversion, similarity, HOTA, temporal grounding,
+averaging) and in the TrackEval functions is collected by a trackeval.profiling.Profiler, including the pool workers,
+and written to PROFILE_FOLDER.
+
+Example:
+    evaluator = SVAGEvaluator({'DATA_ROOT': '../data'})
+    mean_result, dataset_results = evaluator.evaluate('../data/submission.json')
+"""
+import json
+import os
+import sys
+import time
+from multiprocessing.pool import Pool
+
+CODE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(CODE_PATH, 'TrackEval'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(CODE_PATH)
+
+import trackeval  # noqa: E402
+from trackeval import _timing, profiling, utils  # noqa: E402
+from temporal_eval.eval import eval_submission  # noqa: E402
+from temporal_eval.utils import load_jsonl  # noqa: E402
+from gt_cache import GTCache  # noqa: E402
+from results_store import ResultsStore  # noqa: E402
+from convert_submission import build_temporal_predictions, get_prediction_fingerprints  # noqa: E402
+from average_combined_results import compute_mean_result  # noqa: E402
+from run_svag import extract_spatial_results, extract_temporal_results, remove_id_mapping  # noqa: E402
+
+SVAG_DATASETS = ['OVIS', 'MOT17', 'MOT20']
+
+
+def get_num_available_cpus():
+    """Number of CPUs this process may run on (its affinity), all the CPUs of the host where it cannot be known"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS and Windows
+        return os.cpu_count() or 1
+
+
+class SVAGEvaluator:
+    """Evaluator running the spatial and temporal SVAG evaluation of a submission in a single process"""
+
+    @staticmethod
+    def get_default_eval_config():
+        """Returns the default config values for evaluation"""
+        default_config = {
+            'DATA_ROOT': os.path.join(CODE_PATH, 'data'),  # Contains data_path/ seqmaps and the gt/ folders
+            'DATASETS': SVAG_DATASETS,  # Sub-datasets to evaluate, all of them are required for m-HIoU
+            'USE_GT_CACHE': True,  # Load the parsed ground truth from GT_CACHE_FOLDER, creating it if needed
+            'GT_CACHE_FOLDER': None,  # Defaults to DATA_ROOT/gt_cache
+            'USE_RESULTS_STORE': False,  # Reuse the stored results of unchanged sequences and sub-datasets
+            'RESULTS_STORE_FOLDER': None,  # Defaults to DATA_ROOT/results_store
+            'ID_MAPPING_PATH': os.path.join(CODE_PATH, 'results', 'id_mapping.jsonl'),  # None to not save it
+            'ID_MAPPING_UNIQUE': False,  # Add a suffix unique to this run to the id mapping file name
+            'ID_MAPPING_FORMAT': 'lists',  # HOTA id mapping format, 'columnar' requires a .npz or .pkl ID_MAPPING_PATH
+            'USE_PARALLEL': False,
+            'NUM_PARALLEL_CORES': get_num_available_cpus(),
+            'PRINT_RESULTS': False,  # Print the TrackEval HOTA tables (only when not run in parallel)
+            'PRINT_CONFIG': True,
+            'VERBOSE': True,
+            'PROFILE': False,  # Collect the timings of the stages and functions, see trackeval/profiling.py
+            'PROFILE_TRACE': False,  # If PROFILE, also keep every call for a Chrome trace
+            'PROFILE_FOLDER': None,  # If PROFILE, where profile.json, profile.csv and trace.json are written
+        }
+        return default_config
+
+    def __init__(self, config=None):
+        """Initialise the evaluator with a config file"""
+        self.config = utils.init_config(config, self.get_default_eval_config(), 'SVAG Eval')
+        self.data_root = self.config['DATA_ROOT']
+        self.verbose = self.config['VERBOSE']
+        self.gt_cache = None
+        if self.config['USE_GT_CACHE']:
+            cache_folder = self.config['GT_CACHE_FOLDER']
+            if cache_folder is None:
+                cache_folder = os.path.join(self.data_root, 'gt_cache')
+            self.gt_cache = GTCache(cache_folder)
+        self.results_store = None
+        if self.config['USE_RESULTS_STORE']:
+            store_folder = self.config['RESULTS_STORE_FOLDER']
+            if store_folder is None:
+                store_folder = os.path.join(self.data_root, 'results_store')
+            self.results_store = ResultsStore(store_folder)
+        self.resident_gt = {}
+        self.worker_utilisation = None  # Of the pool of the last parallel evaluation, see utils.get_worker_utilisation
+        self.profiler = None  # Of the last evaluation with PROFILE
+        self.hota_config = {'ID_MAPPING_FORMAT': self.config['ID_MAPPING_FORMAT'], 'PRINT_CONFIG': False}
+        self.id_mapping_path = self.config['ID_MAPPING_PATH']
+        if self.id_mapping_path is not None and self.config['ID_MAPPING_UNIQUE']:
+            self.id_mapping_path = utils.get_unique_save_path(self.id_mapping_path)
+        utils.check_id_mapping_path(self.id_mapping_path, self.config['ID_MAPPING_FORMAT'])
+        self.id_mapping_writer = None  # Of the running evaluation, see utils.IdMappingWriter
+
+    def get_dataset_paths(self, dataset_name):
+        """Returns the ground truth locations of one sub-dataset"""
+        lower_name = dataset_name.lower()
+        return {
+            'seqmap_file': os.path.join(self.data_root, 'data_path', f'seqmap_{lower_name}.txt'),
+            'gt_folder': os.path.join(self.data_root, 'gt', dataset_name, 'spatial'),
+            'gt_temporal': os.path.join(self.data_root, 'gt', dataset_name, 'temporal', f'{lower_name}_valid.jsonl'),
+        }
+
+    def load_gt(self, dataset_name, paths):
+        """Returns the preloaded spatial gt (None to read it from the gt folder) and the temporal gt of a sub-dataset"""
+        if dataset_name in self.resident_gt:
+            return self.resident_gt[dataset_name]
+        with _timing.section('gt_loading'):
+            if self.gt_cache is None:
+                return None, load_jsonl(paths['gt_temporal'])
+            return self.gt_cache.load(dataset_name, paths)
+
+    def preload_gt(self):
+        """Loads the ground truth of all configured sub-datasets once and keeps it for all later evaluations, as done by
+        the long running server (svag_server.py). The evaluator has to be recreated when the ground truth changes."""
+        self.resident_gt = {}
+        for dataset_name in self.config['DATASETS']:
+            self.resident_gt[dataset_name] = self.load_gt(dataset_name, self.get_dataset_paths(dataset_name))
+
+    def get_result_keys(self, dataset_name, paths, queries):
+        """ResultsStore keys of the HOTA result of each sequence ({seq: key}) and of the temporal result of a
+        sub-dataset. The sequence keys only depend on the tracks of the query of the sequence."""
+        seq_list = list(dict.fromkeys(trackeval.datasets.SVAGSubmissionDataset.read_seqmap(paths['seqmap_file'])))
+        gt_key = GTCache.get_key(paths, seq_list)
+        fingerprints = get_prediction_fingerprints(queries)
+        seq_keys = {seq: ResultsStore.get_key('spatial', dataset_name, gt_key, self.hota_config, seq, seq_fingerprint)
+                    for seq, seq_fingerprint in fingerprints['spatial'].items()}
+        temporal_key = ResultsStore.get_key('temporal', dataset_name, gt_key, self.hota_config,
+                                            fingerprints['temporal'], sorted(fingerprints['spatial'].items()))
+        return seq_keys, temporal_key
+
+    def evaluate(self, submission, callback=None):
+        """Evaluate a submission (path to submission.json or its parsed content) on all configured sub-datasets.
+        Returns the averaged result (with m-HIoU) and the combined result of each sub-dataset.
+        callback(dataset_name, result) is called with the combined result of each sub-dataset as soon as it is known.
+        """
+        self.id_mapping_writer = None if self.id_mapping_path is None else utils.IdMappingWriter(self.id_mapping_path)
+        self.profiler = profiling.Profiler(trace=self.config['PROFILE_TRACE']) if self.config['PROFILE'] else None
+        try:
+            if self.profiler is None:
+                return self._evaluate(submission, callback)
+            with profiling.activate(self.profiler), self.profiler.measure('evaluate'):
+                return self._evaluate(submission, callback)
+        finally:
+            if self.id_mapping_writer is not None:
+                self.id_mapping_writer.close()
+            if self.profiler is not None and self.config['PROFILE_FOLDER'] is not None:
+                self.profiler.save(self.config['PROFILE_FOLDER'])
+
+    def _evaluate(self, submission, callback):
+        total_start = time.time()
+        if isinstance(submission, str):
+            with open(submission, 'r', encoding='utf-8') as f:
+                submission = json.load(f)
+        queries_by_dataset = {dataset['name']: dataset['queries'] for dataset in submission['datasets']}
+
+        if self.id_mapping_path is not None:
+            remove_id_mapping(self.id_mapping_path)
+
+        for dataset_name in self.config['DATASETS']:
+            if dataset_name not in queries_by_dataset:
+                raise utils.TrackEvalException(f'Submission does not contain dataset {dataset_name}')
+
+        if self.config['USE_PARALLEL'] and self.config['NUM_PARALLEL_CORES'] > 1:
+            dataset_results = self.evaluate_parallel(queries_by_dataset, callback)
+        else:
+            dataset_results = {}
+            for dataset_name in self.config['DATASETS']:
+                dataset_results[dataset_name] = self.evaluate_dataset(dataset_name, queries_by_dataset[dataset_name])
+                if callback is not None:
+                    callback(dataset_name, dataset_results[dataset_name])
+
+        with _timing.section('averaging'):
+            mean_result = compute_mean_result([dataset_results[name] for name in self.config['DATASETS']])
+        if self.verbose:
+            print(f"✅ All evaluations done in {time.time() - total_start:.2f} seconds")
+        return mean_result, dataset_results
+
+    def evaluate_dataset(self, dataset_name, queries):
+        """Run spatial and temporal evaluation of one sub-dataset and return its combined result"""
+        if self.verbose:
+            print(f"========== Running dataset: {dataset_name} ==========")
+        start = time.time()
+        paths = self.get_dataset_paths(dataset_name)
+        gt_data, temporal_gt = self.load_gt(dataset_name, paths)
+
+        if self.results_store is None:
+            spatial_result, id_mapping = self.eval_spatial(paths, queries, gt_data)
+            temporal_result = self.eval_temporal(queries, temporal_gt, id_mapping)
+        else:
+            seq_keys, temporal_key = self.get_result_keys(dataset_name, paths, queries)
+            spatial_result, id_mapping = self.eval_spatial_incremental(paths, queries, seq_keys, gt_data)
+            temporal_result = self.results_store.get(temporal_key)
+            if temporal_result is None:
+                temporal_result = self.eval_temporal(queries, temporal_gt, id_mapping)
+                self.results_store.put(temporal_key, temporal_result)
+        result = {}
+        result.update(spatial_result)
+        result.update(temporal_result)
+
+        if self.verbose:
+            print(f"{dataset_name} in {time.time() - start:.2f} seconds")
+        return result
+
+    def evaluate_parallel(self, queries_by_dataset, callback=None):
+        """Evaluate all configured sub-datasets on one process pool and return the combined result of each of them.
+
+        Every (sub-dataset, sequence) pair is a separate HOTA task. Once all sequences of a sub-dataset are done, its
+        temporal evaluation is queued with the id mapping collected from these tasks.
+        """
+        dataset_names = self.config['DATASETS']
+        datasets = {}
+        temporal_inputs = {}
+        seq_keys = {dataset_name: {} for dataset_name in dataset_names}
+        temporal_keys = {}
+        for dataset_name in dataset_names:
+            paths = self.get_dataset_paths(dataset_name)
+            gt_data, temporal_gt = self.load_gt(dataset_name, paths)
+            datasets[dataset_name] = self.get_spatial_dataset(paths, queries_by_dataset[dataset_name], gt_data)
+            temporal_inputs[dataset_name] = (build_temporal_predictions(queries_by_dataset[dataset_name]), temporal_gt)
+            if self.results_store is not None:
+                seq_keys[dataset_name], temporal_keys[dataset_name] = self.get_result_keys(
+                    dataset_name, paths, queries_by_dataset[dataset_name])
+
+        # Sequences with a stored result are not evaluated again
+        seq_results = {dataset_name: {} for dataset_name in dataset_names}
+        seq_id_mappings = {dataset_name: {} for dataset_name in dataset_names}
+        seq_tasks = []
+        for dataset_name in dataset_names:
+            for seq in sorted(datasets[dataset_name].seq_list):
+                stored = self.results_store.get(seq_keys[dataset_name][seq]) if self.results_store else None
+                if stored is None:
+                    seq_tasks.append((dataset_name, seq))
+                    continue
+                seq_results[dataset_name][seq], id_mapping = stored
+                if id_mapping:
+                    seq_id_mappings[dataset_name][seq] = id_mapping
+
+        num_cores = max(1, min(self.config['NUM_PARALLEL_CORES'], len(seq_tasks)))
+        # Longest sequences first, one chunk of sequences at a time to the next idle worker
+        costs = [datasets[dataset_name].get_seq_cost(datasets[dataset_name].tracker_list[0], seq)
+                 for dataset_name, seq in seq_tasks]
+        chunks = [[seq_tasks[i] for i in chunk] for chunk in utils.get_cost_ordered_chunks(costs, num_cores)]
+        if self.verbose:
+            print(f"Evaluating {len(seq_tasks)} sequences of {', '.join(dataset_names)} on {num_cores} cores")
+
+        spatial_results = {}
+        temporal_results = {}
+        temporal_jobs = {}
+        initargs = (datasets, self.hota_config, profiling.get_worker_settings())
+        with Pool(num_cores, initializer=_init_worker, initargs=initargs) as pool:
+            def start_temporal(dataset_name):
+                """All sequences of a sub-dataset are done, its temporal evaluation can start"""
+                spatial_results[dataset_name] = combine_spatial_results(seq_results[dataset_name])
+                if self.results_store is not None:
+                    temporal_results[dataset_name] = self.results_store.get(temporal_keys[dataset_name])
+                    if temporal_results[dataset_name] is not None:
+                        return
+                submission, temporal_gt = temporal_inputs[dataset_name]
+                temporal_jobs[dataset_name] = pool.apply_async(
+                    _eval_temporal_job, (submission, temporal_gt, seq_id_mappings[dataset_name], self.verbose))
+
+            for dataset_name in dataset_names:
+                if len(seq_results[dataset_name]) == len(datasets[dataset_name].seq_list):
+                    start_temporal(dataset_name)
+            worker_times = {}
+            pool_start = time.perf_counter()
+            for worker, busy_time, chunk_results, profile_state in pool.imap_unordered(_eval_spatial_chunk, chunks):
+                if profile_state is not None:
+                    _timing.profiler.merge(profile_state)
+                worker_time = worker_times.setdefault(worker, [0.0, 0])
+                worker_time[0] += busy_time
+                worker_time[1] += len(chunk_results)
+                for dataset_name, seq, seq_res, id_mapping in chunk_results:
+                    seq_results[dataset_name][seq] = seq_res
+                    if id_mapping:
+                        seq_id_mappings[dataset_name][seq] = id_mapping
+                    if self.results_store is not None:
+                        self.results_store.put(seq_keys[dataset_name][seq], (seq_res, id_mapping))
+                    if len(seq_results[dataset_name]) == len(datasets[dataset_name].seq_list):
+                        start_temporal(dataset_name)
+            self.worker_utilisation = utils.get_worker_utilisation(worker_times, time.perf_counter() - pool_start,
+                                                                 num_cores)
+            if self.verbose and seq_tasks:
+                utils.print_worker_utilisation(self.worker_utilisation, 'the sequences')
+
+            dataset_results = {}
+            for dataset_name in dataset_names:
+                if dataset_name in temporal_jobs:
+                    temporal_results[dataset_name], profile_state = temporal_jobs[dataset_name].get()
+                    if profile_state is not None:
+                        _timing.profiler.merge(profile_state)
+                    if self.results_store is not None:
+                        self.results_store.put(temporal_keys[dataset_name], temporal_results[dataset_name])
+                dataset_results[dataset_name] = {}
+                dataset_results[dataset_name].update(spatial_results[dataset_name])
+                dataset_results[dataset_name].update(temporal_results[dataset_name])
+                if callback is not None:
+                    callback(dataset_name, dataset_results[dataset_name])
+
+        # Save the id mapping of all sub-datasets in the same order as the serial evaluation does
+        for dataset_name in dataset_names:
+            self.save_id_mappings(seq_id_mappings[dataset_name])
+        return dataset_results
+
+    def save_id_mappings(self, id_mappings):
+        """Appends the id mappings of the sequences of a sub-dataset ({seq: id_mapping}) to the id mapping file"""
+        if self.id_mapping_writer is not None:
+            self.id_mapping_writer.append([id_mappings[seq] for seq in sorted(id_mappings)])
+
+    @staticmethod
+    def get_spatial_dataset(paths, queries, gt_data=None):
+        """TrackEval dataset of the spatial predictions of one sub-dataset, converting them into per frame boxes"""
+        dataset_config = {
+            'GT_FOLDER': paths['gt_folder'],
+            'SEQMAP_FILE': paths['seqmap_file'],
+            'SUBMISSION': queries,
+            'GT_DATA': gt_data,
+            'PRINT_CONFIG': False,
+        }
+        with _timing.section('conversion'):
+            return trackeval.datasets.SVAGSubmissionDataset(dataset_config)
+
+    def eval_spatial(self, paths, queries, gt_data=None):
+        """HOTA evaluation of the spatial predictions, returns the summary fields of the combined sequences and the
+        id mapping of each sequence. The submitted tracks are read directly from the parsed submission, without writing
+        predict.txt files.
+        """
+        eval_config = {
+            'USE_PARALLEL': False,
+            'PRINT_RESULTS': self.config['PRINT_RESULTS'],
+            'PRINT_CONFIG': False,
+            'TIME_PROGRESS': False,
+            'OUTPUT_SUMMARY': False,
+            'OUTPUT_DETAILED': False,
+            'PLOT_CURVES': False,
+            'SAVE_PATH': None,  # Saved with the id mappings of the other sub-datasets
+            'KEEP_ID_MAPPINGS': True,  # Needed by the temporal evaluation
+        }
+        hota = trackeval.metrics.HOTA(self.hota_config)
+        evaluator = trackeval.Evaluator(eval_config)
+        dataset = self.get_spatial_dataset(paths, queries, gt_data)
+        output_res, _ = evaluator.evaluate([dataset], [hota])
+
+        tracker = dataset.tracker_list[0]
+        tracker_res = output_res[dataset.get_name()][tracker]
+        combined_res = tracker_res['COMBINED_SEQ']['pedestrian'][hota.get_name()]
+        id_mapping = evaluator.get_id_mappings()[dataset.get_name()][tracker]['pedestrian']
+        self.save_id_mappings(id_mapping)
+        return extract_spatial_results(hota.summary_results({'COMBINED_SEQ': combined_res})), id_mapping
+
+    def eval_spatial_incremental(self, paths, queries, seq_keys, gt_data=None):
+        """eval_spatial that reuses the stored HOTA result of the sequences whose key (see get_result_keys) is in the
+        results store, and stores the result of the other ones"""
+        dataset = self.get_spatial_dataset(paths, queries, gt_data)
+        seq_results = {}
+        id_mappings = {}
+        for seq in sorted(dataset.seq_list):
+            stored = self.results_store.get(seq_keys[seq])
+            if stored is None:
+                stored = eval_spatial_sequence(dataset, seq, self.hota_config)
+                self.results_store.put(seq_keys[seq], stored)
+            seq_results[seq], id_mapping = stored
+            if id_mapping:
+                id_mappings[seq] = id_mapping
+
+        self.save_id_mappings(id_mappings)
+        return combine_spatial_results(seq_results), id_mappings
+
+    def eval_temporal(self, queries, temporal_gt, id_mapping):
+        """Temporal grounding evaluation of the predictions matched through the HOTA id mapping"""
+        return _eval_temporal(build_temporal_predictions(queries), temporal_gt, id_mapping, self.verbose)
+
+
+def combine_spatial_results(seq_results):
+    """Combines the per sequence HOTA results of a sub-dataset into its spatial result"""
+    with _timing.section('averaging'):
+        hota = trackeval.metrics.HOTA({'PRINT_CONFIG': False})
+        combined_res = hota.combine_sequences({seq: seq_results[seq] for seq in sorted(seq_results)})
+        return extract_spatial_results(hota.summary_results({'COMBINED_SEQ': combined_res}))
+
+
+_worker_datasets = {}
+_worker_hota_config = {}
+
+
+def _init_worker(datasets, hota_config, profile_settings):
+    """Pool initializer, gives each worker the datasets once instead of with every sequence task, and a profiler of its
+    own if the parent has one"""
+    _worker_datasets.update(datasets)
+    _worker_hota_config.update(hota_config)
+    profiling.init_worker(profile_settings)
+
+
+def eval_spatial_sequence(dataset, seq, hota_config):
+    """HOTA evaluation of one sequence, returns its result and id mapping"""
+    hota = trackeval.metrics.HOTA(dict(hota_config))
+    seq_res = trackeval.eval.eval_sequence(seq, dataset, dataset.tracker_list[0], ['pedestrian'], [hota],
+                                           [hota.get_name()])
+    hota_res = seq_res['pedestrian'][hota.get_name()]
+    return hota_res, hota_res.pop('id_mapping', None)
+
+
+def _eval_spatial_chunk(tasks):
+    """HOTA evaluation of a chunk of (dataset_name, seq) tasks in a pool worker. Returns the worker process id, the time
+    spent, the result and id mapping of each sequence and the timings of the worker profiler (None without PROFILE)."""
+    start = time.perf_counter()
+    chunk_results = []
+    for dataset_name, seq in tasks:
+        hota_res, id_mapping = eval_spatial_sequence(_worker_datasets[dataset_name], seq, _worker_hota_config)
+        chunk_results.append((dataset_name, seq, hota_res, id_mapping))
+    return os.getpid(), time.perf_counter() - start, chunk_results, profiling.pop_worker_state()
+
+
+def _eval_temporal(submission, ground_truth, id_mapping, verbose):
+    with _timing.section('temporal'):
+        metrics = eval_submission(submission, ground_truth, id_mapping, verbose=verbose)
+        return extract_temporal_results(metrics)
+
+
+def _eval_temporal_job(submission, ground_truth, id_mapping, verbose):
+    """_eval_temporal in a pool worker, also returning the timings of the worker profiler"""
+    return _eval_temporal(submission, ground_truth, id_mapping, verbose), profiling.pop_worker_state()
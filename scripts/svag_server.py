@@ -0,0 +1,147 @@
+"""
+Long running SVAG evaluation server.
+
+The evaluation stack (numpy, scipy, TrackEval) is imported and the ground truth of all sub-datasets is loaded once when
+the server starts (see SVAGEvaluator.preload_gt), so evaluating a submission only costs the metric computation. The
+submissions received over HTTP are evaluated by a JobScheduler (see job_scheduler.py): up to --max_concurrent_jobs at
+once, each in its own process with its own CPUs and scratch folder, small sanity check submissions first. The progress
+of each evaluation is streamed back to its client as JSON lines (application/x-ndjson):
+
+    POST /evaluate   the body is the content of a submission.json file. Response lines:
+                         {"status": "queued", "job_id": 3, "lane": "normal", "position": 1}   (jobs to start before it)
+                         {"status": "running", "job_id": 3, "cpus": 2}
+                         {"status": "dataset", "job_id": 3, "dataset": "OVIS", "result": {...}}   (one per sub-dataset)
+                         {"status": "done", "job_id": 3, "mean_result": {...}, "seconds": 1.52}
+                     or, if the evaluation fails, a last {"status": "error", "job_id": 3, "error": "..."} line.
+                     A body that is not a submission with a "datasets" list of datasets with a "queries" list is
+                     answered with HTTP 400. When --max_pending_jobs submissions are already waiting, the answer is
+                     HTTP 503.
+    GET /health      {"status": "ok", "pending": 1, "running": 2}
+
+The server has to be restarted when the ground truth changes. svag_client.py sends a submission file and prints the
+streamed results.
+
+Example:
+    python svag_server.py --data_root ../data --port 8765 --max_concurrent_jobs 4
+    python svag_client.py --submission_file ../data/submission.json --server_url http://127.0.0.1:8765
+"""
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import freeze_support
+
+from job_scheduler import JobQueueFull, JobScheduler
+
+
+class EvaluationRequestHandler(BaseHTTPRequestHandler):
+    """HTTP endpoints of the server, see the module docstring"""
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(404, {'status': 'error', 'error': f'Unknown path {self.path}'})
+            return
+        scheduler = self.server.scheduler
+        self.send_json(200, {'status': 'ok', 'pending': scheduler.num_pending, 'running': scheduler.num_running})
+
+    def do_POST(self):
+        if self.path != '/evaluate':
+            self.send_json(404, {'status': 'error', 'error': f'Unknown path {self.path}'})
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            submission = json.loads(body)
+            if not isinstance(submission, dict) or not isinstance(submission.get('datasets'), list):
+                raise ValueError('the submission has no "datasets" list')
+            for dataset in submission['datasets']:
+                if not isinstance(dataset, dict) or not isinstance(dataset.get('queries'), list):
+                    raise ValueError('every dataset of the submission needs a "queries" list')
+        except ValueError as err:
+            self.send_json(400, {'status': 'error', 'error': f'Invalid submission: {err}'})
+            return
+
+        try:
+            job = self.server.scheduler.submit(submission)
+        except JobQueueFull as err:
+            self.send_json(503, {'status': 'error', 'error': str(err)})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        for message in iter(job.messages.get, None):
+            try:
+                self.wfile.write((json.dumps(message) + '\n').encode())
+                self.wfile.flush()
+            except OSError:  # The client went away, the evaluation still finishes
+                pass
+
+    def send_json(self, code, content):
+        body = (json.dumps(content) + '\n').encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(scheduler, host='127.0.0.1', port=8765, verbose=True):
+    """HTTP server evaluating the submissions it receives with a JobScheduler"""
+    server = ThreadingHTTPServer((host, port), EvaluationRequestHandler)
+    server.daemon_threads = True
+    server.scheduler = scheduler
+    server.verbose = verbose
+    return server
+
+
+def main(args):
+    scheduler = JobScheduler({
+        'MAX_CONCURRENT_JOBS': args.max_concurrent_jobs,
+        'CPUS_PER_JOB': args.cpus_per_job or None,
+        'MAX_PENDING_JOBS': args.max_pending_jobs,
+        'SMALL_JOB_MAX_QUERIES': args.small_job_max_queries,
+        'SCRATCH_FOLDER': args.scratch_folder or None,
+        'KEEP_SCRATCH': args.keep_scratch,
+        'EVAL_CONFIG': {
+            'DATA_ROOT': args.data_root,
+            'USE_RESULTS_STORE': bool(args.results_store),
+            'RESULTS_STORE_FOLDER': args.results_store or None,
+            'VERBOSE': args.verbose,
+        },
+    })
+    server = make_server(scheduler, args.host, args.port, verbose=args.verbose)
+    print(f"SVAG evaluation server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scheduler.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    freeze_support()
+
+    parser = argparse.ArgumentParser(description="SVAG Evaluation Server")
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--data_root', type=str, default='../data', help='Path to the data folder holding gt/ and data_path/')
+    parser.add_argument('--max_concurrent_jobs', type=int, default=1, help='Number of submissions evaluated at once')
+    parser.add_argument('--cpus_per_job', type=int, default=0,
+                        help='CPUs of each evaluation, 0 to divide the available CPUs between the concurrent jobs')
+    parser.add_argument('--max_pending_jobs', type=int, default=32,
+                        help='Number of waiting submissions above which new ones are rejected with HTTP 503')
+    parser.add_argument('--small_job_max_queries', type=int, default=20,
+                        help='Submissions with at most this many queries are evaluated before the other waiting ones')
+    parser.add_argument('--scratch_folder', type=str, default='',
+                        help='Folder of the job scratch folders (id mapping and log), empty for a temporary folder')
+    parser.add_argument('--keep_scratch', action='store_true', help='Keep the scratch folder of finished jobs')
+    parser.add_argument('--results_store', type=str, default='',
+                        help='Folder reusing the results of unchanged sequences and datasets, empty to disable it')
+    parser.add_argument('--verbose', action='store_true', help='Print the evaluation progress and the requests')
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,172 @@
+"""
+Synthetic SVAG data for benchmarks and load tests.
+
+Generates a data root laid out like ../data, without needing the real videos or annotations:
+    gt.json                         ground truth in the format of mot25-stag_valid_ground_truth.json
+    submission.json                 predictions of all ground truth queries, in the submission format
+    length_{dataset}.json           video sizes and lengths, in the format of length_mot.json
+    gt/{dataset}/spatial|temporal   converted ground truth, written by convert_valid_gt_all.py
+    data_path/seqmap_{dataset}.txt  sequences of each sub-dataset
+
+Each sub-dataset gets num_videos videos of num_frames frames, with queries_per_video queries per video. Each query has
+tracks_per_query ground truth tracks, and each track is active on a random span of the video holding windows_per_track
+temporal windows. The predicted tracks are jittered copies of the ground truth tracks (missing some boxes and with
+shifted windows) plus one false positive track per query, so that all metrics get non trivial values.
+
+Example:
+    python synthetic_svag.py --data_root ../data/synthetic --num_videos 10 --queries_per_video 20 --num_frames 600
+"""
+import argparse
+import json
+import os
+import random
+
+from convert_valid_gt_all import create_seqinfo, process_all_ground_truth
+from convert_submission import convert_query_string
+
+DATASETS = ['OVIS', 'MOT17', 'MOT20']
+
+
+def get_default_generator_config():
+    """Default synthetic data parameters"""
+    return {
+        'NUM_VIDEOS': 4,  # Videos of each sub-dataset
+        'QUERIES_PER_VIDEO': 5,
+        'TRACKS_PER_QUERY': 3,
+        'NUM_FRAMES': 300,  # Frames of each video
+        'WINDOWS_PER_TRACK': 2,  # Ground truth temporal windows of each track
+        'SEED': 0,
+    }
+
+
+def generate_query(rng, query_id, video_name, query_idx, config):
+    """Ground truth and predicted query of one video"""
+    num_frames = config['NUM_FRAMES']
+    query = {
+        'query_id': query_id,
+        'query': f'target {query_idx} moves across the scene',
+        'video_id': video_name,
+        'video_name': video_name,
+        'video_length': num_frames,
+    }
+    gt_tracks = []
+    pred_tracks = []
+    for track_idx in range(config['TRACKS_PER_QUERY']):
+        start = rng.randint(1, max(1, num_frames // 2))
+        end = rng.randint(min(num_frames, start + 1), num_frames)
+        x, y = rng.uniform(0, 1200), rng.uniform(0, 600)
+        dx, dy = rng.uniform(-2, 2), rng.uniform(-1, 1)
+        w, h = rng.uniform(30, 120), rng.uniform(60, 240)
+
+        gt_spatial = [None] * num_frames
+        pred_spatial = [None] * num_frames
+        for frame in range(start, end + 1):
+            t = frame - start
+            gt_spatial[frame - 1] = [round(x + dx * t, 2), round(y + dy * t, 2), round(w, 2), round(h, 2)]
+            if rng.random() < 0.9:
+                pred_spatial[frame - 1] = [round(x + dx * t + rng.gauss(0, 4), 2),
+                                           round(y + dy * t + rng.gauss(0, 4), 2),
+                                           round(w * rng.uniform(0.9, 1.1), 2), round(h * rng.uniform(0.9, 1.1), 2)]
+
+        # Windows splitting the active span of the track into equal parts, separated by gaps
+        num_windows = config['WINDOWS_PER_TRACK']
+        span = (end - start + 1) / num_windows
+        gt_temporal = []
+        pred_temporal = []
+        for window_idx in range(num_windows):
+            window_start = start + int(window_idx * span)
+            window_end = max(window_start, start + int((window_idx + 1) * span) - 2)
+            gt_temporal.append([window_start, window_end])
+            shift = rng.randint(-3, 3)
+            pred_start = min(max(1, window_start + shift), num_frames)
+            pred_end = min(max(pred_start, window_end + shift), num_frames)
+            pred_temporal.append([float(pred_start), float(pred_end), round(rng.random(), 4)])
+        pred_temporal.sort(key=lambda window: -window[2])
+
+        gt_tracks.append({'track_id': track_idx + 1, 'spatial': gt_spatial, 'temporal': gt_temporal})
+        pred_tracks.append({'track_id': 100 + track_idx, 'spatial': pred_spatial, 'temporal': pred_temporal})
+
+    false_positive = [None] * num_frames
+    for frame in range(1, num_frames + 1, 3):
+        false_positive[frame - 1] = [round(rng.uniform(0, 1200), 2), round(rng.uniform(0, 600), 2), 50.0, 50.0]
+    pred_tracks.append({'track_id': 999, 'spatial': false_positive, 'temporal': [[1.0, float(num_frames), 0.1]]})
+    return dict(query, tracks=gt_tracks), dict(query, tracks=pred_tracks)
+
+
+def generate(data_root, config=None):
+    """Writes a synthetic data root (see the module docstring) and returns the path of its submission.json"""
+    config = dict(get_default_generator_config(), **(config or {}))
+    rng = random.Random(config['SEED'])
+    ground_truth = {'datasets': []}
+    submission = {'datasets': []}
+    query_id = 0
+    for dataset_name in DATASETS:
+        gt_queries = []
+        pred_queries = []
+        for video_idx in range(config['NUM_VIDEOS']):
+            video_name = f'{dataset_name.lower()}-{video_idx + 1:04d}'
+            for query_idx in range(config['QUERIES_PER_VIDEO']):
+                query_id += 1
+                gt_query, pred_query = generate_query(rng, query_id, video_name, query_idx, config)
+                gt_queries.append(gt_query)
+                pred_queries.append(pred_query)
+        ground_truth['datasets'].append({'name': dataset_name, 'queries': gt_queries})
+        submission['datasets'].append({'name': dataset_name, 'queries': pred_queries})
+
+    os.makedirs(os.path.join(data_root, 'data_path'), exist_ok=True)
+    gt_file = os.path.join(data_root, 'gt.json')
+    with open(gt_file, 'w', encoding='utf-8') as f:
+        json.dump(ground_truth, f)
+    submission_file = os.path.join(data_root, 'submission.json')
+    with open(submission_file, 'w', encoding='utf-8') as f:
+        json.dump(submission, f)
+
+    process_all_ground_truth(gt_file, os.path.join(data_root, 'gt'))
+    for dataset in ground_truth['datasets']:
+        dataset_name = dataset['name']
+        lengths = [{'file_name': f'{dataset_name.lower()}-{video_idx + 1:04d}', 'width': 1920, 'height': 1080,
+                    'length': config['NUM_FRAMES'], 'frame_rate': 30} for video_idx in range(config['NUM_VIDEOS'])]
+        length_file = os.path.join(data_root, f'length_{dataset_name.lower()}.json')
+        with open(length_file, 'w', encoding='utf-8') as f:
+            json.dump(lengths, f)
+        create_seqinfo(length_file, os.path.join(data_root, 'gt', dataset_name, 'spatial'), dataset_name.lower())
+
+        seq_list = [f"{query['video_name']}+{convert_query_string(query['query'])}" for query in dataset['queries']]
+        with open(os.path.join(data_root, 'data_path', f'seqmap_{dataset_name.lower()}.txt'), 'w') as f:
+            f.write('\n'.join(seq_list) + '\n')
+    return submission_file
+
+
+def main(args):
+    generate(args.data_root, {
+        'NUM_VIDEOS': args.num_videos,
+        'QUERIES_PER_VIDEO': args.queries_per_video,
+        'TRACKS_PER_QUERY': args.tracks_per_query,
+        'NUM_FRAMES': args.num_frames,
+        'WINDOWS_PER_TRACK': args.windows_per_track,
+        'SEED': args.seed,
+    })
+
+
+def add_generator_arguments(parser):
+    """Adds the synthetic data parameters to an argument parser"""
+    default_config = get_default_generator_config()
+    parser.add_argument('--num_videos', type=int, default=default_config['NUM_VIDEOS'],
+                        help='Videos of each sub-dataset')
+    parser.add_argument('--queries_per_video', type=int, default=default_config['QUERIES_PER_VIDEO'],
+                        help='Queries of each video')
+    parser.add_argument('--tracks_per_query', type=int, default=default_config['TRACKS_PER_QUERY'],
+                        help='Ground truth tracks of each query')
+    parser.add_argument('--num_frames', type=int, default=default_config['NUM_FRAMES'], help='Frames of each video')
+    parser.add_argument('--windows_per_track', type=int, default=default_config['WINDOWS_PER_TRACK'],
+                        help='Ground truth temporal windows of each track')
+    parser.add_argument('--seed', type=int, default=default_config['SEED'], help='Random seed')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Synthetic SVAG data generator")
+    parser.add_argument('--data_root', type=str, default='../data/synthetic', help='Folder to write the data to')
+    add_generator_arguments(parser)
+
+    args = parser.parse_args()
+    main(args)
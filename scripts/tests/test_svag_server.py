@@ -0,0 +1,57 @@
+import http.client
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from svag_server import make_server
+
+
+class RejectingScheduler:
+    """Scheduler of a server whose requests are expected to be rejected before reaching it"""
+    num_pending = 0
+    num_running = 0
+
+    def submit(self, submission):
+        raise AssertionError('The submission should have been rejected')
+
+
+@pytest.fixture
+def server():
+    server = make_server(RejectingScheduler(), port=0, verbose=False)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _post(server, body):
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+    try:
+        connection.request('POST', '/evaluate', body=body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize('body', [
+    'not json',
+    '[]',
+    '{"name": "OVIS"}',
+    '{"datasets": 1}',
+    '{"datasets": [1]}',
+    '{"datasets": [{"name": "OVIS"}]}',
+    '{"datasets": [{"name": "OVIS", "queries": 3}]}',
+    '{"datasets": [{"name": "OVIS", "queries": []}, "MOT17"]}',
+])
+def test_malformed_submission(server, body):
+    status, content = _post(server, body)
+    assert status == 400
+    assert content['status'] == 'error'
+    assert content['error'].startswith('Invalid submission')
@@ -5,71 +5,46 @@ import numpy as np
 from collections import OrderedDict, defaultdict
 import json
 import time
-import copy
-import multiprocessing as mp
 
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from temporal_eval.utils import compute_average_precision_detection, \
-    compute_temporal_iou_batch_cross, compute_temporal_iou_batch_paired, load_jsonl, get_ap
+from temporal_eval.utils import compute_average_precision_detection_batch, \
+    compute_temporal_iou_batch_paired, load_jsonl, load_id_mapping, get_ap_batch
+from temporal_eval.submission import TemporalSubmission, as_temporal_submission
 
-
-def compute_average_precision_detection_wrapper(
-        input_triple, tiou_thresholds=np.linspace(0.5, 0.95, 10)):
-    qid, ground_truth, prediction = input_triple
-    scores = compute_average_precision_detection(
-        ground_truth, prediction, tiou_thresholds=tiou_thresholds)
-    return qid, scores
+# GT window length ranges (min_l, max_l] of the length bucketed moment retrieval evaluation, in seconds
+LENGTH_RANGES = OrderedDict([("short", [0, 10]), ("middle", [10, 30]), ("long", [30, 150])])
 
 
 def compute_mr_ap(submission, ground_truth, iou_thds=np.linspace(0.1, 0.95, 18),
-                  max_gt_windows=None, max_pred_windows=10, num_workers=8, chunksize=50):
+                  max_gt_windows=None, max_pred_windows=10, gt_window_mask=None):
+    """mAP at each IoU threshold and their average. With gt_window_mask (see select_gt_windows) only the masked GT
+    windows and the queries left with GT windows are evaluated."""
     iou_thds = [float(f"{e:.2f}") for e in iou_thds]
-    pred_qid2data = defaultdict(list)
-    for d in submission:
-        pred_windows = d["pred_relevant_windows"][:max_pred_windows] \
-            if max_pred_windows is not None else d["pred_relevant_windows"]
-        qid = d["qid"]
-        for w in pred_windows:
-            pred_qid2data[qid].append({
-                "video-id": d["qid"],  # in order to use the API
-                "t-start": w[0],
-                "t-end": w[1],
-                "score": w[2]
-            })
-
-    gt_qid2data = defaultdict(list)
-    for d in ground_truth:
-        gt_windows = d["relevant_windows"][:max_gt_windows] \
-            if max_gt_windows is not None else d["relevant_windows"]
-        qid = d["qid"]
-        for w in gt_windows:
-            gt_qid2data[qid].append({
-                "video-id": d["qid"],
-                "t-start": w[0],
-                "t-end": w[1]
-            })
-    qid2ap_list = {}
-    # start_time = time.time()
-    data_triples = [[qid, gt_qid2data[qid], pred_qid2data[qid]] for qid in pred_qid2data]
-    from functools import partial
-    compute_ap_from_triple = partial(
-        compute_average_precision_detection_wrapper, tiou_thresholds=iou_thds)
-
-    if num_workers > 1:
-        with mp.Pool(num_workers) as pool:
-            for qid, scores in pool.imap_unordered(compute_ap_from_triple, data_triples, chunksize=chunksize):
-                qid2ap_list[qid] = scores
-    else:
-        for data_triple in data_triples:
-            qid, scores = compute_ap_from_triple(data_triple)
-            qid2ap_list[qid] = scores
-
-    # print(f"compute_average_precision_detection {time.time() - start_time:.2f} seconds.")
-    ap_array = np.array(list(qid2ap_list.values()))  # (#queries, #thd)
+    submission = as_temporal_submission(submission)
+    pred_qid2windows = defaultdict(list)
+    for row, qid in enumerate(submission.qids.tolist()):
+        pred_windows = submission.get_windows(row)[:max_pred_windows]
+        if len(pred_windows) > 0:
+            pred_qid2windows[qid].append(pred_windows)
+
+    gt_qid2windows = defaultdict(list)
+    for qid, gt_windows in select_gt_windows(ground_truth, gt_window_mask):
+        gt_qid2windows[qid].append(gt_windows[:max_gt_windows])
+
+    # All queries are matched at once, the predictions of a query only to its own ground truth windows
+    qids = list(pred_qid2windows.keys())
+    if gt_window_mask is not None:
+        qids = [qid for qid in qids if qid in gt_qid2windows]
+    pred_windows = [np.concatenate(pred_qid2windows[qid]) for qid in qids]
+    ap_array = compute_average_precision_detection_batch(
+        [np.concatenate(gt_qid2windows[qid]) if qid in gt_qid2windows else np.zeros((0, 2)) for qid in qids],
+        [windows[:, :2] for windows in pred_windows],
+        [windows[:, 2] for windows in pred_windows],
+        tiou_thresholds=iou_thds)  # (#queries, #thd)
     ap_thds = ap_array.mean(0)  # mAP at different IoU thresholds.
     iou_thd2ap = dict(zip([str(e) for e in iou_thds], ap_thds))
     iou_thd2ap["average"] = np.mean(ap_thds)
@@ -78,116 +53,137 @@ def compute_mr_ap(submission, ground_truth, iou_thds=np.linspace(0.1, 0.95, 18),
     return iou_thd2ap
 
 
+def compute_mr_recall_at_k(submission, ground_truth, ks=(1, 5, 10), iou_thds=np.linspace(0.1, 0.95, 18),
+                           gt_window_mask=None):
+    """R@K and mIoU@K of each K in ks, computed from one (#queries, max(ks) preds, #GT windows) IoU tensor.
+    For each query, the pair of one of its top K predicted windows and one of its GT windows with the highest IoU is
+    selected (the first one in pred-major order if several, NaN IoUs count as 0), and it is positive if the IoU of the
+    pair is >= iou_thd. For K=1 the GT window is selected with np.argmax, as in the original R@1 implementation.
+    With gt_window_mask (see select_gt_windows) only the masked GT windows and the queries left with GT windows are
+    evaluated.
+    Returns a dict K -> (iou_thd2recall_at_k, miou_at_k).
+    """
+    iou_thds = [float(f"{e:.2f}") for e in iou_thds]
+    submission = as_temporal_submission(submission)
+    # The last entry of each qid is used
+    pred_qid2windows = {qid: submission.get_windows(rows[-1]) for qid, rows in submission.get_qid2rows().items()}
+    gt_qid2windows = dict(select_gt_windows(ground_truth, gt_window_mask))
+    for qid in gt_qid2windows:
+        if qid not in pred_qid2windows:
+            raise KeyError(f"No predicted windows for qid {qid}")
+    qids = list(pred_qid2windows.keys())
+    if gt_window_mask is not None:
+        qids = [qid for qid in qids if qid in gt_qid2windows]
+    max_k = max(ks)
+
+    # Pad the top K predicted windows and the GT windows of each query into (#queries, max count, 2) arrays
+    pred_windows, pred_valid = _pad_windows([pred_qid2windows[qid][:max_k] for qid in qids])
+    gt_windows, gt_valid = _pad_windows([gt_qid2windows[qid] for qid in qids])
+    for name, valid in (("predicted", pred_valid), ("GT", gt_valid)):
+        if not valid[:, 0].all():
+            raise ValueError(f"No {name} windows for qid {qids[int(np.argmin(valid[:, 0]))]}")
+
+    # Same operations as compute_temporal_iou_batch_cross, for all queries at once
+    pred_areas = pred_windows[:, :, 1] - pred_windows[:, :, 0]
+    gt_areas = gt_windows[:, :, 1] - gt_windows[:, :, 0]
+    left = np.maximum(pred_windows[:, :, None, 0], gt_windows[:, None, :, 0])
+    right = np.minimum(pred_windows[:, :, None, 1], gt_windows[:, None, :, 1])
+    inter = np.clip(right - left, 0, None)
+    union = pred_areas[:, :, None] + gt_areas[:, None, :] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ious = inter / union
+    ious[~(pred_valid[:, :, None] & gt_valid[:, None, :])] = -np.inf
+
+    query_idx = np.arange(len(qids))
+    num_gt_windows = gt_windows.shape[1]
+    results = {}
+    for k in ks:
+        if k == 1:
+            pred_idx = np.zeros(len(qids), dtype=int)
+            gt_idx = np.argmax(ious[:, 0, :], axis=1)
+        else:
+            cur_ious = ious[:, :k, :].copy()
+            cur_ious[np.isnan(cur_ious)] = 0
+            pred_idx, gt_idx = np.divmod(np.argmax(cur_ious.reshape(len(qids), -1), axis=1), num_gt_windows)
+        pred_gt_iou = compute_temporal_iou_batch_paired(
+            pred_windows[query_idx, pred_idx], gt_windows[query_idx, gt_idx])
+        iou_thd2recall = {}
+        miou = float(f"{np.mean(pred_gt_iou) * 100:.2f}")
+        for thd in iou_thds:
+            iou_thd2recall[str(thd)] = float(f"{np.mean(pred_gt_iou >= thd) * 100:.2f}")
+        results[k] = (iou_thd2recall, miou)
+    return results
+
+
+def get_gt_windows(ground_truth):
+    """The relevant windows of all ground truth entries in one (#windows, 2) array, the windows of entry i being
+    windows[offsets[i]:offsets[i + 1]]. Returns the windows and the (#entries + 1, ) offsets."""
+    windows_list = [_windows_array(d["relevant_windows"]) for d in ground_truth]
+    offsets = np.concatenate([[0], np.cumsum([len(windows) for windows in windows_list], dtype=int)]).astype(int)
+    windows = np.concatenate(windows_list) if windows_list else np.zeros((0, 2))
+    return windows, offsets
+
+
+def get_range_mask(windows, len_range):
+    """Mask of the windows with a length in len_range = [min_l, max_l], i.e., min_l < l <= max_l"""
+    min_l, max_l = len_range
+    window_lens = windows[:, 1] - windows[:, 0]
+    return (min_l < window_lens) & (window_lens <= max_l)
+
+
+def select_gt_windows(ground_truth, gt_window_mask=None):
+    """(qid, (#windows, 2) relevant windows) of each ground truth entry.
+    gt_window_mask is a mask over the windows of all entries, in the order of get_gt_windows. If given, only the masked
+    windows are kept and the entries left without windows are skipped.
+    """
+    if gt_window_mask is None:
+        return [(d["qid"], _windows_array(d["relevant_windows"])) for d in ground_truth]
+    windows, offsets = get_gt_windows(ground_truth)
+    selected = []
+    for i, d in enumerate(ground_truth):
+        entry_mask = gt_window_mask[offsets[i]:offsets[i + 1]]
+        if entry_mask.any():
+            selected.append((d["qid"], windows[offsets[i]:offsets[i + 1]][entry_mask]))
+    return selected
+
+
+def _windows_array(windows):
+    """(#windows, 2) float array of a list of [st, ed, ...] windows"""
+    return np.array([w[:2] for w in windows], dtype=float).reshape(-1, 2)
+
+
+def _pad_windows(windows_list):
+    """Pads (#windows, >= 2) [st, ed, ...] window arrays into a (#arrays, max #windows, 2) array and its validity mask"""
+    counts = np.array([len(windows) for windows in windows_list], dtype=int)
+    max_count = max(int(counts.max(initial=0)), 1)
+    padded = np.zeros((len(windows_list), max_count, 2))
+    valid = np.arange(max_count)[None, :] < counts[:, None]
+    if counts.sum() > 0:
+        padded[valid] = np.concatenate([windows[:, :2] for windows in windows_list])
+    return padded, valid
+
+
 def compute_mr_r1(submission, ground_truth, iou_thds=np.linspace(0.1, 0.95, 18)):
     """If a predicted segment has IoU >= iou_thd with one of the 1st GT segment, we define it positive"""
-    iou_thds = [float(f"{e:.2f}") for e in iou_thds]
-    pred_qid2window = {d["qid"]: d["pred_relevant_windows"][0][:2] for d in submission}  # :2 rm scores
-    # gt_qid2window = {d["qid"]: d["relevant_windows"][0] for d in ground_truth}
-    gt_qid2window = {}
-    for d in ground_truth:
-        cur_gt_windows = d["relevant_windows"]
-        cur_qid = d["qid"]
-        cur_max_iou_idx = 0
-        if len(cur_gt_windows) > 0:  # select the GT window that has the highest IoU
-            cur_ious = compute_temporal_iou_batch_cross(
-                np.array([pred_qid2window[cur_qid]]), np.array(d["relevant_windows"])
-            )[0]
-            cur_max_iou_idx = np.argmax(cur_ious)
-        gt_qid2window[cur_qid] = cur_gt_windows[cur_max_iou_idx]
-
-    qids = list(pred_qid2window.keys())
-    pred_windows = np.array([pred_qid2window[k] for k in qids]).astype(float)
-    gt_windows = np.array([gt_qid2window[k] for k in qids]).astype(float)
-    pred_gt_iou = compute_temporal_iou_batch_paired(pred_windows, gt_windows)
-    iou_thd2recall_at_one = {}
-    miou_at_one = float(f"{np.mean(pred_gt_iou) * 100:.2f}")
-    for thd in iou_thds:
-        iou_thd2recall_at_one[str(thd)] = float(f"{np.mean(pred_gt_iou >= thd) * 100:.2f}")
-    return iou_thd2recall_at_one, miou_at_one
+    return compute_mr_recall_at_k(submission, ground_truth, ks=(1,), iou_thds=iou_thds)[1]
 
 
 def compute_mr_r5(submission, ground_truth, iou_thds=np.linspace(0.1, 0.95, 18)):
     """If a predicted segment has IoU >= iou_thd with one of the 1st GT segment, we define it positive"""
-    iou_thds = [float(f"{e:.2f}") for e in iou_thds]
-    pred_qid2window = {d["qid"]: [x[:2] for x in d["pred_relevant_windows"][:5]] for d in submission}
-    gt_qid2window = {}
-    pred_optimal_qid2window = {}
-    for d in ground_truth:
-        cur_gt_windows = d["relevant_windows"]
-        cur_qid = d["qid"]
-        cur_max_iou_pred = 0
-        cur_max_iou_gt = 0
-        # cur_max_iou_idx = 0
-        if len(cur_gt_windows) > 0:
-            try:
-                cur_ious = compute_temporal_iou_batch_cross(
-                    np.array(pred_qid2window[cur_qid]), np.array(d["relevant_windows"])
-                )[0]
-                # replace all NaN to 0
-                cur_ious[np.isnan(cur_ious)] = 0
-                cur_max_iou_pred, cur_max_iou_gt = np.where(cur_ious == np.max(cur_ious))
-                cur_max_iou_pred, cur_max_iou_gt = cur_max_iou_pred[0], cur_max_iou_gt[0]
-            except:
-                print(f"error happen when `cur_ious' equal to {cur_ious}")
-        pred_optimal_qid2window[cur_qid] = pred_qid2window[cur_qid][cur_max_iou_pred]
-        gt_qid2window[cur_qid] = cur_gt_windows[cur_max_iou_gt]
-
-    qids = list(pred_qid2window.keys())
-    pred_windows = np.array([pred_optimal_qid2window[k] for k in qids]).astype(float)
-    gt_windows = np.array([gt_qid2window[k] for k in qids]).astype(float)
-    pred_gt_iou = compute_temporal_iou_batch_paired(pred_windows, gt_windows)
-    iou_thd2recall_at_five = {}
-    miou_at_five = float(f"{np.mean(pred_gt_iou) * 100:.2f}")
-    for thd in iou_thds:
-        iou_thd2recall_at_five[str(thd)] = float(f"{np.mean(pred_gt_iou >= thd) * 100:.2f}")
-    return iou_thd2recall_at_five, miou_at_five
+    return compute_mr_recall_at_k(submission, ground_truth, ks=(5,), iou_thds=iou_thds)[5]
 
 
 def compute_mr_r10(submission, ground_truth, iou_thds=np.linspace(0.1, 0.95, 18)):
     """If a predicted segment has IoU >= iou_thd with one of the 1st GT segment, we define it positive"""
-    iou_thds = [float(f"{e:.2f}") for e in iou_thds]
-    pred_qid2window = {d["qid"]: [x[:2] for x in d["pred_relevant_windows"][:10]] for d in submission}
-    gt_qid2window = {}
-    pred_optimal_qid2window = {}
-    for d in ground_truth:
-        cur_gt_windows = d["relevant_windows"]
-        cur_qid = d["qid"]
-        cur_max_iou_pred = 0
-        cur_max_iou_gt = 0
-        # cur_max_iou_idx = 0
-        if len(cur_gt_windows) > 0:
-            try:
-                cur_ious = compute_temporal_iou_batch_cross(
-                    np.array(pred_qid2window[cur_qid]), np.array(d["relevant_windows"])
-                )[0]
-                # replace all NaN to 0
-                cur_ious[np.isnan(cur_ious)] = 0
-                cur_max_iou_pred, cur_max_iou_gt = np.where(cur_ious == np.max(cur_ious))
-                cur_max_iou_pred, cur_max_iou_gt = cur_max_iou_pred[0], cur_max_iou_gt[0]
-            except:
-                print(f"error happen when `cur_ious' equal to {cur_ious}")
-        pred_optimal_qid2window[cur_qid] = pred_qid2window[cur_qid][cur_max_iou_pred]
-        gt_qid2window[cur_qid] = cur_gt_windows[cur_max_iou_gt]
-
-    qids = list(pred_qid2window.keys())
-    pred_windows = np.array([pred_optimal_qid2window[k] for k in qids]).astype(float)
-    gt_windows = np.array([gt_qid2window[k] for k in qids]).astype(float)
-    pred_gt_iou = compute_temporal_iou_batch_paired(pred_windows, gt_windows)
-    iou_thd2recall_at_ten = {}
-    miou_at_ten = float(f"{np.mean(pred_gt_iou) * 100:.2f}")
-    for thd in iou_thds:
-        iou_thd2recall_at_ten[str(thd)] = float(f"{np.mean(pred_gt_iou >= thd) * 100:.2f}")
-    return iou_thd2recall_at_ten, miou_at_ten
-
-
-def get_window_len(window):
-    return window[1] - window[0]
+    return compute_mr_recall_at_k(submission, ground_truth, ks=(10,), iou_thds=iou_thds)[10]
 
 
 def get_data_by_range(submission, ground_truth, len_range):
     """ keep queries with ground truth window length in the specified length range.
+    The kept ground truth dicts are shallow copies with only the windows in the range, the submission entries are not
+    copied. eval_moment_retrieval evaluates length ranges with masks instead (see length_ranges).
     Args:
-        submission:
+        submission: TemporalSubmission or list(dict)
         ground_truth:
         len_range: [min_l (int), max_l (int)]. the range is (min_l, max_l], i.e., min_l < l <= max_l
     """
@@ -198,123 +194,126 @@ def get_data_by_range(submission, ground_truth, len_range):
 
     # only keep ground truth with windows in the specified length range
     # if multiple GT windows exists, we only keep the ones in the range
+    windows, offsets = get_gt_windows(ground_truth)
+    in_range = get_range_mask(windows, (min_l, max_l))
     ground_truth_in_range = []
-    gt_qids_in_range = set()
-    for d in ground_truth:
-        rel_windows_in_range = [
-            w for w in d["relevant_windows"] if min_l < get_window_len(w) <= max_l]
-        print(f'rel_windows_in_range: {rel_windows_in_range}')
-        if len(rel_windows_in_range) > 0:
-            d = copy.deepcopy(d)
-            d["relevant_windows"] = rel_windows_in_range
-            ground_truth_in_range.append(d)
-            gt_qids_in_range.add(d["qid"])
+    for i, d in enumerate(ground_truth):
+        window_idxs = np.nonzero(in_range[offsets[i]:offsets[i + 1]])[0]
+        if len(window_idxs) > 0:
+            ground_truth_in_range.append(dict(d, relevant_windows=[d["relevant_windows"][j] for j in window_idxs]))
+    gt_qids_in_range = set(d["qid"] for d in ground_truth_in_range)
 
     # keep only submissions for ground_truth_in_range
-    submission_in_range = []
-    for d in submission:
-        if d["qid"] in gt_qids_in_range:
-            submission_in_range.append(copy.deepcopy(d))
-
+    if isinstance(submission, TemporalSubmission):
+        submission_in_range = submission.select(
+            [row for row, qid in enumerate(submission.qids.tolist()) if qid in gt_qids_in_range])
+    else:
+        submission_in_range = [d for d in submission if d["qid"] in gt_qids_in_range]
     return submission_in_range, ground_truth_in_range
 
 
-def eval_moment_retrieval(submission, ground_truth, verbose=True):
+def eval_moment_retrieval(submission, ground_truth, verbose=True, length_ranges=None):
+    """
+    Moment retrieval metrics of all queries ("full"), and of each length range of length_ranges (name -> [min_l, max_l],
+    e.g. LENGTH_RANGES) evaluated on the GT windows with a length in (min_l, max_l] and the queries that have such
+    windows. The GT window lengths are computed once and the ranges are selected with masks, nothing is copied.
+    """
+    submission = as_temporal_submission(submission)
     ret_metrics = {}
-    if verbose:
-        start_time = time.time()
-
-    if len(ground_truth) == 0:
-        # ret_metrics[name] = {"MR-mAP": 0., "MR-R1": 0.}
-        dummy_dict = {}
-        for k in np.linspace(0.5, 0.95, 19):
-            dummy_dict[k] = 0.
-        dummy_dict['average'] = 0.
-        ret_metrics['full'] = {"MR-mAP": dummy_dict, "MR-R1": dummy_dict}
-    else:
-        iou_thd2average_precision = compute_mr_ap(submission, ground_truth, num_workers=8, chunksize=50)
-        iou_thd2recall_at_one, miou_at_one = compute_mr_r1(submission, ground_truth)
-        iou_thd2recall_at_five, miou_at_five = compute_mr_r5(submission, ground_truth)
-        iou_thd2recall_at_ten, miou_at_ten = compute_mr_r10(submission, ground_truth)
-        ret_metrics['full'] = {"MR-mIoU": miou_at_one,
-                               "MR-mAP": iou_thd2average_precision,
-                               "MR-R1": iou_thd2recall_at_one,
-                               "MR-R5": iou_thd2recall_at_five,
-                               "MR-R10": iou_thd2recall_at_ten}
+    splits = [("full", None)]
+    if length_ranges:
+        windows = get_gt_windows(ground_truth)[0]
+        splits += [(name, get_range_mask(windows, len_range)) for name, len_range in length_ranges.items()]
+
+    for name, gt_window_mask in splits:
+        if verbose:
+            start_time = time.time()
+        if len(ground_truth) == 0 or (gt_window_mask is not None and not gt_window_mask.any()):
+            # ret_metrics[name] = {"MR-mAP": 0., "MR-R1": 0.}
+            dummy_dict = {}
+            for k in np.linspace(0.5, 0.95, 19):
+                dummy_dict[k] = 0.
+            dummy_dict['average'] = 0.
+            ret_metrics[name] = {"MR-mAP": dummy_dict, "MR-R1": dummy_dict}
+            continue
+
+        iou_thd2average_precision = compute_mr_ap(submission, ground_truth, gt_window_mask=gt_window_mask)
+        recall_at_k = compute_mr_recall_at_k(submission, ground_truth, ks=(1, 5, 10), gt_window_mask=gt_window_mask)
+        iou_thd2recall_at_one, miou_at_one = recall_at_k[1]
+        iou_thd2recall_at_five, miou_at_five = recall_at_k[5]
+        iou_thd2recall_at_ten, miou_at_ten = recall_at_k[10]
+        ret_metrics[name] = {"MR-mIoU": miou_at_one,
+                             "MR-mAP": iou_thd2average_precision,
+                             "MR-R1": iou_thd2recall_at_one,
+                             "MR-R5": iou_thd2recall_at_five,
+                             "MR-R10": iou_thd2recall_at_ten}
 
         # iou_thd2average_precision = compute_mr_ap(_submission, _ground_truth, num_workers=8, chunksize=50)
         # iou_thd2recall_at_one = compute_mr_r1(_submission, _ground_truth)
         # ret_metrics[name] = {"MR-mAP": iou_thd2average_precision, "MR-R1": iou_thd2recall_at_one}
         if verbose:
-            print(f"[eval_moment_retrieval] [full] {time.time() - start_time:.2f} seconds")
+            print(f"[eval_moment_retrieval] [{name}] {time.time() - start_time:.2f} seconds")
     return ret_metrics
 
 
-def compute_hl_hit1(qid2preds, qid2gt_scores_binary):
-    qid2max_scored_clip_idx = {k: np.argmax(v["pred_saliency_scores"]) for k, v in qid2preds.items()}
-    hit_scores = np.zeros((len(qid2preds), 3))
-    qids = list(qid2preds.keys())
-    for idx, qid in enumerate(qids):
-        pred_clip_idx = qid2max_scored_clip_idx[qid]
-        gt_scores_binary = qid2gt_scores_binary[qid]  # (#clips, 3)
-        if pred_clip_idx < len(gt_scores_binary):
-            hit_scores[idx] = gt_scores_binary[pred_clip_idx]
-    # aggregate scores from 3 separate annotations (3 workers) by taking the max.
-    # then average scores from all queries.
-    hit_at_one = float(f"{100 * np.mean(np.max(hit_scores, 1)):.2f}")
-    return hit_at_one
-
-
-def compute_hl_ap(qid2preds, qid2gt_scores_binary, num_workers=8, chunksize=50):
-    qid2pred_scores = {k: v["pred_saliency_scores"] for k, v in qid2preds.items()}
-    ap_scores = np.zeros((len(qid2preds), 3))  # (#preds, 3)
-    qids = list(qid2preds.keys())
-    input_tuples = []
-    for idx, qid in enumerate(qids):
-        for w_idx in range(3):  # annotation score idx
-            y_true = qid2gt_scores_binary[qid][:, w_idx]
-            y_predict = np.array(qid2pred_scores[qid])
-            input_tuples.append((idx, w_idx, y_true, y_predict))
-
-    if num_workers > 1:
-        with mp.Pool(num_workers) as pool:
-            for idx, w_idx, score in pool.imap_unordered(
-                    compute_ap_from_tuple, input_tuples, chunksize=chunksize):
-                ap_scores[idx, w_idx] = score
-    else:
-        for input_tuple in input_tuples:
-            idx, w_idx, score = compute_ap_from_tuple(input_tuple)
-            ap_scores[idx, w_idx] = score
+def compute_hl_scores(pred_scores, num_preds, gt_scores, num_clips, gt_saliency_score_min_list=(2, 3, 4)):
+    """Highlight detection Hit@1 and mAP of all queries, for each minimum score of a positive clip.
+
+    Args:
+        pred_scores: (#queries, #max_preds) predicted saliency scores of each query, padded after the first num_preds.
+        num_preds: (#queries, ) number of predicted scores of each query.
+        gt_scores: (#queries, #max_clips, 3) gt saliency scores of the 3 annotators, as returned by mk_gt_scores_batch.
+        num_clips: (#queries, ) number of clips of each video.
+        gt_saliency_score_min_list: minimum gt score of a positive clip, in [0, 1, 2, 3, 4].
 
+    Returns:
+        hit_at_one, mean_ap: (#min_scores, ) scores in [0, 100], not rounded.
+    """
+    num_queries, max_clips = gt_scores.shape[:2]
+    num_min_scores = len(gt_saliency_score_min_list)
+    # (#queries, #max_clips, #min_scores * 3) binary gt of each min score and annotator
+    gt_scores_binary = (gt_scores[:, :, None, :] >= np.reshape(gt_saliency_score_min_list, (1, 1, -1, 1))).astype(float)
+    gt_scores_binary = gt_scores_binary.reshape(num_queries, max_clips, num_min_scores * 3)
+    q_idx = np.arange(num_queries)
+
+    # Hit@1: gt of the max scored clip (0 outside of the video). Aggregate scores from 3 separate annotations
+    # (3 workers) by taking the max, then average scores from all queries.
+    valid = np.arange(pred_scores.shape[1])[None, :] < num_preds[:, None]
+    pred_clip_idx = np.argmax(np.where(valid, pred_scores, -np.inf), axis=1)
+    hit_scores = np.where((pred_clip_idx < num_clips)[:, None],
+                          gt_scores_binary[q_idx, np.minimum(pred_clip_idx, max_clips - 1)], 0)
+    hit_scores = hit_scores.reshape(num_queries, num_min_scores, 3).max(axis=2)
+    hit_at_one = np.array([100 * np.mean(hit_scores[:, i]) for i in range(num_min_scores)])
+
+    # AP: the predictions are truncated or zero padded to the length of the video
+    y_predict = np.zeros((num_queries, max_clips))
+    num_cols = min(max_clips, pred_scores.shape[1])
+    y_predict[:, :num_cols] = np.where(valid[:, :num_cols], pred_scores[:, :num_cols], 0)
+    ap_scores = get_ap_batch(gt_scores_binary, y_predict, num_clips).reshape(num_queries, num_min_scores, 3)
     # it's the same if we first average across different annotations, then average across queries
     # since all queries have the same #annotations.
-    mean_ap = float(f"{100 * np.mean(ap_scores):.2f}")
-    return mean_ap
+    mean_ap = np.array([100 * np.mean(np.ascontiguousarray(ap_scores[:, i])) for i in range(num_min_scores)])
+    return hit_at_one, mean_ap
 
 
-def compute_ap_from_tuple(input_tuple):
-    idx, w_idx, y_true, y_predict = input_tuple
-    if len(y_true) < len(y_predict):
-        # print(f"len(y_true) < len(y_predict) {len(y_true), len(y_predict)}")
-        y_predict = y_predict[:len(y_true)]
-    elif len(y_true) > len(y_predict):
-        # print(f"len(y_true) > len(y_predict) {len(y_true), len(y_predict)}")
-        _y_predict = np.zeros(len(y_true))
-        _y_predict[:len(y_predict)] = y_predict
-        y_predict = _y_predict
-
-    score = get_ap(y_true, y_predict)
-    return idx, w_idx, score
-
-
-def mk_gt_scores(gt_data, clip_length=2):
-    """gt_data, dict, """
-    num_clips = int(gt_data["duration"] / clip_length)
-    saliency_scores_full_video = np.zeros((num_clips, 3))
-    relevant_clip_ids = np.array(gt_data["relevant_clip_ids"])  # (#relevant_clip_ids, )
-    saliency_scores_relevant_clips = np.array(gt_data["saliency_scores"])  # (#relevant_clip_ids, 3)
-    saliency_scores_full_video[relevant_clip_ids] = saliency_scores_relevant_clips
-    return saliency_scores_full_video  # (#clips_in_video, 3)  the scores are in range [0, 4]
+def mk_gt_scores_batch(gt_data_list, clip_length=2):
+    """gt saliency scores of each clip of the videos of several gt dicts, 0 for the clips that are not relevant.
+    Returns the (#gt, #max_clips, 3) scores padded with zeros and the (#gt, ) number of clips of each video.
+    """
+    num_clips = np.array([int(d["duration"] / clip_length) for d in gt_data_list], dtype=int)
+    gt_scores = np.zeros((len(gt_data_list), max(num_clips.max(initial=0), 1), 3))
+    relevant_clip_ids = [np.asarray(d["relevant_clip_ids"], dtype=int).reshape(-1) for d in gt_data_list]
+    counts = np.array([len(ids) for ids in relevant_clip_ids], dtype=int)
+    if counts.sum() == 0:
+        return gt_scores, num_clips
+    clip_ids = np.concatenate(relevant_clip_ids)
+    row_num_clips = np.repeat(num_clips, counts)
+    if np.any((clip_ids >= row_num_clips) | (clip_ids < -row_num_clips)):
+        raise IndexError("relevant_clip_ids out of range of the video duration")
+    clip_ids = np.where(clip_ids < 0, clip_ids + row_num_clips, clip_ids)
+    saliency_scores = np.concatenate([np.reshape(d["saliency_scores"], (-1, 3)) for d in gt_data_list])
+    gt_scores[np.repeat(np.arange(len(gt_data_list)), counts), clip_ids] = saliency_scores
+    return gt_scores, num_clips  # the scores are in range [0, 4]
 
 
 def eval_highlight(submission, ground_truth, verbose=True):
@@ -324,39 +323,150 @@ def eval_highlight(submission, ground_truth, verbose=True):
         ground_truth:
         verbose:
     """
-    qid2preds = {d["qid"]: d for d in submission}
-    qid2gt_scores_full_range = {d["qid"]: mk_gt_scores(d) for d in ground_truth}  # scores in range [0, 4]
+    start_time = time.time()
+    submission = as_temporal_submission(submission)
+    # The last entry of each qid is used
+    last_rows = [rows[-1] for rows in submission.get_qid2rows().values()]
+    qid2gt = {d["qid"]: d for d in ground_truth}
+    gt_scores, num_clips = mk_gt_scores_batch(
+        [qid2gt[qid] for qid in submission.qids[last_rows].tolist()])  # scores in range [0, 4]
+    offsets = submission.saliency_offsets
+    starts = offsets[last_rows]
+    num_preds = offsets[np.asarray(last_rows, dtype=int) + 1] - starts
+    pred_scores = np.zeros((len(last_rows), max(num_preds.max(initial=0), 1)))
+    row_idx = np.repeat(np.arange(len(last_rows)), num_preds)
+    col_idx = np.arange(num_preds.sum()) - np.repeat(np.cumsum(num_preds) - num_preds, num_preds)
+    pred_scores[row_idx, col_idx] = submission.saliency_scores[starts[row_idx] + col_idx]
+    if (num_preds == 0).any():
+        raise ValueError("attempt to get argmax of an empty sequence")
+
     # gt_saliency_score_min: int, in [0, 1, 2, 3, 4]. The minimum score for a positive clip.
     gt_saliency_score_min_list = [2, 3, 4]
     saliency_score_names = ["Fair", "Good", "VeryGood"]
+    hit_at_one, mean_ap = compute_hl_scores(pred_scores, num_preds, gt_scores, num_clips,
+                                            gt_saliency_score_min_list)
     highlight_det_metrics = {}
-    for gt_saliency_score_min, score_name in zip(gt_saliency_score_min_list, saliency_score_names):
-        start_time = time.time()
-        qid2gt_scores_binary = {
-            k: (v >= gt_saliency_score_min).astype(float)
-            for k, v in qid2gt_scores_full_range.items()}  # scores in [0, 1]
-        hit_at_one = compute_hl_hit1(qid2preds, qid2gt_scores_binary)
-        mean_ap = compute_hl_ap(qid2preds, qid2gt_scores_binary)
-        highlight_det_metrics[f"HL-min-{score_name}"] = {"HL-mAP": mean_ap, "HL-Hit1": hit_at_one}
-        if verbose:
-            print(f"Calculating highlight scores with min score {gt_saliency_score_min} ({score_name})")
-            print(f"Time cost {time.time() - start_time:.2f} seconds")
+    for i, (gt_saliency_score_min, score_name) in enumerate(zip(gt_saliency_score_min_list, saliency_score_names)):
+        highlight_det_metrics[f"HL-min-{score_name}"] = {"HL-mAP": float(f"{mean_ap[i]:.2f}"),
+                                                         "HL-Hit1": float(f"{hit_at_one[i]:.2f}")}
+    if verbose:
+        print(f"Calculating highlight scores with min scores {gt_saliency_score_min_list} ({saliency_score_names})")
+        print(f"Time cost {time.time() - start_time:.2f} seconds")
     return highlight_det_metrics
 
 
+class SeqIdMappingIndex:
+    """
+    Index over the HOTA id mapping of one sequence (per frame lists, or int32 columns if HOTA was run with
+    ID_MAPPING_FORMAT columnar), built once per sequence so that the tracker id matched to a gt track_id is found
+    without rescanning the id mapping for every ground truth entry.
+    """
+
+    def __init__(self, id_info):
+        # gt track_id -> its index in unique_gt_ids (first occurrence, as list.index)
+        self.gt_id2idx = {}
+        # gt index -> [(t, position of the gt index in gt_ids_t)] in the order of the frames
+        self.gt_idx2frames = defaultdict(list)
+        # t -> rows matched at alpha = 0.5
+        self.t2alpha_rows = defaultdict(set)
+        # t -> tracker indices matched at alpha = 0.5, and the order of t among the frames with matches
+        self.t2alpha_tracker_idxs = defaultdict(list)
+        self.t2alpha_order = {}
+        self.gt_idx2match = {}
+        if id_info.get("format") == "columnar":
+            self._index_columns(id_info)
+        else:
+            self._index_lists(id_info)
+
+    def _index_lists(self, id_info):
+        """Index the per frame lists of the default HOTA id mapping"""
+        self.unique_tracker_ids = id_info["unique_tracker_ids"]
+        for idx, gt_id in enumerate(id_info["unique_gt_ids"]):
+            self.gt_id2idx.setdefault(gt_id, idx)
+        for t, gt_ids_t in id_info["gt_ids_t_list"]:
+            for k, v in enumerate(gt_ids_t):
+                self.gt_idx2frames[v].append((t, k))
+        for t, row_ids in id_info["alpha_match_rows_list"]:
+            self.t2alpha_rows[t].update(row_ids)
+        t2tracker_ids = {}
+        for t, tracker_ids in id_info["tracker_ids_t_list"]:
+            t2tracker_ids.setdefault(t, tracker_ids)
+        for t, col_indices in id_info["alpha_match_cols_list"]:
+            self.t2alpha_order.setdefault(t, len(self.t2alpha_order))
+            tracker_ids_t = t2tracker_ids.get(t)
+            if tracker_ids_t is None:
+                continue
+            self.t2alpha_tracker_idxs[t].extend(
+                tracker_ids_t[idx] for idx in col_indices if idx < len(tracker_ids_t))
+
+    def _index_columns(self, id_info):
+        """Index the int32 columns of the columnar HOTA id mapping (ID_MAPPING_FORMAT columnar)"""
+        self.unique_tracker_ids = id_info["unique_tracker_ids"].tolist()
+        for idx, gt_id in enumerate(id_info["unique_gt_ids"].tolist()):
+            self.gt_id2idx.setdefault(gt_id, idx)
+        for t, row, gt_idx in id_info["gt_rows"].tolist():
+            self.gt_idx2frames[gt_idx].append((t, row))
+        for t, row, _, _, tracker_idx in id_info["matches"].tolist():
+            self.t2alpha_rows[t].add(row)
+            self.t2alpha_order.setdefault(t, len(self.t2alpha_order))
+            self.t2alpha_tracker_idxs[t].append(tracker_idx)
+
+    def match(self, track_id):
+        """
+        Returns the tracker id matched most often (at alpha = 0.5) to the gt track_id, or None and the reason
+        why there is no match.
+        """
+        if track_id not in self.gt_id2idx:
+            # GT does not have box information for this track_id in its time range
+            return None, f"track_id {track_id} not found in gt"
+        idx_gt = self.gt_id2idx[track_id]
+        if idx_gt not in self.gt_idx2match:
+            self.gt_idx2match[idx_gt] = self._match_gt_idx(idx_gt)
+        return self.gt_idx2match[idx_gt]
+
+    def _match_gt_idx(self, idx_gt):
+        frames = self.gt_idx2frames.get(idx_gt, [])
+        keys = set(k for _, k in frames)
+        if len(keys) == 0:
+            return None, "no matching key found"
+        # A gt id may take different row positions in different frames, only the first position of the set is used
+        key = next(iter(keys))
+
+        # Frames of the gt id in which the row is matched, counting all tracker ids matched in these frames
+        matched_ts = set(t for t, _ in frames if key in self.t2alpha_rows.get(t, ()) and t in self.t2alpha_order)
+        if not matched_ts:
+            return None, "no alpha_match_cols_list entry matched"
+        tracker_id_counter = dict()
+        for t in sorted(matched_ts, key=self.t2alpha_order.get):
+            for tracker_idx in self.t2alpha_tracker_idxs.get(t, ()):
+                tracker_id_counter[tracker_idx] = tracker_id_counter.get(tracker_idx, 0) + 1
+        if not tracker_id_counter:
+            return None, "no tracker_id matched"
+
+        # Tracker index with the highest count (the first one counted on ties)
+        best_tracker_idx = max(tracker_id_counter.items(), key=lambda x: x[1])[0]
+        if best_tracker_idx >= len(self.unique_tracker_ids):
+            return None, f"tracker_idx {best_tracker_idx} out of bounds for unique_tracker_ids " \
+                         f"(len={len(self.unique_tracker_ids)})"
+        return self.unique_tracker_ids[best_tracker_idx], None
+
+
 # Use the count of each index, choose the highest as the mapping track_id index
-def filter_submission_by_count(submission, ground_truth, id_mapping_path, verbose=True):
+def filter_submission_by_count(submission, ground_truth, id_mapping, verbose=True):
     """
-    Filter submission based on ground_truth and id_mapping.jsonl.
+    Filter submission based on ground_truth and the HOTA id mapping (dict keyed by seq, or path to id_mapping.jsonl).
+    Returns the matched submission entries as a TemporalSubmission, or as a list if submission is a list of dicts.
     """
-    id_mapping = {}
-    with open(id_mapping_path, 'r') as f:
-        for line in f:
-            item = json.loads(line)
-            id_mapping[item["seq"]] = item
+    id_mapping = load_id_mapping(id_mapping)
+    seq2index = {}
 
-    submission_updated = []
+    # (seq, track_id) -> first submission entry of this track
+    columns = as_temporal_submission(submission)
+    seq_track_id2row = {}
+    for row, seq_track_id in enumerate(zip(columns.get_seqs(), columns.track_ids.tolist())):
+        seq_track_id2row.setdefault(seq_track_id, row)
 
+    matched_rows = []
     for gt in ground_truth:
         query = gt["query"].lower().replace(" ", "-")
         vid = gt["vid"].split("_")[0]
@@ -367,126 +477,31 @@ def filter_submission_by_count(submission, ground_truth, id_mapping_path, verbos
                 print(
                     f"Warning: {seq_gt} not found in id_mapping.jsonl, no matching results between gt and prediction.")
             continue
+        if seq_gt not in seq2index:
+            seq2index[seq_gt] = SeqIdMappingIndex(id_mapping[seq_gt])
 
-        id_info = id_mapping[seq_gt]
-        unique_gt_ids = id_info["unique_gt_ids"]
-        unique_tracker_ids = id_info["unique_tracker_ids"]
-        alpha_match_rows_list = id_info["alpha_match_rows_list"]
-        alpha_match_cols_list = id_info["alpha_match_cols_list"]
-        gt_ids_t_list = id_info["gt_ids_t_list"]
-        tracker_ids_t_list = id_info["tracker_ids_t_list"]
-        alpha_row_col_matches = id_info["alpha_row_col_matches"]
-
-        track_id = gt["track_id"]
-
-        # Step 1: Find the index of track_id in unique_gt_ids
-        if track_id not in unique_gt_ids:
+        tracker_id, reason = seq2index[seq_gt].match(gt["track_id"])
+        if tracker_id is None:
             if verbose:
-                # GT does not have box information for this track_id in its time range
-                print(f"Warning: track_id {track_id} not found in gt for seq {seq_gt}. unique_gt_ids: {unique_gt_ids}")
+                print(f"Warning: {reason} for seq {seq_gt}, skipping this item.")
             continue
-        idx_gt = unique_gt_ids.index(track_id)
-
-        # Step 2: Traverse gt_ids_t_list and find the item containing idx_gt
-        gt_ids_t_list_of_idx_gt = []
-        for t, gt_ids_t in gt_ids_t_list:
-            if idx_gt in gt_ids_t:
-                gt_ids_t_list_of_idx_gt.append((t, gt_ids_t))
-
-        # Step 3: Reverse key lookup
-        keys = set()
-        for t, gt_ids_t in gt_ids_t_list_of_idx_gt:
-            for k, v in enumerate(gt_ids_t):
-                if v == idx_gt:
-                    keys.add(k)
-
-        if len(keys) == 0:
-            if verbose:
-                print(
-                    f"Warning: no matching key found for seq {seq_gt}, skipping this item. gt_ids_t_list_of_idx_gt: {gt_ids_t_list_of_idx_gt}")
-            continue
-        elif len(keys) != 1:
-            if verbose:
-                print(f"Warning: keys length != 1 for seq {seq_gt}, keys = {keys}")
-        key = next(iter(keys))
-
-        # Step 4: Filter alpha_match_rows_list according to gt_ids_t_list_of_idx_gt
-        valid_ts = [t for t, _ in gt_ids_t_list_of_idx_gt]
-        alpha_match_rows_list_gt = []
-        for t, row_ids in alpha_match_rows_list:
-            if t in valid_ts and key in row_ids:
-                alpha_match_rows_list_gt.append((t, row_ids))
-
-        # Step 5: Select the item in alpha_match_cols_list that corresponds to alpha_match_rows_list_gt
-        alpha_match_cols_list_gt = []
-        for t, cols in alpha_match_cols_list:
-            if any(t == t_gt for t_gt, _ in alpha_match_rows_list_gt):
-                alpha_match_cols_list_gt.append((t, cols))
 
-        if not alpha_match_cols_list_gt:
-            if verbose:
-                print(f"Warning: No alpha_match_cols_list entry matched for seq {seq_gt}")
-            continue
-
-        # Step 6: According to alpha_match_cols_list_gt, count the number of times tracker_id appears
-        tracker_id_counter = dict()
-        for t, col_indices in alpha_match_cols_list_gt:
-            tracker_ids_t = None
-            for t_tracker, tracker_ids in tracker_ids_t_list:
-                if t_tracker == t:
-                    tracker_ids_t = tracker_ids
-                    break
-            if tracker_ids_t is None:
-                continue
-
-            for idx in col_indices:
-                if idx < len(tracker_ids_t):
-                    tracker_id = tracker_ids_t[idx]
-                    if tracker_id not in tracker_id_counter:
-                        tracker_id_counter[tracker_id] = 1
-                    else:
-                        tracker_id_counter[tracker_id] += 1
-
-        if not tracker_id_counter:
-            if verbose:
-                print(f"Warning: No tracker_id matched for seq {seq_gt}")
-            continue
-
-        # Step 7: Get value with the highest count
-        best_tracker_idx = max(tracker_id_counter.items(), key=lambda x: x[1])[0]
-
-        if best_tracker_idx >= len(unique_tracker_ids):
-            if verbose:
-                print(
-                    f"Error: tracker_idx {best_tracker_idx} out of bounds for unique_tracker_ids (len={len(unique_tracker_ids)}) for seq {seq_gt}")
-            continue
-
-        tracker_id = unique_tracker_ids[best_tracker_idx]
-
-        # Step 9: Find a matching item in submission based on seq and tracker_id
-        matched = None
-        for s in submission:
-            s_query = s["query"].lower().replace(" ", "-")
-            s_vid = s["vid"].split("_")[0]
-            s_seq = f"{s_vid}+{s_query}"
-
-            if s_seq == seq_gt and s["track_id"] == tracker_id:
-                matched = s
-                break
-
-        if matched:
-            submission_updated.append(matched)
+        matched = seq_track_id2row.get((seq_gt, tracker_id))
+        if matched is not None:
+            matched_rows.append(matched)
         else:
             if verbose:
                 print(f"Warning: No matching submission found for seq {seq_gt} with tracker_id {tracker_id}")
 
-    return submission_updated
+    if isinstance(submission, TemporalSubmission):
+        return submission.select(matched_rows)
+    return [submission[row] for row in matched_rows]
 
 
-def eval_submission(args, submission, ground_truth, verbose=True, match_number=False):
+def eval_submission(submission, ground_truth, id_mapping, verbose=True, match_number=False, length_ranges=None):
     """
     Args:
-        submission: list(dict), each dict is {
+        submission: TemporalSubmission, or list(dict), each dict is {
             qid: str,
             query: str,
             vid: str,
@@ -508,13 +523,18 @@ def eval_submission(args, submission, ground_truth, verbose=True, match_number=F
                The 3 elements in the sublist are scores from 3 different workers. The
                scores are in [0, 1, 2, 3, 4], meaning [Very Bad, ..., Good, Very Good]
         }
+        id_mapping: the HOTA id mapping of each sequence (dict keyed by seq, as returned by
+            trackeval.Evaluator.get_id_mappings with KEEP_ID_MAPPINGS), or the path to the id mapping file written by the HOTA evaluation
         verbose:
         match_number:
+        length_ranges: GT window length ranges (name -> [min_l, max_l], e.g. LENGTH_RANGES) to also report the moment
+            retrieval metrics of, as "MR-{name}-..." in the brief metrics
 
     Returns:
 
     """
-    pred_qids = set([e["qid"] for e in submission])
+    submission = as_temporal_submission(submission)
+    pred_qids = set(submission.qids.tolist())
     gt_qids = set([e["qid"] for e in ground_truth])
     if match_number:
         assert pred_qids == gt_qids, \
@@ -522,19 +542,18 @@ def eval_submission(args, submission, ground_truth, verbose=True, match_number=F
             f"use `match_number=False` if you wish to disable this check"
     else:  # only leave the items that exists in both submission and ground_truth
         shared_qids = pred_qids.intersection(gt_qids)
-        submission = [e for e in submission if e["qid"] in shared_qids]
+        submission = submission.select([row for row, qid in enumerate(submission.qids.tolist()) if qid in shared_qids])
         ground_truth = [e for e in ground_truth if e["qid"] in shared_qids]
     first_matching_ground_truth_length = len(ground_truth)
     first_matching_submission_length = len(submission)
     print(
         f"First matching is done! {first_matching_ground_truth_length} ground truth entries have been saved. {first_matching_submission_length} submissions have been saved")
-    submission = filter_submission_by_count(submission, ground_truth, id_mapping_path=args.id_mapping_path,
-                                            verbose=False)
+    submission = filter_submission_by_count(submission, ground_truth, id_mapping=id_mapping, verbose=False)
     print(
         f"ID matching is done! {len(ground_truth)} ground truth entries have been saved. {len(submission)} submissions have been saved")
 
     # match again between ground truth and submission_filtered
-    pred_qids = set([e["qid"] for e in submission])
+    pred_qids = set(submission.qids.tolist())
     gt_qids = set([e["qid"] for e in ground_truth])
     if match_number:
         assert pred_qids == gt_qids, \
@@ -542,7 +561,7 @@ def eval_submission(args, submission, ground_truth, verbose=True, match_number=F
             f"use `match_number=False` if you wish to disable this check"
     else:  # only leave the items that exists in both submission and ground_truth
         shared_qids = pred_qids.intersection(gt_qids)
-        submission = [e for e in submission if e["qid"] in shared_qids]
+        submission = submission.select([row for row, qid in enumerate(submission.qids.tolist()) if qid in shared_qids])
         ground_truth = [e for e in ground_truth if e["qid"] in shared_qids]
     second_matching_ground_truth_length = len(ground_truth)
     second_matching_submission_length = len(submission)
@@ -554,9 +573,9 @@ def eval_submission(args, submission, ground_truth, verbose=True, match_number=F
 
     eval_metrics = {}
     eval_metrics_brief = OrderedDict()
-    if "pred_relevant_windows" in submission[0]:
-        moment_ret_scores = eval_moment_retrieval(
-            submission, ground_truth, verbose=verbose)
+    if submission.has_windows:
+        moment_ret_scores = eval_moment_retrieval(submission, ground_truth, verbose=verbose,
+                                                  length_ranges=length_ranges)
         eval_metrics.update(moment_ret_scores)
         moment_ret_scores_brief = {
             "MR-full-mAP": moment_ret_scores["full"]["MR-mAP"]["average"],
@@ -578,11 +597,22 @@ def eval_submission(args, submission, ground_truth, verbose=True, match_number=F
             "MR-full-R10@0.5": moment_ret_scores["full"]["MR-R10"]["0.5"],
             "MR-full-R10@0.7": moment_ret_scores["full"]["MR-R10"]["0.7"],
         }
+        for name in (length_ranges or {}):
+            if "MR-mIoU" not in moment_ret_scores[name]:  # No GT window in this range
+                continue
+            moment_ret_scores_brief.update({
+                f"MR-{name}-mAP": moment_ret_scores[name]["MR-mAP"]["average"],
+                f"MR-{name}-mIoU": moment_ret_scores[name]["MR-mIoU"],
+                f"MR-{name}-R1@0.5": moment_ret_scores[name]["MR-R1"]["0.5"],
+                f"MR-{name}-R1@0.7": moment_ret_scores[name]["MR-R1"]["0.7"],
+                f"MR-{name}-R5@0.5": moment_ret_scores[name]["MR-R5"]["0.5"],
+                f"MR-{name}-R10@0.5": moment_ret_scores[name]["MR-R10"]["0.5"],
+            })
         eval_metrics_brief.update(
             sorted([(k, v) for k, v in moment_ret_scores_brief.items()], key=lambda x: x[0]))
 
-    if "pred_saliency_scores" in submission[0]:
-        print(f'submission[0]: {submission[0]}')
+    if submission.has_saliency_scores:
+        print(f'submission[0]: {submission.get_record(0)}')
         highlight_det_scores = eval_highlight(
             submission, ground_truth, verbose=verbose)
         eval_metrics.update(highlight_det_scores)
@@ -605,14 +635,17 @@ def eval_main():
     parser.add_argument("--gt_path", type=str, help="path to GT file")
     parser.add_argument("--save_path", type=str, help="path to save the results")
     parser.add_argument("--not_verbose", action="store_true")
+    parser.add_argument("--eval_length_ranges", action="store_true",
+                        help="also report the moment retrieval metrics of short, middle and long GT windows")
     parser.add_argument("--id_mapping_path", type=str, default='../results/id_mapping.jsonl',
                         help="path to id mapping file generated from MOT gt-prediction id matching, equals to SAVE_PATH defined in trackeval/eval")
     args = parser.parse_args()
 
     verbose = not args.not_verbose
-    submission = load_jsonl(args.submission_path)
+    submission = TemporalSubmission.from_jsonl(args.submission_path)
     gt = load_jsonl(args.gt_path)
-    results = eval_submission(args, submission, gt, verbose=verbose)
+    results = eval_submission(submission, gt, args.id_mapping_path, verbose=verbose,
+                              length_ranges=LENGTH_RANGES if args.eval_length_ranges else None)
     if verbose:
         print(json.dumps(results, indent=4))
 
@@ -0,0 +1,147 @@
+"""
+Columnar storage of temporal grounding submissions.
+
+A submission (one entry per predicted track of a query) is kept as numpy columns instead of a list of dicts: the qid,
+vid, query and track_id of each entry, and the predicted windows / saliency scores of all entries in flat arrays with
+per entry offsets. It is read from a jsonl file one line at a time, so the parsed dicts of the whole file are never
+held in memory at once.
+"""
+from array import array
+
+import numpy as np
+
+from temporal_eval.utils import iter_jsonl
+
+
+def _to_column(values):
+    """1D array of ids, int64 if all of them are ints, object otherwise (so that e.g. 1 and "1" stay different)"""
+    if all(type(v) is int for v in values):
+        return np.array(values, dtype=np.int64)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+class TemporalSubmission:
+    """
+    Columns of a temporal grounding submission:
+        qids, track_ids: (#entries, ) arrays.
+        vids, queries: (#entries, ) object arrays of str.
+        window_offsets: (#entries + 1, ) int64, entry i has windows[window_offsets[i]:window_offsets[i + 1]].
+        windows: (#windows, 3) float64, [st, ed, score] of each predicted window (score NaN if not given).
+        saliency_offsets, saliency_scores: same layout for the pred_saliency_scores of each entry.
+        has_windows, has_saliency_scores: whether the entries have pred_relevant_windows / pred_saliency_scores.
+    """
+
+    def __init__(self, qids, vids, queries, track_ids, window_offsets, windows, saliency_offsets, saliency_scores,
+                 has_windows=True, has_saliency_scores=False):
+        self.qids = qids
+        self.vids = vids
+        self.queries = queries
+        self.track_ids = track_ids
+        self.window_offsets = window_offsets
+        self.windows = windows
+        self.saliency_offsets = saliency_offsets
+        self.saliency_scores = saliency_scores
+        self.has_windows = has_windows
+        self.has_saliency_scores = has_saliency_scores
+
+    @classmethod
+    def from_records(cls, records):
+        """Builds the columns from an iterable of submission dicts (e.g. the parsed lines of a jsonl file).
+        Missing fields are None, or empty for the windows and saliency scores.
+        """
+        qids, vids, queries, track_ids = [], [], [], []
+        window_offsets, saliency_offsets = array("q", [0]), array("q", [0])
+        windows, saliency_scores = array("d"), array("d")
+        strings = {}  # The vid and query of many entries are the same, they share one str
+        has_windows = has_saliency_scores = None
+        for d in records:
+            if has_windows is None:
+                has_windows = "pred_relevant_windows" in d
+                has_saliency_scores = "pred_saliency_scores" in d
+            qids.append(d.get("qid"))
+            vids.append(strings.setdefault(d.get("vid"), d.get("vid")))
+            queries.append(strings.setdefault(d.get("query"), d.get("query")))
+            track_ids.append(d.get("track_id"))
+            for w in d.get("pred_relevant_windows", ()):
+                windows.extend((w[0], w[1], w[2] if len(w) > 2 else np.nan))
+            window_offsets.append(len(windows) // 3)
+            saliency_scores.extend(d.get("pred_saliency_scores", ()))
+            saliency_offsets.append(len(saliency_scores))
+
+        return cls(_to_column(qids), _to_column(vids), _to_column(queries), _to_column(track_ids),
+                   np.frombuffer(window_offsets, dtype=np.int64), np.frombuffer(windows).reshape(-1, 3),
+                   np.frombuffer(saliency_offsets, dtype=np.int64), np.frombuffer(saliency_scores),
+                   has_windows=bool(has_windows), has_saliency_scores=bool(has_saliency_scores))
+
+    @classmethod
+    def from_jsonl(cls, filename):
+        """Streams a submission jsonl file into columns"""
+        return cls.from_records(iter_jsonl(filename))
+
+    def __len__(self):
+        return len(self.qids)
+
+    def get_seqs(self):
+        """TrackEval sequence name '{video}+{query}' of each entry"""
+        seq_names = {}
+        seqs = []
+        for vid, query in zip(self.vids.tolist(), self.queries.tolist()):
+            if (vid, query) not in seq_names:
+                seq_names[(vid, query)] = f"{vid.split('_')[0]}+{query.lower().replace(' ', '-')}"
+            seqs.append(seq_names[(vid, query)])
+        return seqs
+
+    def get_qid2rows(self):
+        """qid -> indices of its entries, with the qids in order of first appearance"""
+        qid2rows = {}
+        for row, qid in enumerate(self.qids.tolist()):
+            qid2rows.setdefault(qid, []).append(row)
+        return qid2rows
+
+    def get_record(self, row):
+        """Submission dict of an entry"""
+        record = {"qid": self.qids[row].item() if isinstance(self.qids[row], np.generic) else self.qids[row],
+                  "query": self.queries[row], "vid": self.vids[row],
+                  "track_id": self.track_ids[row].item() if isinstance(self.track_ids[row], np.generic)
+                  else self.track_ids[row]}
+        if self.has_windows:
+            record["pred_relevant_windows"] = self.get_windows(row).tolist()
+        if self.has_saliency_scores:
+            record["pred_saliency_scores"] = self.get_saliency_scores(row).tolist()
+        return record
+
+    def get_windows(self, row):
+        """(#windows, 3) [st, ed, score] predicted windows of an entry"""
+        return self.windows[self.window_offsets[row]:self.window_offsets[row + 1]]
+
+    def get_saliency_scores(self, row):
+        """Predicted saliency score of each clip of the video of an entry"""
+        return self.saliency_scores[self.saliency_offsets[row]:self.saliency_offsets[row + 1]]
+
+    def select(self, rows):
+        """Submission made of the given entries, in the given order (entries may be repeated)"""
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        window_offsets, window_idx = self._select_ranges(self.window_offsets, rows)
+        saliency_offsets, saliency_idx = self._select_ranges(self.saliency_offsets, rows)
+        return TemporalSubmission(self.qids[rows], self.vids[rows], self.queries[rows], self.track_ids[rows],
+                                  window_offsets, self.windows[window_idx], saliency_offsets,
+                                  self.saliency_scores[saliency_idx], has_windows=self.has_windows,
+                                  has_saliency_scores=self.has_saliency_scores)
+
+    @staticmethod
+    def _select_ranges(offsets, rows):
+        """Offsets and flat element indices of the [offsets[row], offsets[row + 1]) ranges of the rows"""
+        starts = offsets[rows]
+        counts = offsets[rows + 1] - starts
+        new_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        element_idx = np.arange(new_offsets[-1]) - np.repeat(new_offsets[:-1] - starts, counts)
+        return new_offsets, element_idx
+
+
+def as_temporal_submission(submission):
+    """The submission as a TemporalSubmission, converting a list of submission dicts"""
+    if isinstance(submission, TemporalSubmission):
+        return submission
+    return TemporalSubmission.from_records(submission)
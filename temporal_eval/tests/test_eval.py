@@ -0,0 +1,199 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from temporal_eval.eval import LENGTH_RANGES, compute_mr_ap, compute_mr_r1, compute_mr_recall_at_k, \
+    eval_highlight, eval_moment_retrieval, get_data_by_range, get_range_mask
+from temporal_eval.submission import TemporalSubmission
+from temporal_eval.utils import compute_average_precision_detection, \
+    compute_average_precision_detection_batch, get_ap, get_ap_batch
+
+# The expected values below were computed with the sklearn based implementation this evaluation started from
+GROUND_TRUTH = [
+    # Two GT windows in different length ranges
+    {"qid": 1, "duration": 60, "relevant_windows": [[2, 8], [20, 44]], "relevant_clip_ids": [1, 2, 3, 10, 11, 12],
+     "saliency_scores": [[4, 2, 1], [3, 3, 0], [1, 4, 2], [2, 2, 2], [0, 1, 4], [4, 4, 3]]},
+    # No clip with a score >= 4
+    {"qid": 2, "duration": 150, "relevant_windows": [[10, 50]], "relevant_clip_ids": [5, 6, 7, 8],
+     "saliency_scores": [[3, 2, 1], [2, 3, 3], [1, 1, 2], [0, 3, 2]]},
+    # All clips negative for every min score
+    {"qid": 3, "duration": 20, "relevant_windows": [[0, 4], [4, 10], [12, 20]], "relevant_clip_ids": [0, 1, 2],
+     "saliency_scores": [[1, 0, 1], [1, 1, 1], [0, 0, 1]]},
+    # All clips positive for min score 2
+    {"qid": 4, "duration": 4, "relevant_windows": [[0, 4]], "relevant_clip_ids": [0, 1],
+     "saliency_scores": [[4, 4, 4], [2, 3, 4]]},
+    {"qid": 5, "duration": 12, "relevant_windows": [[1, 12]], "relevant_clip_ids": [3, 4, 5],
+     "saliency_scores": [[2, 2, 2], [4, 0, 3], [3, 3, 3]]},
+]
+SUBMISSION = [
+    # Two entries of qid 1, the mAP uses both and the recall and highlight metrics the last one
+    {"qid": 1, "pred_relevant_windows": [[0, 10, 0.9], [20, 40, 0.9], [2, 8, 0.5]],
+     "pred_saliency_scores": [0.] * 30},
+    # More than 10 windows, tied window and saliency scores
+    {"qid": 1, "pred_relevant_windows": [[10, 20, 0.8], [22, 44, 0.7], [2, 9, 0.7], [0, 60, 0.6], [18, 46, 0.6],
+                                         [3, 8, 0.5], [2, 8, 0.4], [30, 40, 0.4], [20, 44, 0.3], [1, 2, 0.2],
+                                         [40, 50, 0.2], [20, 44, 0.1]],
+     "pred_saliency_scores": [0.1, 0.5, 0.9, 0.5, 0.2, 0.1, 0.1, 0.3, 0.3, 0.1, 0.5, 0.9, 0.4, 0.1, 0.1,
+                              0., 0., 0., 0., 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2]},
+    {"qid": 2, "pred_relevant_windows": [[60, 100, 0.9], [12, 48, 0.8], [0, 150, 0.8]],
+     "pred_saliency_scores": [0.3] * 5 + [0.7, 0.9, 0.2, 0.7] + [0.1] * 66},
+    {"qid": 3, "pred_relevant_windows": [[4, 10, 0.5], [0, 20, 0.5], [0, 4, 0.4], [12, 18, 0.3]],
+     "pred_saliency_scores": [0.4, 0.6, 0.6, 0.1, 0., 0., 0., 0., 0., 0.]},
+    # More saliency scores than clips, the max one outside of the video
+    {"qid": 4, "pred_relevant_windows": [[2, 4, 1.], [0, 4, 0.2]], "pred_saliency_scores": [0.2, 0.1, 0.8]},
+    # Fewer saliency scores than clips, all tied
+    {"qid": 5, "pred_relevant_windows": [[0, 6, 0.3], [6, 12, 0.3], [0, 12, 0.3]],
+     "pred_saliency_scores": [0.5, 0.5, 0.5, 0.5]},
+]
+
+# (GT windows, [st, ed, score] predicted windows, AP at DETECTION_IOU_THDS) with tied scores, several predictions of
+# one GT window, no GT windows (NaN, as in the original implementation) and no predictions
+DETECTION_IOU_THDS = np.array([0.3, 0.5, 0.7, 0.9])
+DETECTION_CASES = [
+    ([[0, 10], [20, 30]], [[0, 10, 0.9], [1, 10, 0.9], [20, 28, 0.5], [40, 50, 0.5], [19, 30, 0.2]],
+     [5 / 6, 5 / 6, 5 / 6, 0.7]),
+    ([[5, 15]], [[0, 10, 0.7], [5, 14, 0.7], [5, 15, 0.1]], [1., 0.5, 0.5, 0.5]),
+    ([], [[0, 10, 0.3]], [np.nan] * 4),
+    ([[0, 4], [4, 8], [8, 12]], [[0, 12, 1.], [0, 4, 0.8], [3, 8, 0.8], [8, 12, 0.6], [8, 11, 0.6]],
+     [1., 0.75, 0.75, 1 / 3]),
+    ([[0, 10]], [], [0.] * 4),
+]
+
+# (labels, scores, get_ap) with ties of scores, a single positive, all negatives and all positives
+AP_CASES = [
+    ([1, 0, 1, 0, 0, 1], [0.9, 0.8, 0.8, 0.1, 0.5, 0.1], 13 / 18),
+    ([0, 1, 1, 0], [0.5, 0.5, 0.5, 0.5], 0.5),
+    ([0, 0, 1], [0.9, 0.8, 0.7], 1 / 3),
+    ([0, 0, 0], [0.3, 0.2, 0.1], 0.),
+    ([1, 1], [0.1, 0.2], 1.),
+]
+
+IOU_THDS = [str(float(f"{e:.2f}")) for e in np.linspace(0.1, 0.95, 18)]
+
+
+def _as_submission(records, columnar):
+    return TemporalSubmission.from_records(records) if columnar else records
+
+
+def _by_threshold(values):
+    """Metric dict of the values at each default IoU threshold"""
+    return dict(zip(IOU_THDS, values))
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_compute_mr_recall_at_k(columnar):
+    recall_at_k = compute_mr_recall_at_k(_as_submission(SUBMISSION, columnar), GROUND_TRUTH)
+    assert recall_at_k[1] == (_by_threshold([60.0] * 7 + [40.0] * 2 + [20.0] * 9), 38.33)
+    assert recall_at_k[5] == (_by_threshold([100.0] * 17 + [40.0]), 94.67)
+    assert recall_at_k[10] == (_by_threshold([100.0] * 17 + [60.0]), 96.33)
+    assert compute_mr_r1(_as_submission(SUBMISSION, columnar), GROUND_TRUTH) == recall_at_k[1]
+
+
+def test_compute_mr_recall_at_k_missing_prediction():
+    with pytest.raises(KeyError):
+        compute_mr_recall_at_k([d for d in SUBMISSION if d["qid"] != 3], GROUND_TRUTH)
+
+
+@pytest.mark.parametrize('gt_windows, pred_windows, expected', DETECTION_CASES)
+def test_compute_average_precision_detection(gt_windows, pred_windows, expected):
+    ground_truth = [{"video-id": 0, "t-start": st, "t-end": ed} for st, ed in gt_windows]
+    prediction = [{"video-id": 0, "t-start": st, "t-end": ed, "score": score} for st, ed, score in pred_windows]
+    with np.errstate(invalid="ignore"):
+        ap = compute_average_precision_detection(ground_truth, prediction, tiou_thresholds=DETECTION_IOU_THDS)
+    np.testing.assert_allclose(ap, expected)
+
+
+def test_compute_average_precision_detection_batch():
+    pred_windows = [np.array(windows, dtype=float).reshape(-1, 3) for _, windows, _ in DETECTION_CASES]
+    with np.errstate(invalid="ignore"):
+        ap = compute_average_precision_detection_batch(
+            [np.array(windows, dtype=float).reshape(-1, 2) for windows, _, _ in DETECTION_CASES],
+            [windows[:, :2] for windows in pred_windows], [windows[:, 2] for windows in pred_windows],
+            tiou_thresholds=DETECTION_IOU_THDS)
+    np.testing.assert_allclose(ap, [expected for _, _, expected in DETECTION_CASES])
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_compute_mr_ap(columnar):
+    iou_thd2ap = compute_mr_ap(_as_submission(SUBMISSION, columnar), GROUND_TRUTH)
+    assert iou_thd2ap == dict(_by_threshold([90.0] * 7 + [76.67] * 2 + [63.33] * 2 + [52.33] * 3 +
+                                            [46.78, 45.78, 42.78, 24.44]), average=68.15)
+
+
+@pytest.mark.parametrize('labels, scores, expected', AP_CASES)
+def test_get_ap(labels, scores, expected):
+    assert get_ap(labels, scores) == pytest.approx(expected)
+
+
+def test_get_ap_batch():
+    # One row per case, padded with labels and scores that must be ignored, and the reversed labels as a 2nd vector
+    num_elements = 8
+    y_true = np.ones((len(AP_CASES), num_elements, 2))
+    y_predict = np.full((len(AP_CASES), num_elements), np.nan)
+    for row, (labels, scores, _) in enumerate(AP_CASES):
+        y_true[row, :len(labels), 0] = labels
+        y_true[row, :len(labels), 1] = 1 - np.array(labels)
+        y_predict[row, :len(scores)] = scores
+    lengths = [len(labels) for labels, _, _ in AP_CASES]
+
+    ap = get_ap_batch(y_true, y_predict, lengths, max_chunk_size=2 * num_elements * 2)
+    for row, (labels, scores, expected) in enumerate(AP_CASES):
+        assert ap[row, 0] == pytest.approx(expected)
+        assert ap[row, 1] == pytest.approx(get_ap([1 - label for label in labels], scores))
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_eval_highlight(columnar):
+    metrics = eval_highlight(_as_submission(SUBMISSION, columnar), GROUND_TRUTH, verbose=False)
+    assert metrics == {"HL-min-Fair": {"HL-mAP": 60.0, "HL-Hit1": 40.0},
+                       "HL-min-Good": {"HL-mAP": 49.44, "HL-Hit1": 40.0},
+                       "HL-min-VeryGood": {"HL-mAP": 28.89, "HL-Hit1": 0.0}}
+
+
+def test_get_range_mask():
+    windows = np.array([[0, 10], [5, 5], [0, 10.5], [20, 50], [0, 150], [10, 170]], dtype=float)
+    assert get_range_mask(windows, LENGTH_RANGES["short"]).tolist() == [True, False, False, False, False, False]
+    assert get_range_mask(windows, LENGTH_RANGES["middle"]).tolist() == [False, False, True, True, False, False]
+    assert get_range_mask(windows, LENGTH_RANGES["long"]).tolist() == [False, False, False, False, True, False]
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_eval_moment_retrieval_length_ranges(columnar):
+    length_ranges = dict(LENGTH_RANGES, empty=[150, 9999])
+    metrics = eval_moment_retrieval(_as_submission(SUBMISSION, columnar), GROUND_TRUTH, verbose=False,
+                                    length_ranges=length_ranges)
+    assert list(metrics) == ["full", "short", "middle", "long", "empty"]
+    assert metrics["full"]["MR-mAP"] == compute_mr_ap(SUBMISSION, GROUND_TRUTH)
+    assert metrics["short"] == {
+        "MR-mIoU": 50.0,
+        "MR-mAP": dict(_by_threshold([100.0] * 7 + [94.44] * 2 + [77.78] * 2 + [51.11] * 3 + [41.85] * 2 +
+                                     [39.35] * 2), average=75.57),
+        "MR-R1": _by_threshold([66.67] * 9 + [33.33] * 9),
+        "MR-R5": _by_threshold([100.0] * 16 + [66.67] * 2),
+        "MR-R10": _by_threshold([100.0] * 18)}
+    assert metrics["middle"] == {
+        "MR-mIoU": 20.83,
+        "MR-mAP": dict(_by_threshold([75.0] * 7 + [50.0] * 2 + [41.67] * 6 + [29.17] * 2 + [4.17]), average=52.08),
+        "MR-R1": _by_threshold([50.0] * 7 + [0.0] * 11),
+        "MR-R5": _by_threshold([100.0] * 17 + [0.0]),
+        "MR-R10": _by_threshold([100.0] * 17 + [50.0])}
+    assert metrics["long"] == {
+        "MR-mIoU": 0.0,
+        "MR-mAP": dict(_by_threshold([50.0] * 17 + [0.0]), average=47.22),
+        "MR-R1": _by_threshold([0.0] * 18),
+        "MR-R5": _by_threshold([100.0] * 17 + [0.0]),
+        "MR-R10": _by_threshold([100.0] * 17 + [0.0])}
+    # No GT window in the range
+    assert metrics["empty"]["MR-mAP"]["average"] == 0.
+    assert metrics["empty"]["MR-R1"]["average"] == 0.
+
+
+@pytest.mark.parametrize('name', list(LENGTH_RANGES))
+def test_get_data_by_range(name):
+    metrics = eval_moment_retrieval(SUBMISSION, GROUND_TRUTH, verbose=False, length_ranges=LENGTH_RANGES)
+    submission_in_range, ground_truth_in_range = get_data_by_range(SUBMISSION, GROUND_TRUTH, LENGTH_RANGES[name])
+    assert eval_moment_retrieval(submission_in_range, ground_truth_in_range, verbose=False)["full"] == metrics[name]
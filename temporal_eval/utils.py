@@ -3,13 +3,54 @@ Copied from MMAction2
 https://github.com/open-mmlab/mmaction2/blob/master/mmaction/core/evaluation/eval_detection.py
 """
 import json
+import pickle
 import numpy as np
-from sklearn.metrics import precision_recall_curve
 
 
-def load_jsonl(filename):
+def iter_jsonl(filename):
+    """Yields the parsed lines of a jsonl file one at a time, without reading the whole file first"""
     with open(filename, "r") as f:
-        return [json.loads(l.strip("\n")) for l in f.readlines()]
+        for line in f:
+            yield json.loads(line.strip("\n"))
+
+
+def load_jsonl(filename):
+    return list(iter_jsonl(filename))
+
+
+def load_id_mapping(id_mapping):
+    """
+    Returns the HOTA id mapping of each sequence as a dict keyed by seq.
+    id_mapping is either such a dict (returned as is), or the path to the file written by the HOTA evaluation:
+    concatenated int32 columns for .npz files, pickle frames for .pkl files, json lines otherwise.
+    If a sequence appears several times, the last one is kept.
+    """
+    if isinstance(id_mapping, dict):
+        return id_mapping
+    seq2id_mapping = {}
+    if id_mapping.endswith(".npz"):
+        with np.load(id_mapping) as npz:
+            columns = {key: npz[key] for key in npz.files}
+        for i, seq in enumerate(columns["seqs"].tolist()):
+            item = {"seq": seq, "format": "columnar"}
+            for key in ("unique_gt_ids", "unique_tracker_ids", "gt_rows", "matches"):
+                offsets = columns[key + "_offsets"]
+                item[key] = columns[key][offsets[i]:offsets[i + 1]]
+            seq2id_mapping[seq] = item
+    elif id_mapping.endswith(".pkl"):
+        with open(id_mapping, "rb") as f:
+            while True:
+                try:
+                    item = pickle.load(f)
+                except EOFError:
+                    break
+                seq2id_mapping[item["seq"]] = item
+    else:
+        with open(id_mapping, "r") as f:
+            for line in f:
+                item = json.loads(line)
+                seq2id_mapping[item["seq"]] = item
+    return seq2id_mapping
 
 
 def compute_temporal_iou_batch_paired(pred_windows, gt_windows):
@@ -73,8 +114,7 @@ def interpolated_precision_recall(precision, recall):
     """
     mprecision = np.hstack([[0], precision, [0]])
     mrecall = np.hstack([[0], recall, [1]])
-    for i in range(len(mprecision) - 1)[::-1]:
-        mprecision[i] = max(mprecision[i], mprecision[i + 1])
+    mprecision = np.maximum.accumulate(mprecision[::-1])[::-1]
     idx = np.where(mrecall[1::] != mrecall[0:-1])[0] + 1
     ap = np.sum((mrecall[idx] - mrecall[idx - 1]) * mprecision[idx])
     return ap
@@ -104,65 +144,263 @@ def compute_average_precision_detection(ground_truth,
         Float: ap, Average precision score.
     """
     num_thresholds = len(tiou_thresholds)
-    num_gts = len(ground_truth)
-    num_preds = len(prediction)
-    ap = np.zeros(num_thresholds)
     if len(prediction) == 0:
-        return ap
+        return np.zeros(num_thresholds)
 
-    num_positive = float(num_gts)
-    lock_gt = np.ones((num_thresholds, num_gts)) * -1
     # Sort predictions by decreasing score order.
     prediction.sort(key=lambda x: -x['score'])
-    # Initialize true positive and false positive vectors.
-    tp = np.zeros((num_thresholds, num_preds))
-    fp = np.zeros((num_thresholds, num_preds))
-
-    # Adaptation to query faster
-    ground_truth_by_videoid = {}
-    for i, item in enumerate(ground_truth):
-        item['index'] = i
-        ground_truth_by_videoid.setdefault(item['video-id'], []).append(item)
-
-    # Assigning true positive to truly grount truth instances.
-    for idx, pred in enumerate(prediction):
-        if pred['video-id'] in ground_truth_by_videoid:
-            gts = ground_truth_by_videoid[pred['video-id']]
+    gt_indices_by_videoid = {}
+    for i, gt in enumerate(ground_truth):
+        gt_indices_by_videoid.setdefault(gt['video-id'], []).append(i)
+    gt_windows = np.array([[gt['t-start'], gt['t-end']] for gt in ground_truth]).reshape(-1, 2)
+
+    # A prediction can only be matched to the ground truth of its video
+    candidate_gts = []
+    candidate_ious = []
+    for pred in prediction:
+        gt_indices = gt_indices_by_videoid.get(pred['video-id'], [])
+        candidate_gts.append(gt_indices)
+        if gt_indices:
+            _pred = np.array([[pred['t-start'], pred['t-end']], ])
+            candidate_ious.append(compute_temporal_iou_batch_cross(_pred, gt_windows[gt_indices])[0][0])
         else:
-            fp[:, idx] = 1
-            continue
-
-        _pred = np.array([[pred['t-start'], pred['t-end']], ])
-        _gt = np.array([[gt['t-start'], gt['t-end']] for gt in gts])
-        tiou_arr = compute_temporal_iou_batch_cross(_pred, _gt)[0]
-
-        tiou_arr = tiou_arr.reshape(-1)
-        # We would like to retrieve the predictions with highest tiou score.
-        tiou_sorted_idx = tiou_arr.argsort()[::-1]
-        for t_idx, tiou_threshold in enumerate(tiou_thresholds):
-            for j_idx in tiou_sorted_idx:
-                if tiou_arr[j_idx] < tiou_threshold:
-                    fp[t_idx, idx] = 1
-                    break
-                if lock_gt[t_idx, gts[j_idx]['index']] >= 0:
-                    continue
-                # Assign as true positive after the filters above.
-                tp[t_idx, idx] = 1
-                lock_gt[t_idx, gts[j_idx]['index']] = idx
-                break
+            candidate_ious.append(np.empty(0))
+    tp = _match_predictions(
+        _pad_rows(candidate_gts, -1, dtype=int)[None], _pad_rows(candidate_ious, -np.inf)[None],
+        np.array([len(ground_truth)]), tiou_thresholds)
+    return _interpolated_average_precision(tp, np.array([len(prediction)]), np.array([len(ground_truth)]))[0]
+
+
+def compute_average_precision_detection_batch(gt_windows, pred_windows, pred_scores,
+                                              tiou_thresholds=np.linspace(0.5, 0.95, 10)):
+    """compute_average_precision_detection of several independent queries at once, the predictions of a query are
+    matched to its own ground truth windows only.
+
+    Args:
+        gt_windows (list[np.ndarray]): (M, 2) ground truth windows [st, ed] of each query.
+        pred_windows (list[np.ndarray]): (N, 2) predicted windows [st, ed] of each query.
+        pred_scores (list[np.ndarray]): (N, ) scores of the predicted windows of each query.
+        tiou_thresholds (np.ndarray): A 1darray indicates the temporal
+            intersection over union threshold.
+
+    Returns:
+        np.ndarray: (#queries, #thresholds) average precision scores.
+    """
+    num_queries = len(gt_windows)
+    num_thresholds = len(tiou_thresholds)
+    num_gts = np.array([len(windows) for windows in gt_windows], dtype=int)
+    num_preds = np.array([len(windows) for windows in pred_windows], dtype=int)
+    if num_queries == 0 or num_preds.max() == 0:
+        return np.zeros((num_queries, num_thresholds))
+
+    # Sort the predictions of each query by decreasing score order (stable, as list.sort).
+    scores = _pad_rows([-np.asarray(s, dtype=float) for s in pred_scores], np.inf)
+    order = np.argsort(scores, axis=1, kind='stable')
+    preds = _pad_rows([np.reshape(w, (-1, 2)) for w in pred_windows], 0.)
+    preds = np.take_along_axis(preds, order[:, :, None], axis=1)
+    gts = _pad_rows([np.reshape(w, (-1, 2)) for w in gt_windows], 0.)
+
+    # IoUs of all pred x gt pairs, as compute_temporal_iou_batch_cross does
+    areas1 = preds[:, :, 1] - preds[:, :, 0]
+    areas2 = gts[:, :, 1] - gts[:, :, 0]
+    left = np.maximum(preds[:, :, None, 0], gts[:, None, :, 0])
+    right = np.minimum(preds[:, :, None, 1], gts[:, None, :, 1])
+    inter = np.clip(right - left, 0, None)
+    union = areas1[:, :, None] + areas2[:, None, :] - inter
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ious = inter / union
+
+    # Every gt of a query is a candidate match of each of its predictions
+    pred_valid = np.arange(preds.shape[1])[None, :] < num_preds[:, None]
+    gt_valid = np.arange(gts.shape[1])[None, :] < num_gts[:, None]
+    valid = pred_valid[:, :, None] & gt_valid[:, None, :]
+    candidate_gts = np.where(valid, np.arange(gts.shape[1])[None, None, :], -1)
+    ious[~valid] = -np.inf
+    tp = _match_predictions(candidate_gts, ious, num_gts, tiou_thresholds)
+    return _interpolated_average_precision(tp, num_preds, num_gts)
+
+
+def _pad_rows(rows, fill_value, dtype=float):
+    """Stacks arrays of different lengths along their first axis into one array, padded with fill_value"""
+    max_len = max([len(row) for row in rows] + [1])
+    padded = np.full((len(rows), max_len) + np.shape(rows[0])[1:], fill_value, dtype=dtype)
+    for i, row in enumerate(rows):
+        padded[i, :len(row)] = row
+    return padded
+
+
+def _match_predictions(candidate_gts, candidate_ious, num_gts, tiou_thresholds):
+    """Greedy matching of sorted predictions to ground truth windows, for all queries and thresholds at once.
+
+    Args:
+        candidate_gts (np.ndarray): (Q, N, C) gt index of the candidate matches of each prediction (-1 for padding).
+        candidate_ious (np.ndarray): (Q, N, C) IoU of each candidate match (-inf for padding).
+        num_gts (np.ndarray): (Q, ) number of ground truth windows of each query.
+        tiou_thresholds (np.ndarray): (T, ) IoU thresholds.
 
-            if fp[t_idx, idx] == 0 and tp[t_idx, idx] == 0:
-                fp[t_idx, idx] = 1
+    Returns:
+        np.ndarray: (Q, T, N) bool, whether a prediction is a true positive (it is a false positive otherwise).
+    """
+    num_queries, num_preds, num_candidates = candidate_ious.shape
+    tiou_thresholds = np.asarray(tiou_thresholds, dtype=float)
+    tp = np.zeros((num_queries, len(tiou_thresholds), num_preds), dtype=bool)
+    if num_candidates == 0 or num_gts.max(initial=0) == 0:
+        return tp
+
+    # Candidates of each prediction by decreasing IoU (NaN first), sorted exactly like tiou_arr.argsort()[::-1] by
+    # sorting the candidates of all predictions with the same number of candidates together.
+    num_valid = (candidate_gts >= 0).sum(axis=2)
+    ranked_gts = np.full(candidate_gts.shape, -1)
+    ranked_ious = np.full(candidate_ious.shape, -np.inf)
+    for count in np.unique(num_valid[num_valid > 0]):
+        q_idx, p_idx = np.nonzero(num_valid == count)
+        valid = candidate_gts[q_idx, p_idx] >= 0
+        ious = candidate_ious[q_idx, p_idx][valid].reshape(-1, count)
+        gts = candidate_gts[q_idx, p_idx][valid].reshape(-1, count)
+        order = np.argsort(ious, axis=1)[:, ::-1]
+        ranked_ious[q_idx, p_idx, :count] = np.take_along_axis(ious, order, axis=1)
+        ranked_gts[q_idx, p_idx, :count] = np.take_along_axis(gts, order, axis=1)
+
+    # A prediction is matched to its first ranked candidate with tiou >= threshold (or NaN) not yet matched to a
+    # higher scored prediction. Candidates are sorted by IoU, so the ones with tiou >= threshold come first.
+    ranked_ious = ranked_ious[:, :, None, :]
+    eligible = np.isnan(ranked_ious) | (ranked_ious >= tiou_thresholds[None, None, :, None])
+    eligible &= (ranked_gts >= 0)[:, :, None, :]
+    locked = np.zeros((num_queries, len(tiou_thresholds), num_gts.max() + 1), dtype=bool)
+    q_idx = np.arange(num_queries)[:, None, None]
+    t_idx = np.arange(len(tiou_thresholds))[None, :, None]
+    for p in range(num_preds):
+        available = eligible[:, p] & ~locked[q_idx, t_idx, ranked_gts[:, p][:, None, :]]
+        matched = available.any(axis=2)
+        first = np.argmax(available, axis=2)
+        tp[:, :, p] = matched
+        q_matched, t_matched = np.nonzero(matched)
+        locked[q_matched, t_matched, ranked_gts[q_matched, p, first[q_matched, t_matched]]] = True
+    return tp
+
+
+def _interpolated_average_precision(tp, num_preds, num_gts):
+    """Interpolated AP (as interpolated_precision_recall) of the (Q, T, N) matches of sorted predictions, N may
+    include padding after the num_preds predictions of each query. Returns the (Q, T) average precision scores.
+    """
+    num_queries, num_thresholds, max_preds = tp.shape
+    valid = np.arange(max_preds)[None, :] < num_preds[:, None]
+    tp_cumsum = np.cumsum(tp & valid[:, None, :], axis=2).astype(float)
+    fp_cumsum = np.cumsum(~tp & valid[:, None, :], axis=2).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recall_cumsum = tp_cumsum / num_gts[:, None, None]
+        precision_cumsum = tp_cumsum / (tp_cumsum + fp_cumsum)
+
+    # Padding repeats the precision and recall of the last prediction, which adds no recall change to the sum
+    mprecision = np.concatenate([np.zeros((num_queries, num_thresholds, 1)), precision_cumsum,
+                                 np.zeros((num_queries, num_thresholds, 1))], axis=2)
+    mrecall = np.concatenate([np.zeros((num_queries, num_thresholds, 1)), recall_cumsum,
+                              np.ones((num_queries, num_thresholds, 1))], axis=2)
+    mprecision = np.maximum.accumulate(mprecision[:, :, ::-1], axis=2)[:, :, ::-1]
+    changed = mrecall[:, :, 1:] != mrecall[:, :, :-1]
+    terms = (mrecall[:, :, 1:] - mrecall[:, :, :-1]) * mprecision[:, :, 1:]
+
+    # Sum the terms of the rows with the same number of recall changes together, as np.sum sums each of them
+    ap = np.zeros((num_queries, num_thresholds))
+    num_terms = changed.sum(axis=2)
+    for count in np.unique(num_terms[num_terms > 0]):
+        rows = num_terms == count
+        ap[rows] = terms[rows][changed[rows]].reshape(-1, count).sum(axis=1)
+    return ap
 
-    tp_cumsum = np.cumsum(tp, axis=1).astype(float)
-    fp_cumsum = np.cumsum(fp, axis=1).astype(float)
-    recall_cumsum = tp_cumsum / num_positive
 
-    precision_cumsum = tp_cumsum / (tp_cumsum + fp_cumsum)
+def precision_recall_curve(y_true, y_predict):
+    """Precision and recall of binary labels at every distinct score threshold, as returned by
+    sklearn.metrics.precision_recall_curve: by increasing threshold, followed by precision 1 and recall 0.
+    """
+    y_true = np.asarray(y_true, dtype=float).reshape(-1)
+    y_predict = np.asarray(y_predict, dtype=float).reshape(-1)
+    if not np.isfinite(y_predict).all():
+        raise ValueError("Input y_predict contains NaN or infinity.")
+    order = np.argsort(-y_predict, kind="stable")
+    y_predict = y_predict[order]
+    threshold_idxs = np.r_[np.nonzero(np.diff(y_predict))[0], len(y_predict) - 1]
+    tps = np.cumsum(y_true[order])[threshold_idxs]
+    ps = 1. + threshold_idxs
+    precision = tps / ps
+    recall = tps / tps[-1] if tps[-1] != 0 else np.ones(len(tps))
+    return np.r_[precision[::-1], 1.], np.r_[recall[::-1], 0.]
+
+
+def get_ap_batch(y_true, y_predict, lengths, max_chunk_size=2 ** 22):
+    """get_ap (interpolated, without 11-point approximation) of many label vectors at once. The scores of each row are
+    sorted once and shared by all its label vectors.
+
+    Args:
+        y_true (np.ndarray): (Q, N, K) labels in {0,1}, K label vectors for each row.
+        y_predict (np.ndarray): (Q, N) predicted scores.
+        lengths (np.ndarray): (Q, ) only the first lengths[q] elements of row q are used, the rest is padding.
+        max_chunk_size (int): rows are processed in chunks of at most max_chunk_size labels.
+
+    Returns:
+        np.ndarray: (Q, K) average precision of each label vector.
+    """
+    y_true = np.asarray(y_true, dtype=float)
+    y_predict = np.asarray(y_predict, dtype=float)
+    lengths = np.asarray(lengths, dtype=int)
+    num_rows, num_elements, num_labels = y_true.shape
+    assert y_predict.shape == (num_rows, num_elements), "Prediction and ground truth need to be of the same length"
+    assert np.all(lengths > 0), "Ground truth cannot be empty"
+    valid = np.arange(num_elements)[None, :] < lengths[:, None]
+    assert np.isin(y_true[valid], (0, 1)).all(), "Ground truth can only contain elements {0,1}"
+
+    # Labels that are all zeros have an AP of 0, all ones of 1
+    num_pos = np.where(valid[:, :, None], y_true, 0).sum(axis=1)
+    ap = (num_pos > 0).astype(float)
+    mixed = (num_pos > 0) & (num_pos < lengths[:, None])
+    rows = np.nonzero(mixed.any(axis=1))[0]
+    if not np.isfinite(y_predict[rows][valid[rows]]).all():
+        raise ValueError("Input y_predict contains NaN or infinity.")
+
+    chunk_len = max(1, max_chunk_size // max(1, num_elements * num_labels))
+    for start in range(0, len(rows), chunk_len):
+        chunk = rows[start:start + chunk_len]
+        ap[chunk] = np.where(mixed[chunk], _interpolated_ap_rows(
+            y_true[chunk], y_predict[chunk], lengths[chunk], num_pos[chunk]), ap[chunk])
+    return ap
+
 
-    for t_idx in range(len(tiou_thresholds)):
-        ap[t_idx] = interpolated_precision_recall(precision_cumsum[t_idx, :],
-                                                  recall_cumsum[t_idx, :])
+def _interpolated_ap_rows(y_true, y_predict, lengths, num_pos):
+    """(Q, K) get_ap of the (Q, N, K) labels with both classes, see get_ap_batch"""
+    num_rows, num_elements, num_labels = y_true.shape
+    pos = np.arange(num_elements)[None, :]
+    valid = pos < lengths[:, None]
+    scores = np.where(valid, y_predict, -np.inf)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    scores = np.take_along_axis(scores, order, axis=1)
+    labels = np.where(valid[:, :, None], np.take_along_axis(y_true, order[:, :, None], axis=1), 0)
+
+    # Each tie of scores is one threshold of the curve, at its last element
+    changed = scores[:, 1:] != scores[:, :-1]
+    is_end = valid & np.concatenate([changed, np.ones((num_rows, 1), dtype=bool)], axis=1)
+    is_end[np.arange(num_rows), lengths - 1] = True
+    is_start = np.concatenate([np.ones((num_rows, 1), dtype=bool), changed], axis=1)
+    group_start = np.maximum.accumulate(np.where(is_start, pos, 0), axis=1)
+
+    tps = np.cumsum(labels, axis=1)
+    precision = tps / (1. + pos)[:, :, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recall = (tps / num_pos[:, None, :]).astype(np.float32)
+    prev_recall = np.take_along_axis(recall, np.maximum(group_start - 1, 0)[:, :, None], axis=1)
+    prev_recall[group_start == 0] = 0
+
+    # Interpolated precision: the max precision of the thresholds with a higher or equal recall. The AP is its mean
+    # over the thresholds where the recall changes, summed from the highest recall as np.mean does on get_ap's curve.
+    precision = np.where(is_end[:, :, None], precision, 0)
+    precision = np.maximum.accumulate(precision[:, ::-1], axis=1)
+    included = (is_end[:, :, None] & (recall != prev_recall))[:, ::-1]
+    precision = precision.transpose(0, 2, 1)
+    included = included.transpose(0, 2, 1)
+    ap = np.zeros((num_rows, num_labels))
+    num_terms = included.sum(axis=2)
+    for count in np.unique(num_terms[num_terms > 0]):
+        rows = num_terms == count
+        ap[rows] = precision[rows][included[rows]].reshape(-1, count).sum(axis=1) / count
     return ap
 
 
@@ -194,7 +432,7 @@ def get_ap(y_true, y_predict, interpolate=True, point_11=False):
         assert sorted(set(y_true)) == [0, 1], "Ground truth can only contain elements {0,1}"
 
     # Compute precision and recall
-    precision, recall, _ = precision_recall_curve(y_true, y_predict)
+    precision, recall = precision_recall_curve(y_true, y_predict)
     recall = recall.astype(np.float32)
 
     if interpolate:  # Compute the interpolated precision